@@ -69,6 +69,7 @@ from .operations.xform_stat import TransformStatisticOp
 
 # misc
 from .operations.binning import BinningOp
+from .operations.chunked import apply_chunked
 
 # views
 from .views.histogram import HistogramView
@@ -94,6 +95,7 @@ from .utility.util_functions import (geom_mean, geom_sd, geom_sd_range,
                                      geom_sem, geom_sem_range)
 from .utility.algorithms import (ci, percentiles)
 from .utility.scale import set_default_scale, get_default_scale
+from .utility.parallel import set_default_workers, get_default_workers
 
 from ._version import get_versions  # @UnresolvedImport
 __version__ = get_versions()['version']
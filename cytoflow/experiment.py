@@ -22,10 +22,13 @@ cytoflow.experiment
 -------------------
 '''
 
+import os, pickle, shutil, tempfile
+
+import numpy as np
 import pandas as pd
-from pandas.api.types import CategoricalDtype, is_categorical_dtype
+from pandas.api.types import is_categorical_dtype
 from traits.api import (HasStrictTraits, Dict, List, Instance, Str, Any,
-                       Property, Tuple)
+                       Property, Tuple, Int, Enum)
 
 import cytoflow.utility as util
 
@@ -68,6 +71,12 @@ class Experiment(HasStrictTraits):
         (eg. induction level, timepoint) or added by operations (eg. gate 
         membership).
         
+        If the events are in a scratch directory (see :meth:`set_scratch_dir`),
+        :attr:`data` is a copy of them that is made (in memory) the first
+        time it's needed.  Treat it as read-only: change the events with 
+        :meth:`add_condition`, :meth:`add_channel` or :meth:`__setitem__`, 
+        or by assigning a new :class:`pandas.DataFrame` to :attr:`data`.
+        
     metadata : Dict(Str : Dict(Str : Any)
         Each column in :attr:`data` has an entry in :attr:`metadata` whose key 
         is the column name and whose value is a dict of column-specific 
@@ -96,15 +105,47 @@ class Experiment(HasStrictTraits):
         combination of indices is a subset for which the statistic was computed.
         The values of the series, of course, are the values of the computed 
         parameters or statistics for each subset.
+        
+        .. note::
+        
+            :attr:`metadata` and :attr:`statistics` are 
+            :class:`~.utility.CopyOnWriteDict` s: a clone shares its 
+            parent's entries until it (or the parent) looks one up, so 
+            cloning doesn't copy metadata or statistics that are never used.
     
     channels : List(String)
         The channels that this experiment tracks (read-only).
+        
+    channel_dtype : {"float64", "float32"} (default = "float64")
+        How the channels are stored.  ``float32`` takes half the memory (and
+        half the memory bandwidth) of ``float64``, and is precise enough for
+        the data most instruments record (32-bit floats or 16-to-24-bit 
+        integers.)  Channels added with :meth:`add_channel` or 
+        :meth:`add_events`, or changed with :meth:`__setitem__`, are 
+        converted to this type, and each channel's ``dtype`` metadata records
+        the type it is stored as.  Set this before adding any channels; 
+        :class:`.ImportOp` sets it from its own :attr:`~.ImportOp.channel_dtype`.
+        
+    scratch_dir : Str
+        If set, the events are kept in memory-mapped files in this directory
+        instead of in memory (read-only; see :meth:`set_scratch_dir`.)
     
     conditions : Dict(String : pandas.Series)
         The experimental conditions and analysis groups (gate membership, etc) 
         that this experiment tracks.  The key is the name of the condition, and 
         the value is a :class:`pandas.Series` with that condition's possible 
         values. 
+        
+    partitions : List(slice)
+        If the events were added a tube at a time (with :meth:`add_events` or
+        :meth:`add_events_batch`, as :class:`.ImportOp` does), each tube's 
+        events are a contiguous run of rows in :attr:`data`, and this is the
+        list of them (read-only).  Otherwise it's empty.  Grouping by the 
+        tubes' conditions with :meth:`groupby` uses the partitions instead of
+        looking at every event, and :meth:`map_partitions` runs per-event 
+        computations on the partitions in parallel.  Adding a condition 
+        doesn't change the partitions; removing events (with :meth:`query` or
+        :meth:`subset`) shrinks them.
 
     Notes
     -----
@@ -155,42 +196,696 @@ class Experiment(HasStrictTraits):
 
     """
 
-    # this doesn't play nice with copy.copy(); clone it ourselves.
-    data = Instance(pd.DataFrame, args=())
+    # the events.  this doesn't play nice with copy.copy(); clone it ourselves.
+    data = Property(transient = True)
+    
+    # the events, if they're in memory ...
+    _data = Instance(pd.DataFrame, args=(), copy = "ref")
+    
+    # ... or in memory-mapped files, in which case _data_view is a copy of 
+    # them in memory, made the first time `data` is accessed.
+    _store = Instance(util.ColumnStore, transient = True)
+    _data_view = Instance(pd.DataFrame, transient = True)
+    scratch_dir = Property(Str)
     
-    # potentially mutable.  deep copy required
-    metadata = Dict(Str, Any, copy = "deep")
+    # potentially mutable, so clones get copy-on-write copies (in clone())
+    metadata = Instance(util.CopyOnWriteDict, args = (), copy = "ref")
+    statistics = Instance(util.CopyOnWriteDict, args = (), copy = "ref")
     
-    # statistics.  mutable, deep copy required
-    statistics = Dict(Tuple(Str, Str), pd.Series, copy = "deep")
+    history = List(Any, copy = "ref")
     
-    history = List(Any)
+    # how the channels are stored
+    channel_dtype = Enum("float64", "float32")
     
     channels = Property(List)
     conditions = Property(Dict)
+    
+    # the events from each tube are contiguous.  the boundaries between the
+    # tubes (starting with 0), and the conditions that are constant in each
+    # tube.  if the boundaries don't end at len(self), the events aren't
+    # partitioned.
+    partitions = Property(List)
+    _partition_bounds = List(Int)
+    _partition_conditions = List(Str)
+    
+    # memoized factorizations of the conditions, for groupby().  
+    # ('__codes__', condition) --> (codes, levels), and tuple of conditions 
+    # --> (keys, positions, levels).  must be invalidated when the data changes!
+    _group_cache = Dict(transient = True)
+    
+    # memoized values of each condition, for the `conditions` property
+    _values_cache = Dict(transient = True)
+    
+    # memoized `channels` property: (tuple of columns, channels)
+    _channels_cache = Any(transient = True)
+    
+    # memoized results of query(): (expr, kwargs) --> positions of the 
+    # matching events.  the most recently used are last.
+    _query_cache = Dict(transient = True)
+    
+    # the length of `data` when the caches above were filled
+    _cache_len = Int(-1, transient = True)
             
     def __getitem__(self, key):
         """Override __getitem__ so we can reference columns like ex.column"""
+        if self._store is not None and isinstance(key, str):
+            # no need to copy all the events into memory to get one column
+            return self._store[key]
         return self.data.__getitem__(key)
      
     def __setitem__(self, key, value):
         """Override __setitem__ so we can assign columns like ex.column = ..."""
+        meta = self.metadata.peek(key, {})
+        if meta.get('type') == "channel":
+            # keep the channel's precision, even if it was computed in float64
+            dtype = meta.get('dtype', "float64")
+            if getattr(value, 'dtype', None) != dtype:
+                value = value.astype(dtype)
+                
+        if self._store is not None:
+            self._store[key] = self._align(value)
+            self._invalidate_column(key)
+            return
+                
         if key in self.data:
             self.data.drop(key, axis = 'columns', inplace = True)
+        self._invalidate_column(key)
         return self.data.__setitem__(key, value)
     
     def __len__(self):
         """Return the length of the underlying pandas.DataFrame"""
-        return len(self.data)
+        if self._store is not None:
+            return len(self._store)
+        return len(self._data)
+    
+    def __contains__(self, name):
+        """Is there a column named ``name``?  Doesn't copy the events into memory."""
+        return name in self._columns()
+    
+    def __getstate__(self):
+        state = super().__getstate__()
+        if self._store is not None:
+            # pickle the events, not the names of the scratch files
+            state['_data'] = self.data
+        return state
+    
+    def _get_data(self):
+        """Getter for the `data` property"""
+        
+        if self._store is None:
+            return self._data
+        
+        if self._data_view is None:
+            self._data_view = self._store.to_frame()
+        return self._data_view
+    
+    def _set_data(self, data):
+        """Setter for the `data` property"""
+        
+        # different events; forget the tubes
+        self._partition_bounds = []
+        self._partition_conditions = []
+        
+        if self._store is None:
+            self._data = data
+        else:
+            self._store = util.ColumnStore.from_frame(data, 
+                                                      self._store.scratch_dir)
+            
+        self._reset_caches()
+        
+    def _get_scratch_dir(self):
+        """Getter for the `scratch_dir` property"""
+        return self._store.scratch_dir if self._store is not None else ""
+        
+    def set_scratch_dir(self, scratch_dir):
+        """
+        Keep the events in memory-mapped files in ``scratch_dir``, so the 
+        operating system can page them in and out of memory as they're used
+        -- useful for experiments that are larger than memory.  Or, if
+        ``scratch_dir`` is ``None``, move them back into memory.
+        
+        Each column is kept in its own file.  Changing a column with 
+        :meth:`add_condition`, :meth:`add_channel` or :meth:`__setitem__` 
+        writes a new file (instead of copying all the events), and 
+        :meth:`clone` shares the files between the copies until one of them
+        changes a column.  :meth:`__getitem__` reads a column straight from
+        its file.  :attr:`data` is still available, but it's a copy of all
+        the events in memory, made the first time it's used.
+        
+        The files are removed when no :class:`Experiment` uses them any more.
+        
+        Parameters
+        ----------
+        scratch_dir : Str
+            The directory for the files.  Created if it doesn't exist.  A 
+            fast local disk is best.
+        """
+        
+        data = self.data
+        
+        if scratch_dir:
+            self._store = util.ColumnStore.from_frame(data, scratch_dir)
+            self._data = pd.DataFrame()
+        else:
+            self._store = None
+            self._data = data.reset_index(drop = True)
+            
+        self._reset_caches()
+        
+    def save(self, path):
+        """
+        Save this :class:`Experiment` -- its events, :attr:`metadata`, 
+        :attr:`statistics` and :attr:`history` -- in the directory ``path``,
+        so it can be loaded again with :meth:`load`.  Useful for 
+        checkpointing a workflow, so it doesn't have to be re-imported and
+        re-estimated from scratch.
+        
+        Each column of events is saved in its own ``.npy`` file (categorical
+        conditions as their codes, and bitset conditions as their bits), so
+        :meth:`load` can memory-map it instead of reading it.  Everything 
+        else is pickled, so :attr:`metadata` and :attr:`statistics` must be
+        picklable.
+        
+        Parameters
+        ----------
+        path : Str
+            The directory to save the experiment in.  If it already exists,
+            it's replaced.
+        """
+        
+        path = os.path.abspath(path)
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok = True)
+        
+        # write the experiment somewhere else, then move it into place, so 
+        # the files of an experiment that was loaded from `path` aren't 
+        # overwritten while they're still mapped.
+        tmp = tempfile.mkdtemp(prefix = '.' + os.path.basename(path), 
+                               dir = parent)
+        try:
+            util.save_columns(os.path.join(tmp, _SAVE_EVENTS_DIR),
+                              [(name, self[name]) for name in self._columns()],
+                              len(self))
+            
+            state = {'version' : _SAVE_VERSION,
+                     'channel_dtype' : self.channel_dtype,
+                     'metadata' : dict(self.metadata),
+                     'statistics' : dict(self.statistics),
+                     'history' : list(self.history),
+                     'partition_bounds' : list(self._partition_bounds),
+                     'partition_conditions' : list(self._partition_conditions)}
+            
+            with open(os.path.join(tmp, _SAVE_STATE_FILE), 'wb') as f:
+                pickle.dump(state, f)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors = True)
+            raise
+        
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+        
+    @classmethod
+    def load(cls, path, scratch_dir = None):
+        """
+        Load an :class:`Experiment` that was saved with :meth:`save`.
+        
+        The events are memory-mapped from the saved files, and each column
+        is only mapped the first time it's used, so loading is fast even for
+        large experiments.  The experiment keeps its events in a scratch 
+        directory, as if :meth:`set_scratch_dir` had been called; the saved 
+        files are never changed, and new columns are written to 
+        ``scratch_dir``.  To move the events into memory instead, call 
+        ``set_scratch_dir(None)``.
+        
+        Parameters
+        ----------
+        path : Str
+            The directory the experiment was saved in.
+            
+        scratch_dir : Str (default = None)
+            The scratch directory for new columns.  If ``None``, use a 
+            directory named ``scratch`` in ``path``.
+            
+        Returns
+        -------
+        Experiment
+            The saved experiment.
+            
+        Raises
+        ------
+        :exc:`.CytoflowError`
+            If ``path`` doesn't have a saved experiment in it.
+        """
+        
+        try:
+            with open(os.path.join(path, _SAVE_STATE_FILE), 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            raise util.CytoflowError("Couldn't load an experiment from {}: {}"
+                                     .format(path, e)) from e
+            
+        if state.get('version') != _SAVE_VERSION:
+            raise util.CytoflowError("Don't know how to load an experiment "
+                                     "saved in format {}"
+                                     .format(state.get('version')))
+            
+        if scratch_dir is None:
+            scratch_dir = os.path.join(path, _SAVE_SCRATCH_DIR)
+            
+        exp = cls(channel_dtype = state['channel_dtype'])
+        exp.metadata = util.CopyOnWriteDict(state['metadata'])
+        exp.statistics = util.CopyOnWriteDict(state['statistics'])
+        exp.history = state['history']
+        
+        exp._store = util.load_columns(os.path.join(path, _SAVE_EVENTS_DIR),
+                                       scratch_dir)
+        exp._data = pd.DataFrame()
+        exp._reset_caches()
+        
+        exp._partition_bounds = state['partition_bounds']
+        exp._partition_conditions = state['partition_conditions']
+        
+        return exp
+        
+    def rename_column(self, old_name, new_name):
+        """
+        Rename column ``old_name`` to ``new_name``, keeping its place in 
+        :attr:`data`.  Doesn't change :attr:`metadata`.
+        """
+        
+        if self._store is not None:
+            self._store.rename(old_name, new_name)
+        else:
+            self._data.rename(columns = {old_name : new_name}, inplace = True)
+            
+        self._invalidate_column(old_name)
+        self._invalidate_column(new_name)
+        
+    def _get_partitions(self):
+        """Getter for the `partitions` property"""
+        
+        if not self._partitioned():
+            return []
+        
+        bounds = self._partition_bounds
+        return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+    
+    def _partitioned(self):
+        """Are the events (still) partitioned by tube?"""
+        return len(self._partition_bounds) > 1 and \
+               self._partition_bounds[-1] == len(self)
+               
+    def _partitions_so_far(self):
+        """
+        The partitions that add_events() and add_events_batch() should 
+        extend, or None if the events aren't partitioned.
+        """
+        
+        if len(self) == 0:
+            return [0], None
+        elif self._partitioned():
+            return list(self._partition_bounds), list(self._partition_conditions)
+        else:
+            return None
+        
+    def _extend_partitions(self, so_far, ends, conditions):
+        """Add the tubes ending at ``ends`` to the partitions"""
+        
+        if so_far is None:
+            return
+        
+        bounds, constant = so_far
+        self._partition_bounds = bounds + [int(x) for x in ends]
+        self._partition_conditions = [c for c in conditions 
+                                      if constant is None or c in constant]
+        
+    def _subset_partitions(self, source, positions):
+        """
+        Set the partitions from ``source``'s, keeping only the events at 
+        (sorted) ``positions``
+        """
+        
+        if not source._partitioned():
+            self._partition_bounds = []
+            self._partition_conditions = []
+            return
+        
+        bounds = np.searchsorted(positions, source._partition_bounds)
+        self._partition_bounds = bounds.tolist()
+        self._partition_conditions = list(source._partition_conditions)
+
+    def _keep_positions(self, positions):
+        """
+        Drop all the events except the ones at (sorted) ``positions``, in
+        place, the same way :meth:`query` and :meth:`subset` do: without
+        copying the rest of the events, and keeping the partitions.  In
+        memory, the events keep their labels.
+        """
+
+        positions = np.asarray(positions, dtype = np.intp)
+        if len(positions) == len(self):
+            return
+
+        self._subset_partitions(self, positions)
+
+        if self._store is not None:
+            self._store = self._store.take_rows(positions)
+        else:
+            self._data = self._data.take(positions)
+
+        self._reset_caches()
+
+    def map_partitions(self, fn, *args, columns = None, chunk_size = None,
+                       workers = None, executor = None):
+        """
+        Compute something for each event by calling ``fn`` on blocks of 
+        events in a pool of workers, and put the results back together.  The
+        blocks are the tubes' :attr:`partitions` or, if there aren't any, one
+        block per worker -- split further if they're longer than 
+        ``chunk_size``.  Useful for per-event operations (gates, 
+        compensation, etc.), which don't care how the events are split up.
+        
+        Parameters
+        ----------
+        fn : Callable
+            Called as ``fn(block, *args)``, where ``block`` is a 
+            :class:`pandas.DataFrame` with some of the events.  Must return 
+            an array (or an array of columns) with one entry (or row) per 
+            event in ``block``, or a :class:`pandas.DataFrame` indexed by 
+            (some of) the events in ``block``.  If ``executor`` is 
+            ``process``, ``fn`` and ``args`` must be picklable.
+            
+        *args
+            More arguments for ``fn``.
+            
+        columns : List(Str) (default = None)
+            The columns that ``fn`` needs.  Blocks sent to worker processes
+            only have these columns.  (Blocks in the same process have all 
+            the columns, because they don't need to be copied.)
+            
+        chunk_size : Int (default = None)
+            If set, the most events in a block.  Smaller blocks use less 
+            memory for ``fn``'s temporary arrays.  If the events are in a
+            scratch directory and the workers are threads, each block is
+            copied out of it only when it's needed.
+            
+        workers : Int (default = None)
+            How many workers to use; see :func:`.parallel_map`.  If ``None``, 
+            use the default from :func:`~cytoflow.set_default_workers`.
+            
+        executor : {"thread", "process"} (default = None)
+            The kind of workers; see :func:`.parallel_map`.  Threads are 
+            usually best: :mod:`numpy` releases the GIL, and the blocks are
+            views of :attr:`data` instead of copies.
+            
+        Returns
+        -------
+        pandas.Series or pandas.DataFrame
+            The results from all the blocks, in the same order (and with the 
+            same index) as the events.  (If ``fn`` returns a 
+            :class:`pandas.DataFrame`, the blocks' results are concatenated.)
+        """
+        
+        if executor is None:
+            executor = util.get_default_executor()
+        
+        slices = self.partitions
+        if not slices:
+            splits = np.linspace(0, len(self), util.num_workers(workers) + 1)
+            splits = splits.astype(np.intp)
+            slices = [slice(start, stop) for start, stop in zip(splits[:-1], splits[1:])]
+            
+        if chunk_size:
+            slices = [slice(start, min(start + chunk_size, s.stop))
+                      for s in slices
+                      for start in range(s.start, max(s.stop, s.start + 1), chunk_size)]
+        
+        if self._store is not None:
+            # just copy the events that the workers need out of the store.  
+            # threads can copy them when they need them.
+            blocks = [_StoreBlock(self._store, s, columns) for s in slices]
+            if executor == "process" and util.num_workers(workers) > 1:
+                blocks = [block.load() for block in blocks]
+        else:
+            blocks = [self._data.iloc[s] for s in slices]
+            if executor == "process" and columns is not None:
+                blocks = [block[columns] for block in blocks]
+        
+        results = util.parallel_map(_map_block,
+                                    [fn] * len(blocks),
+                                    blocks,
+                                    [args] * len(blocks),
+                                    workers = workers,
+                                    executor = executor)
+        
+        if isinstance(results[0], pd.DataFrame):
+            return pd.concat(results)
+        
+        results = np.concatenate([np.asarray(r) for r in results])
+        if results.ndim == 1:
+            return pd.Series(results, index = self._index())
+        else:
+            return pd.DataFrame(results, index = self._index())
+        
+    def _index(self):
+        """The index of the events, without copying them into memory"""
+        if self._store is not None:
+            return self._store.index
+        return self._data.index
+        
+    def _columns(self):
+        """The names of the columns, without copying the events into memory"""
+        if self._store is not None:
+            return self._store.columns
+        return list(self._data.columns)
+    
+    def _align(self, value):
+        """Line up a new column with the events in the store, like pandas would"""
+        if isinstance(value, pd.Series) and not value.index.equals(self._store.index):
+            value = value.reindex(self._store.index)
+        return value
 
     def _get_channels(self):
-        """Getter for the `channels` property"""
-        return sorted([x for x in self.data if self.metadata[x]['type'] == "channel"])
+        """Getter for the `channels` property.  Memoized."""
+        
+        columns = tuple(self._columns())
+        if self._channels_cache is None or self._channels_cache[0] != columns:
+            channels = sorted([x for x in columns 
+                               if self.metadata.peek(x)['type'] == "channel"])
+            self._channels_cache = (columns, channels)
+            
+        return list(self._channels_cache[1])
     
     def _get_conditions(self):
-        """Getter for the `conditions` property"""
-        return {x : pd.Series(self.data[x].unique().copy()).sort_values() for x in self.data
-                if self.metadata[x]['type'] == "condition"}
+        """Getter for the `conditions` property.  Memoized."""
+        
+        self._check_caches()
+        
+        ret = {}
+        for x in self._columns():
+            if self.metadata.peek(x)['type'] != "condition":
+                continue
+            
+            if x not in self._values_cache:
+                self._values_cache[x] = self._condition_values(x)
+                
+            ret[x] = self._values_cache[x]
+            
+        return ret
+    
+    def _condition_values(self, condition):
+        """The sorted, unique values of a condition column"""
+        
+        col = self[condition]
+        
+        if isinstance(col.dtype, util.BitDtype):
+            # count the set bits instead of unpacking them
+            n = col.values.sum()
+            return pd.Series([x for x, present in ((False, n < len(col)), 
+                                                   (True, n > 0)) if present],
+                             dtype = "bool")
+        
+        if is_categorical_dtype(col.dtype):
+            # no need to hash the values -- just see which codes are used.
+            # the categories are already in order, and missing values 
+            # (code -1) sort last, same as sort_values() 
+            codes = col.cat.codes.values
+            used = np.bincount(codes[codes >= 0], 
+                               minlength = len(col.cat.categories))
+            used = np.flatnonzero(used)
+            if (codes < 0).any():
+                used = np.append(used, -1)
+                
+            return pd.Series(pd.Categorical.from_codes(used, dtype = col.dtype))
+        
+        return pd.Series(col.unique().copy()).sort_values()
+    
+    def _check_caches(self):
+        """Forget the memoized values if the data changed length"""
+        
+        if self._cache_len != len(self):
+            # the data changed length without us noticing
+            self._group_cache = {}
+            self._values_cache = {}
+            self._query_cache = {}
+            self._cache_len = len(self)
+        
+    def groupby(self, by):
+        """
+        Group the events by the values of some conditions, like
+        :meth:`pandas.DataFrame.groupby` -- except that the grouping is 
+        computed once and remembered, so grouping by the same conditions again
+        (in the same :class:`Experiment`, or a clone of it) is nearly free.
+        The memo is forgotten when :attr:`data` is replaced, or when one of 
+        the conditions is changed with :meth:`add_condition` or 
+        :meth:`__setitem__`.  (If you change :attr:`data` in place, you're on
+        your own!)
+        
+        Parameters
+        ----------
+        by : Str or List(Str)
+            The conditions to group by.  If empty, all the events are in
+            one group, whose key is ``True``.
+            
+        Returns
+        -------
+        GroupIndex
+            The events in each group.  Only groups that have events are
+            included.
+        """
+        
+        if isinstance(by, str):
+            by = [by]
+        by = tuple(by)
+        
+        self._check_caches()
+        
+        if by not in self._group_cache:
+            self._group_cache[by] = self._make_groups(by)
+            
+        keys, positions, levels = self._group_cache[by]
+        
+        # if the events are in a scratch directory, the groups are read 
+        # straight out of it.
+        events = self._store if self._store is not None else self.data
+        return GroupIndex(events, by, keys, positions, levels)
+    
+    def _factorize(self, condition, rows = None):
+        """
+        Get the integer codes and the sorted, observed values of a condition 
+        column -- or, if ``rows`` is set, of just the events at those 
+        positions.  Memoized (if ``rows`` isn't set.)
+        """
+        
+        key = ('__codes__', condition)
+        if rows is not None or key not in self._group_cache:
+            if condition not in self._columns():
+                raise util.CytoflowError("{} is not a column in the data"
+                                         .format(condition))
+            col = self[condition]
+            if rows is not None:
+                col = col.take(rows)
+            if isinstance(col.dtype, util.BitDtype):
+                # factorize the bools, so the levels are bools too
+                col = col.values.to_numpy()
+            codes, levels = pd.factorize(col, sort = True)
+            ret = (codes, pd.Index(levels, name = condition))
+            
+            if rows is not None:
+                return ret
+            
+            self._group_cache[key] = ret
+            
+        return self._group_cache[key]
+    
+    def _make_groups(self, by):
+        """
+        Compute the group keys, the row positions in each group, and the 
+        levels of each condition
+        """
+        
+        if len(by) == 0:
+            return [True], {True : np.arange(len(self))}, {}
+        
+        if self._partitioned() and all(b in self._partition_conditions for b in by):
+            # the conditions are constant in each tube, so group the tubes
+            # instead of the events, by looking at the first event in each.
+            bounds = np.array(self._partition_bounds)
+            starts, stops = bounds[:-1], bounds[1:]
+            nonempty = stops > starts
+            starts, stops = starts[nonempty], stops[nonempty]
+            factors = [self._factorize(b, rows = starts) for b in by]
+        else:
+            starts = stops = None
+            factors = [self._factorize(b) for b in by]
+            
+        codes = [f[0] for f in factors]
+        levels = [f[1] for f in factors]
+        
+        # events with a missing value aren't in any group
+        if len(codes) == 1:
+            group_codes = codes[0]
+            valid = group_codes >= 0
+        else:
+            group_codes = np.stack(codes, axis = 1)
+            valid = (group_codes >= 0).all(axis = 1)
+            
+        # positions of events (or of tubes)
+        positions = np.arange(len(group_codes))[valid]
+        group_codes = group_codes[valid]
+        
+        if len(codes) == 1:
+            uniques, inverse = np.unique(group_codes, return_inverse = True)
+            keys = [levels[0][u] for u in uniques]
+        else:
+            uniques, inverse = np.unique(group_codes, axis = 0, return_inverse = True)
+            keys = [tuple([levels[i][u[i]] for i in range(len(by))]) for u in uniques]
+            
+        # sort the events by group (stably, so each group's events stay
+        # in order), then split.
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind = 'stable')
+        bounds = np.cumsum(np.bincount(inverse, minlength = len(keys)))[:-1]
+        positions = np.split(positions[order], bounds)
+        
+        if starts is not None:
+            # from tubes to events
+            positions = [np.concatenate([np.arange(starts[t], stops[t]) for t in tubes])
+                         for tubes in positions]
+        
+        return keys, dict(zip(keys, positions)), dict(zip(by, levels))
+    
+    def _invalidate_column(self, name):
+        """Forget the memoized values and groupings that involve ``name``"""
+        
+        self._values_cache.pop(name, None)
+        self._channels_cache = None
+        self._data_view = None
+        
+        # the queries' results have all the columns
+        self._query_cache = {}
+        
+        if name in self._partition_conditions:
+            # may not be constant in each tube any more
+            self._partition_conditions = [c for c in self._partition_conditions
+                                          if c != name]
+        
+        if not self._group_cache:
+            return
+        
+        self._group_cache = {k : v for k, v in self._group_cache.items()
+                             if name not in k}
+        
+    def _reset_caches(self):
+        """Forget everything memoized about the events"""
+        self._group_cache = {}
+        self._values_cache = {}
+        self._query_cache = {}
+        self._channels_cache = None
+        self._data_view = None
+        self._cache_len = -1
         
     def subset(self, conditions, values):
         """
@@ -215,25 +910,34 @@ class Experiment(HasStrictTraits):
             
         """
 
+        all_conditions = self.conditions
+
         if isinstance(conditions, str):
             c = conditions
             v = values
-            if c not in self.conditions:
+            if c not in all_conditions:
                 raise util.CytoflowError("{} is not a condition".format(c))
-            if v not in list(self.conditions[c]):
+            if v not in list(all_conditions[c]):
                 raise util.CytoflowError("{} is not a value of condition {}".format(v, c))
         else:
             for c, v in zip(conditions, values):
-                if c not in self.conditions:
+                if c not in all_conditions:
                     raise util.CytoflowError("{} is not a condition".format(c))
-                if v not in list(self.conditions[c]):
+                if v not in list(all_conditions[c]):
                     raise util.CytoflowError("{} is not a value of condition {}".format(v, c))
 
-        g = self.data.groupby(conditions)
+        g = self.groupby(conditions)
 
         ret = self.clone()
-        ret.data = g.get_group(values)
-        ret.data.reset_index(drop = True, inplace = True)
+        positions = g.get_positions(values)
+        if self._store is not None:
+            ret._store = self._store.take_rows(positions)
+            ret._reset_caches()
+        else:
+            ret.data = self.data.take(positions)
+            ret.data.reset_index(drop = True, inplace = True)
+            
+        ret._subset_partitions(self, positions)
         
         return ret    
     
@@ -247,6 +951,15 @@ class Experiment(HasStrictTraits):
         column name ``a column`` becomes ``a_column``, and can be queried with
         an ``a_column == True`` or such.
         
+        Which events matched the last few queries is remembered (like 
+        :meth:`groupby`'s groups), so running the same query again -- as 
+        views do with their ``subset`` every time they're plotted -- doesn't
+        evaluate the expression again.  Each new experiment still gets its 
+        own copy of the matching events.  The memo is forgotten when 
+        :attr:`data` is replaced or a column is changed.  (Again, if you change :attr:`data` in place, you're on your 
+        own!)  Queries that use local variables (with ``@``) aren't 
+        remembered.
+        
         Parameters
         ----------
         expr : string
@@ -263,8 +976,45 @@ class Experiment(HasStrictTraits):
             returned by :meth:`pandas.DataFrame.query()`
         """
         
+        key = _query_key(expr, kwargs)
+        self._check_caches()
+        
+        if key is not None and key in self._query_cache:
+            # move it to the end, so it's forgotten last
+            positions = self._query_cache.pop(key)
+        else:
+            positions = self._query_positions(expr, **kwargs)
+            
+            if len(positions) == 0:
+                raise util.CytoflowError("No events matched {}".format(expr))
+                
+        if key is not None:
+            cache = dict(self._query_cache)
+            cache[key] = positions
+            while len(cache) > _QUERY_CACHE_SIZE:
+                del cache[next(iter(cache))]
+            self._query_cache = cache
+                
+        # each result gets its own copy of the events
+        ret = self.clone()
+        
+        if self._store is not None:
+            ret._store = self._store.take_rows(positions)
+            ret._reset_caches()
+        else:
+            ret.data = self.data.take(positions)
+            ret.data.reset_index(drop = True, inplace = True)
+            
+        ret._subset_partitions(self, positions)
+        
+        return ret
+    
+    def _query_positions(self, expr, **kwargs):
+        """The positions of the events where ``expr`` is ``True``"""
+        
         resolvers = {}
-        for name, col in self.data.iteritems():
+        for name in self._columns():
+            col = self[name]
             new_name = util.sanitize_identifier(name)
             if new_name in resolvers:
                 raise util.CytoflowError("Tried to sanitize column name {1} to "
@@ -274,14 +1024,26 @@ class Experiment(HasStrictTraits):
             else:
                 resolvers[new_name] = col
                 
-        ret = self.clone()
-        ret.data = self.data.query(expr, resolvers = ({}, resolvers), **kwargs)
-        ret.data.reset_index(drop = True, inplace = True)
+        # pandas can't evaluate bitset columns, so unpack the ones that
+        # the expression uses
+        resolvers = _QueryResolvers(resolvers)
         
-        if len(ret.data) == 0:
-            raise util.CytoflowError("No events matched {}".format(expr))
+        if self._store is not None:
+            # evaluate the expression on the columns in the store
+            events = pd.DataFrame(index = self._store.index)
+        else:
+            events = self.data
+            
+        # DataFrame.eval() uses numexpr to evaluate the expression, when it 
+        # can.
+        mask = events.eval(expr, resolvers = ({}, resolvers), **kwargs)
+        mask = np.asarray(mask)
         
-        return ret
+        if mask.dtype != np.bool_ or mask.shape != (len(self),):
+            raise util.CytoflowError("{} isn't True or False for each event"
+                                     .format(expr))
+            
+        return np.flatnonzero(mask)
     
     def clone(self):
         """
@@ -289,7 +1051,26 @@ class Experiment(HasStrictTraits):
         """
         
         new_exp = self.clone_traits()
-        new_exp.data = self.data.copy(deep = False)
+        
+        if self._store is not None:
+            # share the files (and the copy in memory, if there is one)
+            new_exp._store = self._store.copy()
+            new_exp._data = pd.DataFrame()
+            new_exp._data_view = self._data_view
+        else:
+            new_exp._data = self._data.copy(deep = False)
+        
+        # the clone has the same events, so it can use the same groupings,
+        # condition values, query results and partitions
+        new_exp._group_cache = dict(self._group_cache)
+        new_exp._values_cache = dict(self._values_cache)
+        new_exp._query_cache = dict(self._query_cache)
+        new_exp._channels_cache = self._channels_cache
+        new_exp._cache_len = self._cache_len
+
+        # the clone shares the metadata and statistics until they're used
+        new_exp.metadata = self.metadata.copy()
+        new_exp.statistics = self.statistics.copy()
 
         # shallow copy of the history
         new_exp.history = self.history[:]
@@ -320,7 +1101,9 @@ class Experiment(HasStrictTraits):
         dtype : String
             The type of the new column in :attr:`data`.  Must be a string that
             :class:`pandas.Series` recognizes as a ``dtype``: common types are 
-            ``category``, ``float``, ``int``, and ``bool``.
+            ``category``, ``float``, ``int``, and ``bool``.  ``bitset`` stores
+            booleans packed one bit per event (see :class:`.BitArray`), which
+            is how the gating operations store their gates.
             
         data : pandas.Series (default = None)
             The :class:`pandas.Series` to add to :attr:`data`.  Must be the same
@@ -348,7 +1131,7 @@ class Experiment(HasStrictTraits):
             raise util.CytoflowError("Name '{}' is not a valid Python identifier"
                                      .format(name))
         
-        if name in self.data:
+        if name in self._columns():
             raise util.CytoflowError("Already a column named {0} in self.data"
                                      .format(name))
         
@@ -360,9 +1143,9 @@ class Experiment(HasStrictTraits):
         
         try:
             if data is not None:
-                self.data[name] = data.astype(dtype, copy = True)
+                self[name] = data.astype(dtype, copy = True)
             else:
-                self.data[name] = pd.Series(dtype = dtype)
+                self[name] = pd.Series(dtype = dtype)
           
         except (ValueError, TypeError) as exc:
                 raise util.CytoflowError("Had trouble converting data to type {0}"
@@ -388,8 +1171,8 @@ class Experiment(HasStrictTraits):
             
         data : pandas.Series
             The :class:`pandas.Series` to add to :attr:`data`.  Must be the same
-            length as :attr:`data`, and it must be convertable to a 
-            dtype of ``float64``.  If ``None``, will add an empty column to 
+            length as :attr:`data`, and it must be convertable to 
+            :attr:`channel_dtype`.  If ``None``, will add an empty column to 
             the :class:`Experiment` ... but the :class:`Experiment` must be 
             empty to do so!
              
@@ -397,7 +1180,7 @@ class Experiment(HasStrictTraits):
         ------
         :exc:`.CytoflowError`
             If the :class:`pandas.Series` passed in ``data`` isn't the same length
-            as :attr:`data`, or isn't convertable to a dtype ``float64``.          
+            as :attr:`data`, or isn't convertable to :attr:`channel_dtype`.          
             
         Examples
         --------
@@ -405,7 +1188,7 @@ class Experiment(HasStrictTraits):
         
         """
         
-        if name in self.data:
+        if name in self._columns():
             raise util.CytoflowError("Already a column named {0} in self.data"
                                 .format(name))
 
@@ -415,17 +1198,21 @@ class Experiment(HasStrictTraits):
         if data is not None and len(self) != len(data):
             raise util.CytoflowError("data must be the same length as self.data")
         
+        dtype = self.channel_dtype
+        
         try:
             if data is not None:
-                self.data[name] = data.astype("float64", copy = True)
+                self[name] = data.astype(dtype, copy = True)
             else:
-                self.data[name] = pd.Series(dtype = "float64")
+                self[name] = pd.Series(dtype = dtype)
                 
         except (ValueError, TypeError) as exc:
-                raise util.CytoflowError("Had trouble converting data to type \"float64\"") from exc
+                raise util.CytoflowError("Had trouble converting data to type \"{}\""
+                                         .format(dtype)) from exc
 
         self.metadata[name] = {}
         self.metadata[name]['type'] = "channel"
+        self.metadata[name]['dtype'] = dtype
         
     def add_events(self, data, conditions):
         """
@@ -480,51 +1267,317 @@ class Experiment(HasStrictTraits):
         
         """
 
-        # make sure the new tube's channels match the rest of the 
-        # channels in the Experiment
-    
-        if len(self) > 0 and set(data.columns) != set(self.channels):
-            raise util.CytoflowError("New events don't have the same channels")
+        # a tube is a batch of one.  (that builds the conditions' columns
+        # from codes and fills, instead of lists of Python objects.)
+        self.add_events_batch([(data, conditions)])
+        
+    def add_events_batch(self, tubes):
+        """
+        Add many tubes' worth of events to this :class:`Experiment` at once.
+        
+        This is equivalent to calling :meth:`add_events` once for each 
+        ``(data, conditions)`` pair in ``tubes``, but much faster for large
+        numbers of tubes: instead of copying :attr:`data` every time a tube is
+        appended, the new columns are allocated once at their final size, the
+        categories of categorical conditions are merged once, and each tube's
+        events are copied into place in a single pass.
+        
+        .. note::
+        
+            *Every* column in :attr:`data` must be accounted for.  Each column 
+            of type ``channel`` must appear in each tube's ``data``; each 
+            column of metadata must have a key:value pair in each tube's
+            ``conditions``.
+        
+        Parameters
+        ----------
+        tubes : List(Tuple(pandas.DataFrame, Dict(Str, Any)))
+            A list of ``(data, conditions)`` pairs, one per tube or well.  
+            ``data`` and ``conditions`` have the same requirements as the 
+            parameters of the same name in :meth:`add_events`.
             
-        # check that the conditions for this tube exist in the experiment
-        # already
-
-        if( any(True for k in conditions if k not in self.conditions) or \
-            any(True for k in self.conditions if k not in conditions) ):
-            raise util.CytoflowError("Metadata for this tube should be {}"
-                                     .format(list(self.conditions.keys())))
+        Raises
+        ------
+        :exc:`.CytoflowError`
+            :meth:`add_events_batch` pukes under the same circumstances as
+            :meth:`add_events`, or if the tubes don't all have the same 
+            channels.
+            
+        Examples
+        --------
+        >>> import cytoflow as flow
+        >>> import fcsparser
+        >>> ex = flow.Experiment()
+        >>> ex.add_condition("Time", "float")
+        >>> ex.add_condition("Strain", "category")
+        >>> _, tube1 = fcsparser.parse('CFP_Well_A4.fcs')
+        >>> _, tube2 = fcsparser.parse('RFP_Well_A3.fcs')
+        >>> ex.add_events_batch([(tube1, {"Time" : 1, "Strain" : "BL21"}),
+        ...                      (tube2, {"Time" : 1, "Strain" : "Top10G"})])
+        
+        """
+        
+        tubes = list(tubes)
+        if not tubes:
+            return
+        
+        # make sure the new tubes' channels match each other and the rest
+        # of the channels in the Experiment
+        
+        if len(self) > 0:
+            channels = set(self.channels)
+        else:
+            channels = set(tubes[0][0].columns)
             
-        # add the conditions to tube's internal data frame.  specify the conditions
-        # dtype using self.conditions.  check for errors as we do so.
+        for data, tube_conditions in tubes:
+            if set(data.columns) != channels:
+                raise util.CytoflowError("New events don't have the same channels")
+        
+            # check that the conditions for this tube exist in the experiment
+            # already
+            if( any(True for k in tube_conditions if k not in self.conditions) or \
+                any(True for k in self.conditions if k not in tube_conditions) ):
+                raise util.CytoflowError("Metadata for this tube should be {}"
+                                         .format(list(self.conditions.keys())))
+                
+        old_len = len(self)
+        partitions = self._partitions_so_far()
+        tube_lens = [len(data) for data, _ in tubes]
+        new_len = old_len + sum(tube_lens)
+        starts = np.cumsum([old_len] + tube_lens)
+        bounds = list(zip(starts[:-1], starts[1:]))
         
-        # take this chance to up-convert the float32s to float64.
-        # this happened automatically in DataFrame.append(), below, but 
-        # only in certain cases.... :-/
+        # the columns end up sorted, the same as DataFrame.append(sort = True)
+        # would leave them.
+        conditions = list(self.conditions.keys())
+        channels = [c for c in self._columns() if c not in conditions]
+        channels += [c for c in tubes[0][0].columns if c not in channels]
+        columns = sorted(channels + conditions)
+        channels = [c for c in columns if c not in conditions]
         
-        # TODO - the FCS standard says you can specify the precision.  
-        # check with int/float/double files!
+        # allocate all of the channels at once.  if the array is in Fortran
+        # order, pandas can wrap it in a single block without copying
+        # it, and each column is contiguous.
         
-        new_data = data.astype("float64", copy=True)
+        # take this chance to convert the channels to self.channel_dtype.
         
-        for meta_name, meta_value in conditions.items():
-            meta_type = self.conditions[meta_name].dtype
+        # if the events are in a scratch directory, allocate each channel's
+        # file instead, and copy the events straight into it.
+        
+        if self._store is not None:
+            new_store = util.ColumnStore(self._store.scratch_dir, new_len)
+        else:
+            new_store = None
+            channel_data = np.empty((new_len, len(channels)), 
+                                    dtype = self.channel_dtype, 
+                                    order = "F")
+        
+        for i, channel in enumerate(channels):
+            if new_store is not None:
+                channel_col = new_store.allocate(channel, self.channel_dtype)
+            else:
+                channel_col = channel_data[:, i]
+                
+            if old_len > 0:
+                channel_col[:old_len] = self[channel].values
+                
+            for (data, _), (start, end) in zip(tubes, bounds):
+                if channel in data:
+                    channel_col[start:end] = data[channel].values
+                else:
+                    channel_col[start:end] = np.nan
+                    
+        if new_store is None:
+            new_data = pd.DataFrame(channel_data, columns = channels, copy = False)
+        
+        # now, the conditions.  specify the conditions dtype using the existing
+        # columns, and check for errors as we do so.
+        
+        for meta_name in [c for c in columns if c in conditions]:
+            meta_type = self[meta_name].dtype
+            
+            try:
+                if is_categorical_dtype(meta_type):
+                    # merge the categories once, keeping the existing categories
+                    # (and so the existing codes) where they are.
+                    old_col = self[meta_name]
+                    cats = list(old_col.cat.categories)
+                    cat_idx = {c : i for i, c in enumerate(cats)}
+                    for _, tube_conditions in tubes:
+                        meta_value = tube_conditions[meta_name]
+                        if meta_value not in cat_idx:
+                            cat_idx[meta_value] = len(cats)
+                            cats.append(meta_value)
+                            
+                    codes = np.empty(new_len, dtype = np.min_scalar_type(-len(cats)))
+                    codes[:old_len] = old_col.cat.codes.values
+                    for (_, tube_conditions), (start, end) in zip(tubes, bounds):
+                        codes[start:end] = cat_idx[tube_conditions[meta_name]]
+                        
+                    col = pd.Categorical.from_codes(codes, categories = cats)
+                else:
+                    # extension types (like bitsets) are filled as numpy 
+                    # arrays of their scalar type, then converted.
+                    is_numpy = isinstance(meta_type, np.dtype)
+                    col = np.empty(new_len, 
+                                   dtype = meta_type if is_numpy else meta_type.type)
+                    col[:old_len] = np.asarray(self[meta_name])
+                    for (_, tube_conditions), (start, end) in zip(tubes, bounds):
+                        col[start:end] = tube_conditions[meta_name]
+                        
+                    if not is_numpy:
+                        col = pd.array(col, dtype = meta_type)
+                        
+                if new_store is not None:
+                    new_store[meta_name] = col
+                else:
+                    # inserting doesn't copy the channels' block
+                    new_data.insert(columns.index(meta_name), meta_name, col)
+            except (ValueError, TypeError) as exc:
+                raise util.CytoflowError("Had trouble converting condition {0} "
+                                         "to type {1}"
+                                         .format(meta_name, meta_type)) from exc
+                
+        if new_store is not None:
+            new_store.reorder(columns)
+            self._store = new_store
+            self._reset_caches()
+        else:
+            self.data = new_data
             
-            if is_categorical_dtype(meta_type):
-                meta_type = CategoricalDtype([meta_value])
+        self._extend_partitions(partitions, starts[1:], conditions)
 
-            new_data[meta_name] = \
-                pd.Series(data = [meta_value] * len(new_data),
-                          index = new_data.index,
-                          dtype = meta_type)
+# the layout of the directories that Experiment.save() writes
+_SAVE_VERSION = 1
+_SAVE_STATE_FILE = "experiment.pickle"
+_SAVE_EVENTS_DIR = "events"
+_SAVE_SCRATCH_DIR = "scratch"
+
+# how many queries' matching positions to remember
+_QUERY_CACHE_SIZE = 4
+
+def _query_key(expr, kwargs):
+    """
+    The key for a query's result in Experiment._query_cache -- or None if it
+    can't be remembered, because it uses local variables (with ``@``) or
+    unhashable arguments.
+    """
+    
+    if '@' in expr:
+        return None
+    
+    key = (expr, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    
+    return key
+
+def _map_block(fn, block, args):
+    """Call ``fn`` on one block of events, for map_partitions()"""
+    if isinstance(block, _StoreBlock):
+        block = block.load()
+    return fn(block, *args)
+
+class _StoreBlock(object):
+    """A block of events in a ColumnStore, to be copied out when needed"""
+    
+    def __init__(self, store, rows, columns):
+        self._store = store
+        self._rows = rows
+        self._columns = columns
+        
+    def load(self):
+        return self._store.to_frame(rows = np.arange(self._rows.start, 
+                                                     self._rows.stop),
+                                    columns = self._columns)
+
+class _QueryResolvers(dict):
+    """
+    The column resolvers for :meth:`Experiment.query`: unpacks bitset
+    columns to :class:`numpy` booleans when (and if) they're looked up.
+    """
+        
+    def __getitem__(self, key):
+        col = super().__getitem__(key)
+        if isinstance(col.dtype, util.BitDtype):
+            col = col.astype("bool")
+        return col
+        
+
+class GroupIndex(object):
+    """
+    The events in an :class:`Experiment`, grouped by the values of some of its
+    conditions.  Returned by :meth:`Experiment.groupby`, and behaves like the
+    parts of :class:`pandas.core.groupby.DataFrameGroupBy` that 
+    :mod:`cytoflow` uses.
+    
+    Attributes
+    ----------
+    by : Tuple(Str)
+        The conditions that the events are grouped by.
+        
+    keys : List
+        The groups' keys, sorted.  If there is one condition in :attr:`by`,
+        the keys are its values; if there are more, they are tuples.  If there 
+        are none, the only key is ``True``.
+        
+    indices : Dict(key : numpy.ndarray)
+        The row positions of the events in each group.
+        
+    groups : Dict(key : pandas.Index)
+        The row labels of the events in each group.  (The same as 
+        :attr:`indices` if the data has the default index, as it usually 
+        does.)
+        
+    levels : Dict(Str : pandas.Index)
+        The sorted values of each condition in :attr:`by` that actually 
+        appear in the data.  Useful for building statistics' indices.
+    """
+    
+    def __init__(self, data, by, keys, indices, levels):
+        self._data = data
+        self.by = by
+        self.keys = keys
+        self.indices = indices
+        self.levels = levels
+        self._groups = None
+        
+    @property
+    def groups(self):
+        if self._groups is None:
+            index = self._data.index
+            self._groups = {k : index[v] for k, v in self.indices.items()}
+        return self._groups
+        
+    def __len__(self):
+        return len(self.keys)
+    
+    def __iter__(self):
+        for key in self.keys:
+            yield key, self._take(self.indices[key])
             
-            # if we're categorical, merge the categories
-            if is_categorical_dtype(meta_type) and meta_name in self.data:
-                cats = set(self.data[meta_name].cat.categories) | set(new_data[meta_name].cat.categories)
-                self.data[meta_name] = self.data[meta_name].cat.set_categories(cats)
-                new_data[meta_name] = new_data[meta_name].cat.set_categories(cats)
+    def get_group(self, key):
+        """Get the events in group ``key`` as a :class:`pandas.DataFrame`"""
         
-        self.data = self.data.append(new_data, ignore_index = True, sort = True)
-        del new_data
+        return self._take(self.get_positions(key))
+    
+    def get_positions(self, key):
+        """Get the row positions of the events in group ``key``"""
+        
+        if key not in self.indices and isinstance(key, tuple) and len(key) == 1:
+            key = key[0]
+        
+        if key not in self.indices:
+            raise KeyError(key)
+        
+        return self.indices[key]
+    
+    def _take(self, positions):
+        if isinstance(self._data, util.ColumnStore):
+            return self._data.to_frame(rows = positions)
+        return self._data.take(positions)
 
 if __name__ == "__main__":
     import fcsparser
@@ -51,3 +51,4 @@ from .color_translation import ColorTranslationOp
 
 # etc 
 from .binning import BinningOp
+from .chunked import apply_chunked
@@ -248,6 +248,18 @@ class AutofluorescenceOp(HasStrictTraits):
               The standard deviation of the non-fluorescent distribution
         """
         
+        state = self.prepare_chunks(experiment)
+        corrected = experiment.map_partitions(self.apply_chunk,
+                                              state,
+                                              columns = list(self.channels))
+        return self.finish_chunks(experiment, corrected, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the correction can be applied to ``experiment``; see 
+        :func:`.apply_chunked`.
+        """
+        
         if experiment is None:
             raise util.CytoflowOpError('experiment', "No experiment specified")
         
@@ -271,13 +283,24 @@ class AutofluorescenceOp(HasStrictTraits):
         if not set(self.channels) == set(self._af_median.keys()):
             raise util.CytoflowOpError('channels', "Estimated channels differ from the channels "
                                "parameter.  Did you forget to (re)run estimate()?")
+            
+        return None
+    
+    def apply_chunk(self, block, state):
+        """Correct a block of events"""
+        
+        return DataFrame({channel : block[channel] - self._af_median[channel]
+                          for channel in self.channels})
+        
+    def finish_chunks(self, experiment, result, state):
+        """Add the channels corrected by :meth:`apply_chunk` to ``experiment``"""
         
         new_experiment = experiment.clone()
                 
         for channel in self.channels:
-            new_experiment[channel] = \
-                experiment[channel] - self._af_median[channel]
-                
+            new_experiment[channel] = result[channel]
+            
+        for channel in self.channels:
             new_experiment.metadata[channel]['af_median'] = self._af_median[channel]
             new_experiment.metadata[channel]['af_stdev'] = self._af_stdev[channel]
 
@@ -176,14 +176,14 @@ class ByView(OpView):
                 self._returned = False
                 
                 if by:
-                    self._iter = experiment.data.groupby(by).__iter__()
+                    self._iter = iter(experiment.groupby(by).keys)
                 
             def __iter__(self):
                 return self
             
             def __next__(self):
                 if self._iter:
-                    return next(self._iter)[0]
+                    return next(self._iter)
                 else:
                     if self._returned:
                         raise StopIteration
@@ -272,9 +272,9 @@ class ByView(OpView):
                                              "Plot {} not from enum_plots()"
                                              .format(plot_name))
                                
-            groupby = experiment.data.groupby(by)
+            groupby = experiment.groupby(by)
 
-            if plot_name not in set(groupby.groups.keys()):
+            if plot_name not in groupby.indices:
                 raise util.CytoflowViewError('plot_name',
                                              "Plot {} not from enum_plots()"
                                              .format(plot_name))
@@ -334,7 +334,7 @@ class AnnotatingView(BaseDataView):
         annotation_facet = kwargs.pop('annotation_facet', None)
         annotation_trait = kwargs.pop('annotation_trait', None)
                 
-        if annotation_facet is not None and annotation_facet in experiment.data:
+        if annotation_facet is not None and annotation_facet in experiment:
             if annotation_trait:
                 self.trait_set(**{annotation_trait : annotation_facet})
             elif not self.huefacet:
@@ -141,12 +141,12 @@ class BinningOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name))  
         
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "Name {} is in the experiment already"
                                        .format(self.name))
             
-        if self.bin_count_name and self.bin_count_name in experiment.data.columns:
+        if self.bin_count_name and self.bin_count_name in experiment:
             raise util.CytoflowOpError('bin_count_name',
                                        "bin_count_name {} is in the experiment already"
                                        .format(self.bin_count_name))
@@ -154,7 +154,7 @@ class BinningOp(HasStrictTraits):
         if not self.channel:
             raise util.CytoflowOpError('channel', "channel is not set")
         
-        if self.channel not in experiment.data.columns:
+        if self.channel not in experiment:
             raise util.CytoflowOpError('channel', 
                                        "channel {} isn't in the experiment"
                                        .format(self.channel))
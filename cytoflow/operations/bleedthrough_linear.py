@@ -298,6 +298,19 @@ class BleedthroughLinearOp(HasStrictTraits):
               the values specified in `bleedthrough_channels` and it will return
               the corrected value for this channel.
         """
+        state = self.prepare_chunks(experiment)
+        new_channels = experiment.map_partitions(self.apply_chunk, 
+                                                 state,
+                                                 columns = state['channels'])
+        return self.finish_chunks(experiment, new_channels, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the correction can be applied to ``experiment``, and 
+        compute the inverse of the spillover matrix; see 
+        :func:`.apply_chunked`.
+        """
+        
         if experiment is None:
             raise util.CytoflowOpError('experiment', "No experiment specified")
         
@@ -307,11 +320,11 @@ class BleedthroughLinearOp(HasStrictTraits):
                                        "Did you forget to run estimate()?")
         
         for (from_channel, to_channel) in self.spillover:
-            if not from_channel in experiment.data:
+            if not from_channel in experiment:
                 raise util.CytoflowOpError('spillover',
                                            "Can't find channel {0} in experiment"
                                            .format(from_channel))
-            if not to_channel in experiment.data:
+            if not to_channel in experiment:
                 raise util.CytoflowOpError('spillover',
                                            "Can't find channel {0} in experiment"
                                            .format(to_channel))
@@ -321,8 +334,6 @@ class BleedthroughLinearOp(HasStrictTraits):
                                            "Must have both (from, to) and "
                                            "(to, from) keys in self.spillover")
         
-        new_experiment = experiment.clone()
-        
         # the completely arbitrary ordering of the channels
         channels = list(set([x for (x, _) in list(self.spillover.keys())]))
         
@@ -333,12 +344,27 @@ class BleedthroughLinearOp(HasStrictTraits):
         # invert it.  use the pseudoinverse in case a is singular
         a_inv = np.linalg.pinv(a)
         
-        # compute the corrected channels
-        new_channels = np.dot(experiment.data[channels], a_inv)
+        return {'channels' : channels, 'a_inv' : a_inv}
+    
+    def apply_chunk(self, block, state):
+        """Correct a block of events"""
+        
+        channels = state['channels']
+        return DataFrame(np.dot(block[channels].values, state['a_inv']),
+                         columns = channels,
+                         index = block.index)
+        
+    def finish_chunks(self, experiment, result, state):
+        """Add the channels corrected by :meth:`apply_chunk` to ``experiment``"""
+        
+        channels = state['channels']
+        a_inv = state['a_inv']
+        
+        new_experiment = experiment.clone()
         
-        # and assign to the new experiment
-        for i, c in enumerate(channels):
-            new_experiment[c] = pd.Series(new_channels[:, i])
+        # assign the corrected channels to the new experiment
+        for c in channels:
+            new_experiment[c] = result[c]
         
         for channel in channels:
             # add the spillover values to the channel's metadata
@@ -173,7 +173,7 @@ class ChannelStatisticOp(HasStrictTraits):
         if not self.function:
             raise util.CytoflowOpError('function', "Must specify a function")
 
-        if self.channel not in experiment.data:
+        if self.channel not in experiment:
             raise util.CytoflowOpError('channel',
                                        "Channel {0} not found in the experiment"
                                        .format(self.channel))
@@ -217,7 +217,7 @@ class ChannelStatisticOp(HasStrictTraits):
             if len(unique) == 1:
                 warn("Only one category for {}".format(b), util.CytoflowOpWarning)
 
-        groupby = experiment.data.groupby(self.by)
+        groupby = experiment.groupby(self.by)
 
         for group, data_subset in groupby:
             if len(data_subset) == 0:
@@ -225,7 +225,7 @@ class ChannelStatisticOp(HasStrictTraits):
                      .format(group), 
                      util.CytoflowOpWarning)
                 
-        idx = pd.MultiIndex.from_product([experiment[x].unique() for x in self.by], 
+        idx = pd.MultiIndex.from_product([groupby.levels[x] for x in self.by], 
                                          names = self.by)
 
         stat = pd.Series(data = [self.fill] * len(idx),
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+cytoflow.operations.chunked
+---------------------------
+'''
+
+import cytoflow.utility as util
+
+def apply_chunked(experiment, operations, chunk_size = 100000, workers = None):
+    """
+    Apply a chain of per-event operations to an :class:`.Experiment`, 
+    streaming the events through each one in blocks of ``chunk_size`` 
+    events.  The operations' temporary arrays (scaled copies of the data, 
+    masks, etc.) are only ever as long as a block, so the memory they use
+    doesn't grow with the number of events -- only the new columns do.
+    
+    The operations must implement :meth:`~.IOperation.prepare_chunks`, 
+    :meth:`~.IOperation.apply_chunk` and :meth:`~.IOperation.finish_chunks`.
+    :class:`.ThresholdOp`, :class:`.RangeOp`, :class:`.Range2DOp`, 
+    :class:`.QuadOp`, :class:`.PolygonOp`, :class:`.RatioOp`,
+    :class:`.BleedthroughLinearOp` and :class:`.AutofluorescenceOp` do.
+    
+    The result is the same as calling each operation's 
+    :meth:`~.IOperation.apply` in turn.  The operations are applied one 
+    after another (not a block at a time through the whole chain), because
+    an operation may need the previous one's results for the whole
+    experiment -- to set up a scale, for example.
+    
+    Parameters
+    ----------
+    experiment : Experiment
+        The :class:`.Experiment` to apply the operations to.
+        
+    operations : List(IOperation)
+        The operations, in the order to apply them.
+        
+    chunk_size : Int (default = 100000)
+        The most events in a block.
+        
+    workers : Int (default = None)
+        How many blocks to work on at once, in a pool of threads.  Each 
+        worker holds one block's temporary arrays.  As for 
+        :attr:`.ImportOp.workers` and :meth:`.Experiment.map_partitions`:
+        if ``None``, use the default from :func:`~cytoflow.set_default_workers`,
+        and if ``0``, use one worker per CPU.
+        
+    Returns
+    -------
+    Experiment
+        A new :class:`.Experiment` with the operations applied.
+        
+    Examples
+    --------
+    >>> ex2 = flow.apply_chunked(ex, [flow.ThresholdOp(name = "T",
+    ...                                                channel = "Y2-A",
+    ...                                                threshold = 1000),
+    ...                               flow.RangeOp(name = "R",
+    ...                                            channel = "V2-A",
+    ...                                            low = 100,
+    ...                                            high = 1000)])
+    """
+    
+    if chunk_size < 1:
+        raise util.CytoflowError("chunk_size must be positive")
+    
+    for op in operations:
+        if not hasattr(op, "apply_chunk"):
+            raise util.CytoflowError("{} can't be applied in chunks"
+                                     .format(op.__class__.__name__))
+            
+    for op in operations:
+        state = op.prepare_chunks(experiment)
+        result = experiment.map_partitions(op.apply_chunk, 
+                                           state, 
+                                           chunk_size = chunk_size,
+                                           workers = workers,
+                                           executor = "thread")
+        experiment = op.finish_chunks(experiment, result, state)
+        
+    return experiment
@@ -26,7 +26,6 @@ from traits.api import (HasStrictTraits, Str, CStr, Dict, Any, Instance,
                         Constant, List, provides, Array)
 
 import numpy as np
-import scipy.stats
 import scipy.ndimage.filters
 import pandas as pd
 
@@ -82,6 +81,10 @@ class DensityGateOp(HasStrictTraits):
         ``Time`` and ``Dox``, setting ``by = ["Time", "Dox"]`` will fit a 
         separate gate to each subset of the data with a unique combination of
         ``Time`` and ``Dox``.
+
+    workers : Int (default = None)
+        How many groups (in :attr:`by`) to estimate at once; see
+        :func:`~cytoflow.utility.parallel_map_arrays`.
         
     Notes
     -----
@@ -175,6 +178,7 @@ class DensityGateOp(HasStrictTraits):
     max_quantile = util.PositiveFloat(1.0, allow_zero = False)
     sigma = util.PositiveFloat(1.0, allow_zero = False)
     by = List(Str)
+    workers = util.CIntOrNone(None)
         
     _xscale = Instance(util.IScale, transient = True)
     _yscale = Instance(util.IScale, transient = True)
@@ -184,6 +188,7 @@ class DensityGateOp(HasStrictTraits):
 
     _keep_xbins = Dict(Any, Array, transient = True)
     _keep_ybins = Dict(Any, Array, transient = True)
+    _keep_bins = Dict(Any, Array, transient = True)
     _histogram = Dict(Any, Array, transient = True)
     
     def estimate(self, experiment, subset = None):
@@ -204,12 +209,12 @@ class DensityGateOp(HasStrictTraits):
             raise util.CytoflowOpError('experiment',
                                        "No experiment specified")
 
-        if self.xchannel not in experiment.data:
+        if self.xchannel not in experiment:
             raise util.CytoflowOpError('xchannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.xchannel))
             
-        if self.ychannel not in experiment.data:
+        if self.ychannel not in experiment:
             raise util.CytoflowOpError('ychannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.ychannel))
@@ -250,12 +255,7 @@ class DensityGateOp(HasStrictTraits):
                                            "Subset string '{0}' returned no events"
                                            .format(subset))
                 
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -277,31 +277,37 @@ class DensityGateOp(HasStrictTraits):
                                                          yscale(ylim[1]), 
                                                          self.bins))
                     
+        groups = []
+        xys = []
+                    
         for group, group_data in groupby:
             if len(group_data) == 0:
                 raise util.CytoflowOpError('by',
                                            "Group {} had no data"
                                            .format(group))
-
-            h, _, _ = np.histogram2d(group_data[self.xchannel], 
-                                     group_data[self.ychannel], 
-                                     bins=[xbins, ybins])
-            
-            h = scipy.ndimage.filters.gaussian_filter(h, sigma = self.sigma)
-            
-            i = scipy.stats.rankdata(h, method = "ordinal") - 1
-            i = np.unravel_index(np.argsort(-i), h.shape)
+                
+            groups.append(group)
+            xys.append(group_data[[self.xchannel, self.ychannel]].values)
             
-            goal_count = self.keep * len(group_data)
-            curr_count = 0
-            num_bins = 0
+        # estimate the groups in parallel
+        n = len(xys)
+        fits = util.parallel_map_arrays(_estimate_bins,
+                                        xys,
+                                        [xbins] * n,
+                                        [ybins] * n,
+                                        [self.sigma] * n,
+                                        [self.keep] * n,
+                                        workers = self.workers,
+                                        executor = "process")
 
-            while(curr_count < goal_count and num_bins < i[0].size):
-                curr_count += h[i[0][num_bins], i[1][num_bins]]
-                num_bins += 1
-                
-            self._keep_xbins[group] = i[0][0:num_bins]
-            self._keep_ybins[group] = i[1][0:num_bins]
+        for group, (h, keep_xbins, keep_ybins) in zip(groups, fits):
+            self._keep_xbins[group] = keep_xbins
+            self._keep_ybins[group] = keep_ybins
+            
+            # a lookup table of the bins to keep, for apply()
+            keep_bins = np.zeros(h.shape, dtype = np.bool_)
+            keep_bins[keep_xbins, keep_ybins] = True
+            self._keep_bins[group] = keep_bins
             self._histogram[group] = h
 
             
@@ -344,7 +350,7 @@ class DensityGateOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name))  
 
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "Experiment already has a column named {0}"
                                        .format(self.name))
@@ -362,12 +368,12 @@ class DensityGateOp(HasStrictTraits):
             raise util.CytoflowOpError(None,
                                        "Couldn't find _yscale.  What happened??")
 
-        if self.xchannel not in experiment.data:
+        if self.xchannel not in experiment:
             raise util.CytoflowOpError('xchannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.xchannel))
 
-        if self.ychannel not in experiment.data:
+        if self.ychannel not in experiment:
             raise util.CytoflowOpError('ychannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.ychannel))
@@ -379,39 +385,29 @@ class DensityGateOp(HasStrictTraits):
                                            "must be one of {}"
                                            .format(b, experiment.conditions))
         
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that
-            # contains all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
+            
+        # find each event's bin once, then look up whether its group kept it
+        x_bin = _bin_index(self._xbins, experiment[self.xchannel].values)
+        y_bin = _bin_index(self._ybins, experiment[self.ychannel].values)
+        in_bins = (x_bin >= 0) & (y_bin >= 0)
             
-        event_assignments = pd.Series([False] * len(experiment), dtype = "bool")
+        event_assignments = np.zeros(len(experiment), dtype = np.bool_)
         
-        for group, group_data in groupby:
-            if group not in self._keep_xbins:
+        for group, group_idx in groupby.indices.items():
+            if group not in self._keep_bins:
                 # there weren't any events in this group, so we didn't get
                 # an estimate
                 continue
             
-            group_idx = groupby.groups[group]
-            
-            cX = pd.cut(group_data[self.xchannel], self._xbins, include_lowest = True, labels = False)
-            cY = pd.cut(group_data[self.ychannel], self._ybins, include_lowest = True, labels = False)
-
-            group_keep = pd.Series([False] * len(group_data))
-            
-            keep_x = self._keep_xbins[group]
-            keep_y = self._keep_ybins[group]
-            
-            for (xbin, ybin) in zip(keep_x, keep_y):
-                group_keep = group_keep | ((cX == xbin) & (cY == ybin))
-                            
-            event_assignments.iloc[group_idx] = group_keep
+            group_idx = group_idx[in_bins[group_idx]]
+            keep_bins = self._keep_bins[group]
+            event_assignments[group_idx] = keep_bins[x_bin[group_idx], 
+                                                     y_bin[group_idx]]
                     
         new_experiment = experiment.clone()
         
-        new_experiment.add_condition(self.name, "bool", event_assignments)
+        new_experiment.add_condition(self.name, "bitset", pd.Series(event_assignments))
 
         new_experiment.history.append(self.clone_traits(transient = lambda _: True))
         return new_experiment
@@ -430,6 +426,38 @@ class DensityGateOp(HasStrictTraits):
         v.trait_set(**kwargs)
         return v
           
+def _estimate_bins(xy, xbins, ybins, sigma, keep):
+    """
+    Find the densest bins of one group's events.  Returns the smoothed
+    histogram and the x and y indices of the bins to keep, densest first.
+    """
+    
+    h, _, _ = np.histogram2d(xy[:, 0], xy[:, 1], bins=[xbins, ybins])
+    
+    h = scipy.ndimage.filters.gaussian_filter(h, sigma = sigma)
+    
+    # the bins from densest to least dense.  (ties go to the later bin.)
+    order = np.argsort(h, axis = None, kind = "stable")[::-1]
+    
+    # keep the densest bins until they have at least `keep` of the events
+    counts = np.cumsum(h.ravel()[order])
+    num_bins = min(np.searchsorted(counts, keep * len(xy)) + 1, order.size)
+    
+    i = np.unravel_index(order[:num_bins], h.shape)
+    return h, i[0], i[1]
+
+def _bin_index(bins, x):
+    """
+    Which bin each value in ``x`` falls into, like 
+    ``pd.cut(x, bins, include_lowest = True, labels = False)`` (but much 
+    faster.)  Values outside the bins (or NaN) get ``-1``.
+    """
+    
+    idx = np.searchsorted(bins, x, side = "left") - 1
+    idx[x == bins[0]] = 0
+    idx[idx >= len(bins) - 1] = -1
+    return idx
+
 @provides(IView)
 class DensityGateView(By2DView, AnnotatingView, DensityView):
     """
@@ -26,12 +26,10 @@ import matplotlib.pyplot as plt
 from warnings import warn
 
 from traits.api import (HasStrictTraits, Str, CStr, Dict, Any, Instance, 
-                        Constant, List, provides, Array, Function)
+                        Constant, List, provides, Array)
 
 import numpy as np
 import sklearn.cluster
-import scipy.stats
-import scipy.optimize
 import scipy.ndimage
 
 import pandas as pd
@@ -40,10 +38,11 @@ from cytoflow.views import IView, HistogramView, ScatterplotView
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .sampling import SamplingMixin
 from .base_op_views import By1DView, By2DView, AnnotatingView, NullView
 
 @provides(IOperation)
-class FlowPeaksOp(HasStrictTraits):
+class FlowPeaksOp(SamplingMixin, HasStrictTraits):
     """
     This module uses the **flowPeaks** algorithm to assign events to clusters in
     an unsupervised manner.
@@ -96,6 +95,14 @@ class FlowPeaksOp(HasStrictTraits):
         How far apart can clusters be before they are merged?  This is
         a unit-free scalar, and is approximately the maximum number of
         k-means clusters between peaks. 
+
+    workers : Int (default = None)
+        How many groups (in :attr:`by`) to cluster at once; see
+        :func:`~cytoflow.utility.parallel_map_arrays`.
+
+    sample_size, sample_fraction, sample_seed
+        Estimate the clusters from a random sample of each group's events;
+        see :class:`~.sampling.SamplingMixin`.
         
     find_outliers : Bool (default = False)
         Should the algorithm use an extra step to identify outliers?
@@ -213,6 +220,7 @@ class FlowPeaksOp(HasStrictTraits):
     channels = List(Str)
     scale = Dict(Str, util.ScaleEnum)
     by = List(Str)
+    workers = util.CIntOrNone(None)
 #     find_outliers = Bool(False)
     
     # parameters that control estimation, with sensible defaults
@@ -226,8 +234,7 @@ class FlowPeaksOp(HasStrictTraits):
     
     _kmeans = Dict(Any, Instance(sklearn.cluster.MiniBatchKMeans), transient = True)
     _means = Dict(Any, List, transient = True)
-    _normals = Dict(Any, List(Function), transient = True)
-    _density = Dict(Any, Function, transient = True)
+    _density = Dict(Any, Instance("_MixtureDensity"), transient = True)
     _peaks = Dict(Any, List(Array), transient = True)  
     _peak_clusters = Dict(Any, List(Array), transient = True)
     _cluster_peak = Dict(Any, List, transient = True)  # kmeans cluster idx --> peak idx
@@ -257,7 +264,7 @@ class FlowPeaksOp(HasStrictTraits):
                                        "Must set at least one channel")
 
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                       .format(c))
@@ -289,12 +296,7 @@ class FlowPeaksOp(HasStrictTraits):
                                            "Subset string '{0}' returned no events"
                                            .format(subset))
                 
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -307,10 +309,18 @@ class FlowPeaksOp(HasStrictTraits):
             else:
                 self._scale[c] = util.scale_factory(util.get_default_scale(), experiment, channel = c)
                                     
+        groups = []
+        xs = []
+                                    
+        self._samples = {}
         for data_group, data_subset in groupby:
             if len(data_subset) == 0:
                 raise util.CytoflowOpError('by',
                                            "Group {} had no data".format(data_group))
+
+            # estimate from a sample of the events, if asked
+            data_subset = self._sample(data_group, data_subset)
+                
             x = data_subset.loc[:, self.channels[:]]
             for c in self.channels:
                 x[c] = self._scale[c](x[c])
@@ -318,18 +328,19 @@ class FlowPeaksOp(HasStrictTraits):
             # drop data that isn't in the scale range
             for c in self.channels:
                 x = x[~(np.isnan(x[c]))]
-            x = x.values
-            
-            #### choose the number of clusters and fit the kmeans
-            num_clusters = [util.num_hist_bins(x[:, c]) for c in range(len(self.channels))]
-            num_clusters = np.ceil(np.median(num_clusters))
-            num_clusters = int(num_clusters)
+                
+            groups.append(data_group)
+            xs.append(x.values)
             
-            self._kmeans[data_group] = kmeans = \
-                sklearn.cluster.MiniBatchKMeans(n_clusters = num_clusters,
-                                                random_state = 0)
+        #### fit the kmeans to the groups in parallel
+        fits = util.parallel_map_arrays(_fit_kmeans,
+                                        xs,
+                                        workers = self.workers,
+                                        executor = "process")
             
-            kmeans.fit(x)
+        for data_group, x, kmeans in zip(groups, xs, fits):
+            self._kmeans[data_group] = kmeans
+            num_clusters = kmeans.n_clusters
             x_labels = kmeans.predict(x)
             d = len(self.channels)
 
@@ -340,226 +351,121 @@ class FlowPeaksOp(HasStrictTraits):
             for j in range(d):
                 r = x[d].max() - x[d].min()
                 s0[j, j] = (r / (num_clusters ** (1. / d))) ** 0.5 
-            
-            means = []
-            weights = []
-            normals = []
-                        
-            for k in range(num_clusters):
-                xk = x[x_labels == k]
-                num_k = np.sum(x_labels == k)
-                weight_k = num_k / len(x_labels)
-                mu = xk.mean(axis = 0)
-                means.append(mu)
-                s = np.cov(xk, rowvar = False)
                 
-                el = num_k / (num_clusters + num_k)
-                s_smooth = el * self.h * s + (1.0 - el) * self.h0 * s0
-                
-                n = scipy.stats.multivariate_normal(mean = mu, cov = s_smooth)
-                weights.append(weight_k)
-                normals.append(lambda x, n = n: n.pdf(x))
+            # sort the events by cluster, so each cluster's events are a slice
+            num_k = np.bincount(x_labels, minlength = num_clusters)
+            xk = np.split(x[np.argsort(x_labels, kind = "stable")], 
+                          np.cumsum(num_k)[:-1])
+            
+            weights = num_k / len(x_labels)
+            means = np.array([xk_i.mean(axis = 0) for xk_i in xk])
+            s = np.array([np.cov(xk_i, rowvar = False).reshape(d, d) 
+                          for xk_i in xk])
+            
+            el = (num_k / (num_clusters + num_k))[:, np.newaxis, np.newaxis]
+            s_smooth = el * self.h * s + (1.0 - el) * self.h0 * s0
                        
-            self._means[data_group] = means
-            self._normals[data_group] = normals         
-            self._density[data_group] = density = lambda x, weights = weights, normals = normals: np.sum([w * n(x) for w, n in zip(weights, normals)], axis = 0)
+            self._means[data_group] = list(means)
+            self._density[data_group] = _MixtureDensity(weights, means, s_smooth)
             
-        ### use optimization on the finite gmm to find the local peak for 
-        ### each kmeans cluster
-        for data_group, data_subset in groupby:
+        ### climb the finite gmm from each kmeans cluster's mean to its 
+        ### local peak -- all the clusters at once
+        for data_group in groups:
             kmeans = self._kmeans[data_group]
             num_clusters = kmeans.n_clusters
-            means = self._means[data_group]
             density = self._density[data_group]
+            
+            cluster_peaks, converged = _find_peaks(density, 
+                                                   self._means[data_group])
+            
+            for k in np.flatnonzero(~converged):
+                warn("Peak finding didn't converge for cluster {}"
+                     .format(k),
+                     util.CytoflowWarning)
+                
+            # clusters that climbed to the same peak share it
             peaks = []
             peak_clusters = []  # peak idx --> list of clusters
-                        
-            min_mu = [np.inf] * len(self.channels)
-            max_mu = [-1.0 * np.inf] * len(self.channels)
-             
-            for k in range(num_clusters):
-                mu = means[k]
-                for ci in range(len(self.channels)):
-                    if mu[ci] < min_mu[ci]:
-                        min_mu[ci] = mu[ci]
-                    if mu[ci] > max_mu[ci]:
-                        max_mu[ci] = mu[ci]
-          
+            
             for k in range(num_clusters):
-                mu = means[k]
-                f = lambda x: -1.0 * density(x)
-                
-                res = scipy.optimize.minimize(f, mu, method = "CG",
-                                              options = {'gtol' : 1e-3})
-
-                if not res.success:
-                    warn("Peak finding failed for cluster {}: {}"
-                         .format(k, res.message),
-                         util.CytoflowWarning)
-
-#                 ### The peak-searching algorithm from the paper.  works fine,
-#                 ### but slow!  we get similar results with the conjugate gradient
-#                 ### optimization method from scipy
-
-#                 x0 = x = means[k]
-#                 k0 = k
-#                 b = beta_max[k] / 10.0
-#                 Nsuc = 0
-#                 n = 0
-#                 
-#                 while(n < 1000):
-# #                     df = scipy.misc.derivative(density, x, 1e-6)
-#                     df = statsmodels.tools.numdiff.approx_fprime(x, density)
-#                     if np.linalg.norm(df) < 1e-3:
-#                         break
-#                     
-#                     y = x + b * df / np.linalg.norm(df)
-#                     if density(y) <= density(x):
-#                         Nsuc = 0
-#                         b = b / 2.0
-#                         continue
-#                     
-#                     Nsuc += 1
-#                     if Nsuc >= 2:
-#                         b = min(2*b, beta_max[k])
-# 
-#                     ky = kmeans.predict(y[np.newaxis, :])[0]
-#                     if ky == k:
-#                         x = y
-#                     else:
-#                         k = ky
-#                         b = beta_max[k] / 10.0
-#                         mu = means[k]
-#                         if density(mu) > density(y):
-#                             x = mu
-#                         else:
-#                             x = y
-#                             
-#                     n += 1 
-                                        
-                merged = False
-                for pi, p in enumerate(peaks):
+                if peaks:
                     # TODO - this probably only works for scaled measurements
-                    if np.linalg.norm(p - res.x) < (1e-2):  
-                        peak_clusters[pi].append(k)
-                        merged = True
-                        break
-                        
-                if not merged:
+                    dist = np.linalg.norm(np.array(peaks) - cluster_peaks[k], 
+                                          axis = 1)
+                    close = np.flatnonzero(dist < 1e-2)
+                else:
+                    close = []
+                    
+                if len(close) > 0:
+                    peak_clusters[close[0]].append(k)
+                else:
                     peak_clusters.append([k])
-                    peaks.append(res.x)                    
+                    peaks.append(cluster_peaks[k])
             
             self._peaks[data_group] = peaks
             self._peak_clusters[data_group] = peak_clusters
 
-            ### merge peaks that are sufficiently close
+        ### merge peaks that are sufficiently close
             
-        for data_group, data_subset in groupby:
+        for data_group in groups:
             kmeans = self._kmeans[data_group]
             num_clusters = kmeans.n_clusters
-            means = self._means[data_group]
+            means = np.array(self._means[data_group])
             density = self._density[data_group]
-            peaks = self._peaks[data_group]
+            peaks = np.array(self._peaks[data_group])
             peak_clusters = self._peak_clusters[data_group]
+            
+            # the distance from each cluster's mean to its nearest neighbor's,
+            # and that distance for the cluster that each peak is in
+            mean_dist = np.linalg.norm(means[:, np.newaxis] - means[np.newaxis], 
+                                       axis = 2)
+            np.fill_diagonal(mean_dist, np.inf)
+            sk = mean_dist.min(axis = 1)
+            s = sk[kmeans.predict(peaks)]
+            
+            # which pairs of peaks can be merged?  they must be close enough,
+            # relative to their clusters' neighbors, and the density between 
+            # them must not dip too far below a straight line.  check the 
+            # distance first, because it's cheaper.
+            peak_dist = np.linalg.norm(peaks[:, np.newaxis] - peaks[np.newaxis],
+                                       axis = 2)
+            close = peak_dist / (s[:, np.newaxis] + s[np.newaxis]) <= self.merge_dist
+            pi, pj = np.nonzero(np.triu(close, 1))
+            ok = _max_tol(density, peaks[pi], peaks[pj]) < self.tol
 
-            groups = [[x] for x in range(len(peaks))]
-            peak_groups = [x for x in range(len(peaks))]  # peak idx --> group idx
+            can_merge = np.zeros(peak_dist.shape, dtype = np.bool_)
+            can_merge[pi[ok], pj[ok]] = True
+            can_merge[pj[ok], pi[ok]] = True
+            
+            # hierarchically merge groups of peaks, closest mergeable groups
+            # first.  two groups can be merged if any of their peaks can be, 
+            # and their distance is the distance between their closest peaks.
+            peak_groups = [[p] for p in range(len(peaks))]
+            group_dist = peak_dist
             
-                            
-            def max_tol(x, y):
-                f = lambda a: density(a[np.newaxis, :])
-#                 lx = kmeans.predict(x[np.newaxis, :])[0]
-#                 ly = kmeans.predict(y[np.newaxis, :])[0]
-                n = len(x)
-                n_scale = 1
-#                 n_scale = np.sqrt(((nx + ny) / 2.0) / (n / num_clusters))
+            while len(peak_groups) > 1:
+                dist = np.where(np.triu(can_merge, 1), group_dist, np.inf)
+                gi, hi = np.unravel_index(np.argmin(dist), dist.shape)
                 
-                def tol(t):
-                    zt = x + t * (y - x)
-                    fhat_zt = f(x) + t * (f(y) - f(x))
-                    return -1.0 * abs((f(zt) - fhat_zt) / fhat_zt) * n_scale
+                if dist[gi, hi] == np.inf:
+                    break
                 
-                res = scipy.optimize.minimize_scalar(tol, 
-                                                     bounds = [0, 1], 
-                                                     method = 'Bounded')
+                # merge group hi into group gi
+                peak_groups[gi].extend(peak_groups[hi])
+                del peak_groups[hi]
                 
-                if res.status != 0:
-                    raise util.CytoflowOpError(None,
-                                               "tol optimization failed for {}, {}"
-                                               .format(x, y))
-                return -1.0 * res.fun
+                can_merge[gi] |= can_merge[hi]
+                can_merge[:, gi] |= can_merge[:, hi]
+                can_merge = np.delete(np.delete(can_merge, hi, 0), hi, 1)
                 
-            
-            def nearest_neighbor_dist(k):
-                min_dist = np.inf
-                
-                for i in range(num_clusters):
-                    if i == k:
-                        continue
-                    dist = np.linalg.norm(means[k] - means[i])
-                    if dist < min_dist:
-                        min_dist = dist
-                        
-                return min_dist
-            
-            sk = [nearest_neighbor_dist(x) for x in range(num_clusters)]
-            
-            def s(x):
-                k = kmeans.predict(x[np.newaxis, :])[0]
-                return sk[k]
-            
-            def can_merge(g, h):
-                for pg in g:
-                    for ph in h:
-                        vg = peaks[pg]
-                        vh = peaks[ph]
-                        dist_gh = np.linalg.norm(vg - vh)
-                        
-                        if max_tol(vg, vh) < self.tol and dist_gh / (s(vg) + s(vh)) <= self.merge_dist:
-                            return True
-                        
-                return False
-            
-            while True:
-                if len(groups) == 1:
-                    break
-                 
-                # find closest mergable groups
-                min_dist = np.inf
-                for gi in range(len(groups)):
-                    g = groups[gi]
-                     
-                    for hi in range(gi + 1, len(groups)):
-                        h = groups[hi]
-                         
-                        if can_merge(g, h):
-                            dist_gh = np.inf
-                            for pg in g:
-                                vg = peaks[pg]
-                                for ph in h:
-                                    vh = peaks[ph]
-#                                     print("vg {} vh {}".format(vg, vh))
-                                    dist_gh = min(dist_gh, 
-                                                  np.linalg.norm(vg - vh))
-                                     
-                            if dist_gh < min_dist:
-                                min_gi = gi
-                                min_hi = hi
-                                min_dist = dist_gh
-                                 
-                if min_dist == np.inf:
-                    break
-                 
-                # merge the groups
-                groups[min_gi].extend(groups[min_hi])
-                for g in groups[min_hi]:
-                    peak_groups[g] = min_gi
-                del groups[min_hi]
+                group_dist[gi] = np.minimum(group_dist[gi], group_dist[hi])
+                group_dist[:, gi] = np.minimum(group_dist[:, gi], group_dist[:, hi])
+                group_dist = np.delete(np.delete(group_dist, hi, 0), hi, 1)
                 
             cluster_group = [0] * num_clusters
             cluster_peaks = [0] * num_clusters
     
-            for gi, g in enumerate(groups):
+            for gi, g in enumerate(peak_groups):
                 for p in g:
                     for cluster in peak_clusters[p]:
                         cluster_group[cluster] = gi
@@ -603,7 +509,7 @@ class FlowPeaksOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name))  
          
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "Experiment already has a column named {0}"
                                        .format(self.name))
@@ -618,7 +524,7 @@ class FlowPeaksOp(HasStrictTraits):
                                        "call estimate()?")
  
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                            .format(c))
@@ -637,12 +543,7 @@ class FlowPeaksOp(HasStrictTraits):
                                            "must be one of {}"
                                            .format(b, experiment.conditions))
                  
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
                  
         event_assignments = pd.Series(["{}_None".format(self.name)] * len(experiment), dtype = "object")
          
@@ -843,6 +744,143 @@ class FlowPeaksOp(HasStrictTraits):
                                          "Can't specify more than two channels for a default view")
         
     
+def _fit_kmeans(x):
+    """Choose the number of clusters and fit the kmeans to one group's events"""
+    
+    num_clusters = [util.num_hist_bins(x[:, c]) for c in range(x.shape[1])]
+    num_clusters = np.ceil(np.median(num_clusters))
+    num_clusters = int(num_clusters)
+    
+    kmeans = sklearn.cluster.MiniBatchKMeans(n_clusters = num_clusters,
+                                             random_state = 0)
+    kmeans.fit(x)
+    return kmeans
+
+class _MixtureDensity(object):
+    """
+    The density of a finite gaussian mixture model and its mean-shift steps,
+    evaluated for many points (and all the components) at once.
+    
+    Parameters
+    ----------
+    weights : array, shape (K,)
+        The components' weights.
+        
+    means : array, shape (K, d)
+        The components' means.
+        
+    covariances : array, shape (K, d, d)
+        The components' covariance matrices.
+    """
+    
+    # how many points to evaluate at once.  the intermediate arrays are
+    # (points x components x dimensions)
+    _chunk_size = 4096
+    
+    def __init__(self, weights, means, covariances):
+        self.weights = np.asarray(weights, dtype = np.float64)
+        self.means = np.asarray(means, dtype = np.float64)
+        self.precisions = np.linalg.inv(covariances)
+        
+        # each component's weight times its normalizing constant, as a log
+        d = self.means.shape[1]
+        _, logdet = np.linalg.slogdet(covariances)
+        with np.errstate(divide = 'ignore'):
+            self._log_coefs = np.log(self.weights) \
+                              - 0.5 * (d * np.log(2 * np.pi) + logdet)
+                              
+        # precision times mean, for the mean shift
+        self._precision_means = np.einsum('kij,kj->ki', 
+                                          self.precisions, 
+                                          self.means)
+        
+    def __call__(self, x):
+        """
+        The density at each row of ``x``, an array of shape (n, d).  If 
+        ``x`` is a single point, of shape (d,), return a scalar.
+        """
+        
+        x = np.asarray(x, dtype = np.float64)
+        if x.ndim == 1:
+            return self(x[np.newaxis, :])[0]
+        
+        return np.concatenate([np.exp(self._log_components(xc)).sum(axis = 1)
+                               for xc in self._chunks(x)])
+    
+    def mean_shift(self, x):
+        """
+        One mean-shift step uphill from each row of ``x``: the point where
+        the gradient would be zero if each component's weight stayed what it
+        is at ``x``.  (The step is ``A^{-1} g``, where ``g`` is the gradient
+        and ``A`` is the sum of the weighted precisions.)
+        """
+        
+        lc = self._log_components(x)
+        
+        # the step doesn't depend on the scale of the weights, so keep them
+        # from underflowing far from the components
+        c = np.exp(lc - lc.max(axis = 1, keepdims = True))
+        
+        a = np.einsum('nk,kij->nij', c, self.precisions)
+        b = np.einsum('nk,ki->ni', c, self._precision_means)
+        return np.linalg.solve(a, b[..., np.newaxis])[..., 0]
+        
+    def _log_components(self, x):
+        """The log of each weighted component's density at each row of x"""
+        
+        diff = x[:, np.newaxis, :] - self.means[np.newaxis, :, :]
+        m = np.einsum('nki,kij,nkj->nk', diff, self.precisions, diff)
+        return self._log_coefs - 0.5 * m
+    
+    def _chunks(self, x):
+        if len(x) == 0:
+            return [np.zeros((0, self.means.shape[1]))]
+        return (x[i:i + self._chunk_size] 
+                for i in range(0, len(x), self._chunk_size))
+    
+def _find_peaks(density, x, tol = 1e-6, max_iter = 1000):
+    """
+    Climb a :class:`_MixtureDensity` from each row of ``x`` to a local peak,
+    with mean-shift steps.  All the points move at once, until they stop 
+    moving.  Returns the peaks, and whether each climb converged.
+    """
+    
+    x = np.array(x, dtype = np.float64)
+    active = np.ones(len(x), dtype = np.bool_)
+    
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        
+        idx = np.flatnonzero(active)
+        x_new = density.mean_shift(x[idx])
+        step = np.linalg.norm(x_new - x[idx], axis = 1)
+        x[idx] = x_new
+        active[idx[step < tol]] = False
+        
+    return x, ~active
+
+def _max_tol(density, x, y, num_steps = 101):
+    """
+    For each pair of points (rows of ``x`` and ``y``), how far the density 
+    along the line between them departs from a straight line, relative to 
+    the straight line.  The line is checked at ``num_steps`` evenly spaced
+    points, all at once.
+    """
+    
+    if len(x) == 0:
+        return np.zeros(0)
+    
+    t = np.linspace(0, 1, num_steps)
+    z = x[:, np.newaxis, :] + t[np.newaxis, :, np.newaxis] * (y - x)[:, np.newaxis, :]
+    f_z = density(z.reshape(-1, x.shape[1])).reshape(len(x), num_steps)
+    
+    f_x = density(x)
+    f_y = density(y)
+    fhat_z = f_x[:, np.newaxis] + t[np.newaxis, :] * (f_y - f_x)[:, np.newaxis]
+
+    return np.abs((f_z - fhat_z) / fhat_z).max(axis = 1)
+
 @provides(IView)
 class FlowPeaks1DView(By1DView, AnnotatingView, HistogramView):
     """
@@ -156,7 +156,7 @@ class FrameStatisticOp(HasStrictTraits):
             if len(unique) == 1:
                 warn("Only one category for {}".format(b), util.CytoflowOpWarning)
                 
-        groupby = experiment.data.groupby(self.by)
+        groupby = experiment.groupby(self.by)
                         
         for group, data_subset in groupby:
             if len(data_subset) == 0:
@@ -164,7 +164,7 @@ class FrameStatisticOp(HasStrictTraits):
                      .format(group), 
                      util.CytoflowOpWarning)
         
-        idx = pd.MultiIndex.from_product([experiment[x].unique() for x in self.by], 
+        idx = pd.MultiIndex.from_product([groupby.levels[x] for x in self.by], 
                                          names = self.by)
 
         stat = pd.Series(data = self.fill,
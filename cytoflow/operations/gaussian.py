@@ -41,10 +41,11 @@ from cytoflow.views import IView, HistogramView, ScatterplotView
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .sampling import SamplingMixin
 from .base_op_views import By1DView, By2DView, AnnotatingView
 
 @provides(IOperation)
-class GaussianMixtureOp(HasStrictTraits):
+class GaussianMixtureOp(SamplingMixin, HasStrictTraits):
     """
     This module fits a Gaussian mixture model with a specified number of
     components to one or more channels.
@@ -108,6 +109,14 @@ class GaussianMixtureOp(HasStrictTraits):
         If ``True``, add columns named ``{name}_{i}_posterior`` giving the 
         posterior probability that the event is in component ``i``.  Useful for 
         filtering out low-probability events.
+
+    workers : Int (default = None)
+        How many groups (in :attr:`by`) to fit at once; see
+        :func:`~cytoflow.utility.parallel_map_arrays`.
+
+    sample_size, sample_fraction, sample_seed
+        Estimate the model from a random sample of each group's events;
+        see :class:`~.sampling.SamplingMixin`.
         
     Notes
     -----
@@ -201,6 +210,8 @@ class GaussianMixtureOp(HasStrictTraits):
     
     posteriors = Bool(False)
     
+    workers = util.CIntOrNone(None)
+    
     # the key is either a single value or a tuple
     _gmms = Dict(Any, Instance(sklearn.mixture.GaussianMixture), transient = True)
     _scale = Dict(Str, Instance(util.IScale), transient = True)
@@ -228,7 +239,7 @@ class GaussianMixtureOp(HasStrictTraits):
                                        "Must set at least one channel")
 
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                       .format(c))
@@ -241,7 +252,7 @@ class GaussianMixtureOp(HasStrictTraits):
                                            .format(c))
        
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
@@ -260,12 +271,7 @@ class GaussianMixtureOp(HasStrictTraits):
                                              "Subset string '{0}' returned no events"
                                              .format(subset))
                 
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -276,13 +282,19 @@ class GaussianMixtureOp(HasStrictTraits):
             else:
                 self._scale[c] = util.scale_factory(util.get_default_scale(), experiment, channel = c)
         
-        gmms = {}
+        groups = []
+        xs = []
             
+        self._samples = {}
         for group, data_subset in groupby:
             if len(data_subset) == 0:
                 raise util.CytoflowOpError(None,
                                            "Group {} had no data"
                                            .format(group))
+
+            # estimate from a sample of the events, if asked
+            data_subset = self._sample(group, data_subset)
+                
             x = data_subset.loc[:, self.channels[:]]
             for c in self.channels:
                 x[c] = self._scale[c](x[c])
@@ -290,36 +302,26 @@ class GaussianMixtureOp(HasStrictTraits):
             # drop data that isn't in the scale range
             for c in self.channels:
                 x = x[~(np.isnan(x[c]))]
-            x = x.values
-            
-            gmm = sklearn.mixture.GaussianMixture(n_components = self.num_components,
-                                                  covariance_type = "full",
-                                                  random_state = 1)
-            gmm.fit(x)
+                
+            # fit in double precision, even if the channels are float32 --
+            # EM on the covariances is sensitive to rounding
+            groups.append(group)
+            xs.append(x.values.astype(np.float64, copy = False))
             
+        # fit the groups in parallel
+        fits = util.parallel_map_arrays(_fit_gmm, 
+                                        xs, 
+                                        [self.num_components] * len(xs),
+                                        workers = self.workers,
+                                        executor = "process")
+        
+        gmms = {}
+        for group, gmm in zip(groups, fits):
             if not gmm.converged_:
                 raise util.CytoflowOpError(None,
                                            "Estimator didn't converge"
                                            " for group {0}"
                                            .format(group))
-                
-            # in the 1D version, we sorted the components by the means -- so
-            # the first component has the lowest mean, the second component
-            # has the next-lowest mean, etc.
-            
-            # that doesn't work in the general case.  instead, we assume that 
-            # the clusters are likely (?) to be arranged along *one* of the 
-            # axes, so we take the |norm| of the mean of each cluster and 
-            # sort that way.
-            
-            norms = np.sum(gmm.means_ ** 2, axis = 1) ** 0.5
-            sort_idx = np.argsort(norms)
-            gmm.means_ = gmm.means_[sort_idx]
-            gmm.weights_ = gmm.weights_[sort_idx]
-            gmm.covariances_ = gmm.covariances_[sort_idx]
-            gmm.precisions_ = gmm.precisions_[sort_idx]
-            gmm.precisions_cholesky_ = gmm.precisions_cholesky_[sort_idx]
-
             
             gmms[group] = gmm
             
@@ -372,7 +374,7 @@ class GaussianMixtureOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name)) 
         
-        if self.num_components > 1 and self.name in experiment.data.columns:
+        if self.num_components > 1 and self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "Experiment already has a column named {0}"
                                        .format(self.name))
@@ -380,7 +382,7 @@ class GaussianMixtureOp(HasStrictTraits):
         if self.sigma > 0:
             for i in range(1, self.num_components + 1):
                 cname = "{}_{}".format(self.name, i)
-                if cname in experiment.data.columns:
+                if cname in experiment:
                     raise util.CytoflowOpError('name',
                                                "Experiment already has a column named {}"
                                                .format(cname))
@@ -388,7 +390,7 @@ class GaussianMixtureOp(HasStrictTraits):
         if self.posteriors:
             for i in range(1, self.num_components + 1):
                 cname = "{}_{}_posterior".format(self.name, i)
-                if cname in experiment.data.columns:
+                if cname in experiment:
                     raise util.CytoflowOpError('name',
                                                "Experiment already has a column named {}"
                                                .format(cname))               
@@ -428,34 +430,38 @@ class GaussianMixtureOp(HasStrictTraits):
 #             raise util.CytoflowOpError('posteriors',
 #                                        "If num_components == 1, all posteriors will be 1.")
          
+        # each event's component (or -1 if it's not in one), in and out of
+        # each component's sigma gate, and posterior of each component.  
+        # events that aren't in any group aren't in any component.
         if self.num_components > 1:
-            event_assignments = pd.Series(["{}_None".format(self.name)] * len(experiment), dtype = "object")
+            event_assignments = np.full(len(experiment), -1, dtype = np.intp)
  
         if self.sigma > 0:
-            event_gate = {i : pd.Series([False] * len(experiment), dtype = "double")
-                           for i in range(self.num_components)}
+            event_gate = np.zeros((len(experiment), self.num_components), 
+                                  dtype = np.bool_)
+            
+            # come up with a threshold based on sigma.  you'll note we
+            # don't sqrt the distances: that's because for a multivariate 
+            # Gaussian, the square of the Mahalanobis distance is
+            # chi-square distributed
+            p = (scipy.stats.norm.cdf(self.sigma) - 0.5) * 2
+            thresh = scipy.stats.chi2.ppf(p, 1)
  
         if self.posteriors:
-            event_posteriors = {i : pd.Series([0.0] * len(experiment), dtype = "double")
-                                for i in range(self.num_components)}
+            event_posteriors = np.zeros((len(experiment), self.num_components))
 
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that
-            # contains all the events
-            groupby = experiment.data.groupby(lambda _: True)   
+        groupby = experiment.groupby(self.by)
 
         # make the statistics       
         components = [x + 1 for x in range(self.num_components)]
          
-        prop_idx = pd.MultiIndex.from_product([experiment[x].unique() for x in self.by] + [components], 
+        prop_idx = pd.MultiIndex.from_product([groupby.levels[x] for x in self.by] + [components], 
                                          names = list(self.by) + ["Component"])
         prop_stat = pd.Series(name = "{} : {}".format(self.name, "proportion"),
                               index = prop_idx, 
                               dtype = np.dtype(object)).sort_index()
                   
-        mean_idx = pd.MultiIndex.from_product([experiment[x].unique() for x in self.by] + [components] + [self.channels], 
+        mean_idx = pd.MultiIndex.from_product([groupby.levels[x] for x in self.by] + [components] + [self.channels], 
                                               names = list(self.by) + ["Component"] + ["Channel"])
         mean_stat = pd.Series(name = "{} : {}".format(self.name, "mean"),
                               index = mean_idx, 
@@ -467,7 +473,7 @@ class GaussianMixtureOp(HasStrictTraits):
                                   index = mean_idx, 
                                   dtype = np.dtype(object)).sort_index()
 
-        corr_idx = pd.MultiIndex.from_product([experiment[x].unique() for x in self.by] + [components] + [self.channels] + [self.channels], 
+        corr_idx = pd.MultiIndex.from_product([groupby.levels[x] for x in self.by] + [components] + [self.channels] + [self.channels], 
                                               names = list(self.by) + ["Component"] + ["Channel_1"] + ["Channel_2"])
         corr_stat = pd.Series(name = "{} : {}".format(self.name, "correlation"),
                               index = corr_idx, 
@@ -484,55 +490,28 @@ class GaussianMixtureOp(HasStrictTraits):
             for c in self.channels:
                 x[c] = self._scale[c](x[c])
                 
-            # which values are missing?
-
-            x_na = pd.Series([False] * len(x))
-            for c in self.channels:
-                x_na[np.isnan(x[c]).values] = True
-                        
             x = x.values
-            x_na = x_na.values
-            group_idx = groupby.groups[group]
+            
+            # which values are missing?
+            x_na = np.isnan(x).any(axis = 1)
+            
+            group_idx = groupby.indices[group]
  
             if self.num_components > 1:
-                predicted = np.full(len(x), -1, "int")
+                predicted = np.full(len(x), -1, dtype = np.intp)
                 predicted[~x_na] = gmm.predict(x[~x_na])
-                
-                predicted_str = pd.Series(["(none)"] * len(predicted))
-                for c in range(0, self.num_components):
-                    predicted_str[predicted == c] = "{0}_{1}".format(self.name, c + 1)
-                predicted_str[predicted == -1] = "{0}_None".format(self.name)
-                predicted_str.index = group_idx
-     
-                event_assignments.iloc[group_idx] = predicted_str
+                event_assignments[group_idx] = predicted
                 
             # if we're doing sigma-based gating, for each component check
             # to see if the event is in the sigma gate.
             if self.sigma > 0.0:
-                for c in range(self.num_components):
-                    s = np.linalg.pinv(gmm.covariances_[c])
-                    mu = gmm.means_[c]
-                    
-                    # compute the Mahalanobis distance
-
-                    f = lambda x, mu, s: np.dot(np.dot((x - mu).T, s), (x - mu))
-                    dist = np.apply_along_axis(f, 1, x, mu, s)
-
-                    # come up with a threshold based on sigma.  you'll note we
-                    # didn't sqrt dist: that's because for a multivariate 
-                    # Gaussian, the square of the Mahalanobis distance is
-                    # chi-square distributed
-                    
-                    p = (scipy.stats.norm.cdf(self.sigma) - 0.5) * 2
-                    thresh = scipy.stats.chi2.ppf(p, 1)
-                    
-                    event_gate[c].iloc[group_idx] = np.less_equal(dist, thresh)
+                dist = _mahalanobis_sq(x, gmm.means_, gmm.covariances_)
+                event_gate[group_idx] = np.less_equal(dist, thresh)
                     
             if self.posteriors:  
                 p = np.full((len(x), self.num_components), 0.0)
                 p[~x_na] = gmm.predict_proba(x[~x_na])
-                for c in range(self.num_components):
-                    event_posteriors[c].iloc[group_idx] = p[:, c]
+                event_posteriors[group_idx] = p
                     
             for c in range(self.num_components):
                 if len(self.by) == 0:
@@ -562,17 +541,25 @@ class GaussianMixtureOp(HasStrictTraits):
         new_experiment = experiment.clone()
           
         if self.num_components > 1:
-            new_experiment.add_condition(self.name, "category", event_assignments)
+            # component -1 is {name}_None
+            names = ["{}_{}".format(self.name, c + 1) 
+                     for c in range(self.num_components)]
+            names = np.array(names + ["{}_None".format(self.name)], 
+                             dtype = "object")
+            new_experiment.add_condition(self.name, "category", 
+                                         pd.Series(names[event_assignments]))
             
         if self.sigma > 0:
             for c in range(self.num_components):
                 gate_name = "{}_{}".format(self.name, c + 1)
-                new_experiment.add_condition(gate_name, "bool", event_gate[c])              
+                new_experiment.add_condition(gate_name, "bitset", 
+                                             pd.Series(event_gate[:, c]))
                 
         if self.posteriors:
             for c in range(self.num_components):
                 post_name = "{}_{}_posterior".format(self.name, c + 1)
-                new_experiment.add_condition(post_name, "double", event_posteriors[c])
+                new_experiment.add_condition(post_name, "double", 
+                                             pd.Series(event_posteriors[:, c]))
                 
         new_experiment.statistics[(self.name, "mean")] = pd.to_numeric(mean_stat)
         new_experiment.statistics[(self.name, "sigma")] = sigma_stat
@@ -637,6 +624,56 @@ class GaussianMixtureOp(HasStrictTraits):
             raise util.CytoflowViewError('channels',
                                          "Can't specify more than two channels for a default view")
 
+def _fit_gmm(x, num_components):
+    """Fit a gaussian mixture model to one group's events"""
+    
+    gmm = sklearn.mixture.GaussianMixture(n_components = num_components,
+                                          covariance_type = "full",
+                                          random_state = 1)
+    gmm.fit(x)
+    
+    # in the 1D version, we sorted the components by the means -- so
+    # the first component has the lowest mean, the second component
+    # has the next-lowest mean, etc.
+    
+    # that doesn't work in the general case.  instead, we assume that 
+    # the clusters are likely (?) to be arranged along *one* of the 
+    # axes, so we take the |norm| of the mean of each cluster and 
+    # sort that way.
+    
+    norms = np.sum(gmm.means_ ** 2, axis = 1) ** 0.5
+    sort_idx = np.argsort(norms)
+    gmm.means_ = gmm.means_[sort_idx]
+    gmm.weights_ = gmm.weights_[sort_idx]
+    gmm.covariances_ = gmm.covariances_[sort_idx]
+    gmm.precisions_ = gmm.precisions_[sort_idx]
+    gmm.precisions_cholesky_ = gmm.precisions_cholesky_[sort_idx]
+    
+    return gmm
+
+def _mahalanobis_sq(x, means, covariances):
+    """
+    The squared Mahalanobis distance from each row of ``x`` to each of the
+    gaussians with ``means`` and ``covariances``, as an array with one row per
+    event and one column per gaussian.  For each gaussian, finds the Cholesky
+    factor ``L`` of its covariance and solves ``L z = (x - mu)`` for all the 
+    events at once; the distance is ``|z|^2``.
+    """
+    
+    dist = np.empty((len(x), len(means)))
+    for c, (mu, cov) in enumerate(zip(means, covariances)):
+        try:
+            l = scipy.linalg.cholesky(cov, lower = True)
+            z = scipy.linalg.solve_triangular(l, (x - mu).T, lower = True,
+                                              check_finite = False)
+            dist[:, c] = np.sum(z ** 2, axis = 0)
+        except np.linalg.LinAlgError:
+            # not positive-definite; fall back to the pseudo-inverse
+            d = x - mu
+            dist[:, c] = np.einsum('ij,jk,ik->i', d, np.linalg.pinv(cov), d)
+            
+    return dist
+
 @provides(IView)
 class GaussianMixture1DView(By1DView, AnnotatingView, HistogramView):
     """
@@ -38,9 +38,10 @@ from .base_op_views import By1DView, AnnotatingView
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .sampling import SamplingMixin
 
 @provides(IOperation)
-class GaussianMixture1DOp(HasStrictTraits):
+class GaussianMixture1DOp(SamplingMixin, HasStrictTraits):
     """
     This module fits a Gaussian mixture model with a specified number of
     components to a channel.
@@ -106,6 +107,10 @@ class GaussianMixture1DOp(HasStrictTraits):
         If `True`, add a column named `{Name}_Posterior` giving the posterior
         probability that the event is in the component to which it was
         assigned.  Useful for filtering out low-probability events.
+
+    sample_size, sample_fraction, sample_seed
+        Estimate the model from a random sample of each group's events;
+        see :class:`~.sampling.SamplingMixin`.
         
         
     Examples
@@ -200,13 +205,13 @@ class GaussianMixture1DOp(HasStrictTraits):
         if experiment is None:
             raise util.CytoflowOpError('experiment', "No experiment specified")
 
-        if self.channel not in experiment.data:
+        if self.channel not in experiment:
             raise util.CytoflowOpError('channel',
                                        "Column {0} not found in the experiment"
                                        .format(self.channel))
        
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
@@ -229,13 +234,7 @@ class GaussianMixture1DOp(HasStrictTraits):
                                            "Subset string '{0}' returned no events"
                                            .format(subset))
                 
-        if self.by:
-            by = sorted(self.by)
-            groupby = experiment.data.groupby(by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(sorted(self.by))
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -244,10 +243,15 @@ class GaussianMixture1DOp(HasStrictTraits):
         
         gmms = {}
             
+        self._samples = {}
         for group, data_subset in groupby:
             if len(data_subset) == 0:
                 raise util.CytoflowOpError(None, 
                                            "Group {} had no data".format(group))
+
+            # estimate from a sample of the events, if asked
+            data_subset = self._sample(group, data_subset)
+                
             x = data_subset[self.channel].reset_index(drop = True)
             x = self._scale(x)
             
@@ -333,7 +337,7 @@ class GaussianMixture1DOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name))  
 
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "Experiment already has a column named {0}"
                                        .format(self.name))
@@ -347,20 +351,20 @@ class GaussianMixture1DOp(HasStrictTraits):
             raise util.CytoflowOpError(None,
                                        "Couldn't find _scale.  What happened??")
 
-        if self.channel not in experiment.data:
+        if self.channel not in experiment:
             raise util.CytoflowOpError('channel',
                                        "Column {0} not found in the experiment"
                                        .format(self.channel))
 
         if self.posteriors:
             col_name = "{0}_Posterior".format(self.name)
-            if col_name in experiment.data:
+            if col_name in experiment:
                 raise util.CytoflowOpError('posteriors',
                                            "Column {0} already found in the experiment"
                               .format(col_name))
        
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
@@ -370,13 +374,7 @@ class GaussianMixture1DOp(HasStrictTraits):
             raise util.CytoflowOpError('sigma',
                                        "sigma must be >= 0.0")
 
-        if self.by:
-            by = sorted(self.by)
-            groupby = experiment.data.groupby(by)
-        else:
-            # use a lambda expression to return a group that
-            # contains all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(sorted(self.by))
 
         event_assignments = pd.Series([None] * len(experiment), dtype = "object")
                                       
@@ -447,7 +445,7 @@ class GaussianMixture1DOp(HasStrictTraits):
         new_experiment = experiment.clone()
         
         if self.num_components == 1 and self.sigma > 0:
-            new_experiment.add_condition(self.name, "bool", event_assignments == "{0}_1".format(self.name))
+            new_experiment.add_condition(self.name, "bitset", event_assignments == "{0}_1".format(self.name))
         elif self.num_components > 1:
             new_experiment.add_condition(self.name, "category", event_assignments)
             
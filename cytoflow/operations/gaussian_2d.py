@@ -36,10 +36,11 @@ from cytoflow.views import IView, ScatterplotView
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .sampling import SamplingMixin
 from .base_op_views import By2DView, AnnotatingView
 
 @provides(IOperation)
-class GaussianMixture2DOp(HasStrictTraits):
+class GaussianMixture2DOp(SamplingMixin, HasStrictTraits):
     """
     This module fits a 2D Gaussian mixture model with a specified number of
     components to a pair of channels.
@@ -112,6 +113,10 @@ class GaussianMixture2DOp(HasStrictTraits):
         probability that the event is in the component to which it was
         assigned.  Useful for filtering out low-probability events.
 
+    sample_size, sample_fraction, sample_seed
+        Estimate the model from a random sample of each group's events;
+        see :class:`~.sampling.SamplingMixin`.
+
     
     Examples
     --------
@@ -212,18 +217,18 @@ class GaussianMixture2DOp(HasStrictTraits):
             raise util.CytoflowOpError('experiment',
                                        "No experiment specified")
 
-        if self.xchannel not in experiment.data:
+        if self.xchannel not in experiment:
             raise util.CytoflowOpError('xchannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.xchannel))
             
-        if self.ychannel not in experiment.data:
+        if self.ychannel not in experiment:
             raise util.CytoflowOpError('ychannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.ychannel))
        
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
@@ -246,12 +251,7 @@ class GaussianMixture2DOp(HasStrictTraits):
                                            "Subset string '{0}' returned no events"
                                            .format(subset))
                 
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -261,11 +261,16 @@ class GaussianMixture2DOp(HasStrictTraits):
         
         gmms = {}
             
+        self._samples = {}
         for group, data_subset in groupby:
             if len(data_subset) == 0:
                 raise util.CytoflowOpError(None,
                                            "Group {} had no data"
                                            .format(group))
+
+            # estimate from a sample of the events, if asked
+            data_subset = self._sample(group, data_subset)
+                
             x = data_subset.loc[:, [self.xchannel, self.ychannel]]
             x[self.xchannel] = self._xscale(x[self.xchannel])
             x[self.ychannel] = self._yscale(x[self.ychannel])
@@ -357,7 +362,7 @@ class GaussianMixture2DOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name))  
 
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "Experiment already has a column named {0}"
                                        .format(self.name))
@@ -375,25 +380,25 @@ class GaussianMixture2DOp(HasStrictTraits):
             raise util.CytoflowOpError(None,
                                        "Couldn't find _yscale.  What happened??")
 
-        if self.xchannel not in experiment.data:
+        if self.xchannel not in experiment:
             raise util.CytoflowOpError('xchannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.xchannel))
 
-        if self.ychannel not in experiment.data:
+        if self.ychannel not in experiment:
             raise util.CytoflowOpError('ychannel',
                                        "Column {0} not found in the experiment"
                                        .format(self.ychannel))
             
         if self.posteriors:
             col_name = "{0}_Posterior".format(self.name)
-            if col_name in experiment.data:
+            if col_name in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Column {0} already found in the experiment"
                                            .format(col_name))
        
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
@@ -413,12 +418,7 @@ class GaussianMixture2DOp(HasStrictTraits):
         # the faster it's going to be.  for example, this is why
         # we don't use Ellipse.contains().  
         
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that
-            # contains all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
         
         for group, data_subset in groupby:
             if group not in self._gmms:
@@ -510,7 +510,7 @@ class GaussianMixture2DOp(HasStrictTraits):
         new_experiment = experiment.clone()
         
         if self.num_components == 1 and self.sigma > 0:
-            new_experiment.add_condition(self.name, "bool", event_assignments == "{0}_1".format(self.name))
+            new_experiment.add_condition(self.name, "bitset", event_assignments == "{0}_1".format(self.name))
         elif self.num_components > 1:
             new_experiment.add_condition(self.name, "category", event_assignments)
             
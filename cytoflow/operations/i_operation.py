@@ -90,6 +90,76 @@ class IOperation(Interface):
             parameters.
         """
         
+    def prepare_chunks(self, experiment):
+        """
+        Get ready to apply this operation to ``experiment`` a block of events
+        at a time.  Optional; operations that work on each event by itself 
+        (gates, compensation, etc.) implement it, along with 
+        :meth:`apply_chunk` and :meth:`finish_chunks`, so 
+        :func:`.apply_chunked` can stream the events through them without
+        making full-length temporary arrays.
+        
+        Parameters
+        ----------
+        experiment : Experiment
+            the :class:`.Experiment` this op will be applied to
+            
+        Returns
+        -------
+        Any
+            The state that :meth:`apply_chunk` and :meth:`finish_chunks` need 
+            (scales, matrices, etc.).
+            
+        Raises
+        ------
+        CytoflowOpException
+            If the operation can't be be completed because of bad op
+            parameters -- the same as :meth:`apply`.
+        """
+        
+    def apply_chunk(self, block, state):
+        """
+        Apply this operation to one block of events.  Optional; see
+        :meth:`prepare_chunks`.
+        
+        Parameters
+        ----------
+        block : pandas.DataFrame
+            Some of the events, with the same index as :attr:`.Experiment.data`
+            
+        state : Any
+            The state returned by :meth:`prepare_chunks`
+            
+        Returns
+        -------
+        pandas.DataFrame
+            The columns that this operation adds (or changes), for the events
+            in ``block``.  Operations that remove events leave them out.
+        """
+        
+    def finish_chunks(self, experiment, result, state):
+        """
+        Make the new :class:`.Experiment` from the blocks' results.  Optional;
+        see :meth:`prepare_chunks`.
+        
+        Parameters
+        ----------
+        experiment : Experiment
+            the :class:`.Experiment` this op was applied to
+            
+        result : pandas.DataFrame
+            The results from :meth:`apply_chunk`, concatenated
+            
+        state : Any
+            The state returned by :meth:`prepare_chunks`
+            
+        Returns
+        -------
+        Experiment
+            the old :class:`.Experiment` with this operation applied, just
+            like :meth:`apply` returns
+        """
+        
     def default_view(self, **kwargs):
         """
         Many operations have a "default" view.  This can either be a diagnostic
@@ -22,11 +22,12 @@ cytoflow.operations.import_op
 -----------------------------
 '''
 
-import warnings, math
+import os, warnings, math
+from itertools import repeat
+from functools import lru_cache
 from traits.api import (HasTraits, HasStrictTraits, provides, Str, List, Any,
                         Dict, File, Constant, Enum, Int, Instance)
 
-import fcsparser
 import numpy as np
 from pathlib import Path
 
@@ -35,46 +36,7 @@ import cytoflow.utility as util
 from ..experiment import Experiment
 from .i_operation import IOperation
 
-from pandas import DataFrame
-
-# override fcsparser's broken fromfile
-import numpy
-def _fromfile(file, dtype, count, *args, **kwargs):
-
-    dtypes = dtype.split(',')
-    field_width = []
-    
-    for dt in dtypes:
-        num_bytes = int(dt[2:])
-        field_width.append(num_bytes)
-        
-    try:
-        ret = numpy.fromfile(file, 
-                             dtype=",".join(['u1'] * sum(field_width)), 
-                             count=count, 
-                             *args, 
-                             **kwargs)
-    except (TypeError, IOError):
-        ret = numpy.frombuffer(file.read(count * sum(field_width)),
-                               dtype=",".join(['u1'] * sum(field_width)), 
-                               count=count, 
-                               *args, 
-                               **kwargs)
-
-    ret = ret.view('u1').reshape((count, sum(field_width)))
-    ret_dtypes = []
-    for field, dt in enumerate(dtypes):
-        dtype_type = dt[1]
-        dtype_endian = dt[0]
-        num_bytes = int(dt[2:])
-        while num_bytes & (num_bytes - 1) != 0:
-            ret = np.insert(ret, sum(field_width[0:field]), np.zeros(count), axis = 1)
-            num_bytes = num_bytes + 1
-        ret_dtypes.append(dtype_endian + dtype_type + str(num_bytes))
-
-    return ret.view(','.join(ret_dtypes)).ravel()
-    
-fcsparser.api.fromfile = _fromfile
+from pandas import DataFrame, RangeIndex
 
 class Tube(HasTraits):
     """
@@ -166,7 +128,19 @@ class ImportOp(HasStrictTraits):
         If not None, import only a random subset of events of size :attr:`events`. 
         Presumably the analysis will go faster but less precisely; good for
         interactive data exploration.  Then, unset :attr:`events` and re-run
-        the analysis non-interactively.
+        the analysis non-interactively.  Only the events that are kept are
+        read from the FCS files, so this makes importing big files faster, too.
+        
+    sampling : {"random", "stride", "first"} (default = "random")
+        How to choose the subset of events, if :attr:`events` is set.
+        ``random`` chooses events uniformly at random (without replacement); 
+        ``stride`` takes evenly-spaced events; ``first`` takes the first
+        :attr:`events` events in each tube.
+        
+    seed : Int (default = None)
+        If set, the seed for the random number generator that chooses
+        events when :attr:`sampling` is ``random``, so the import is 
+        reproducible.  If ``None``, use :mod:`numpy`'s global random state.
         
     name_metadata : {None, "$PnN", "$PnS"} (default = None)
         Which FCS metadata is the channel name?  If ``None``, attempt to  
@@ -181,6 +155,36 @@ class ImportOp(HasStrictTraits):
         would like to use.  This will be used for *all FCS files imported by
         this operation.*
             
+    workers : Int (default = None)
+        How many FCS files to parse at once.  If ``None``, use the default set
+        by :func:`~cytoflow.set_default_workers` (which is ``1``, ie parse them
+        one after another, unless you change it.)  If ``0``, use one worker per
+        CPU.  The tubes are still added to the :class:`.Experiment` in the 
+        order they appear in :attr:`tubes`.
+
+    cache_dir : Str (default = "")
+        If set, keep a cache of decoded FCS files in this directory.  The
+        next time the same (unchanged) file is imported, its events are 
+        memory-mapped from the cache instead of being decoded again.  
+        
+    cache_size : Float (default = 4096)
+        The maximum size of the cache in :attr:`cache_dir`, in megabytes. 
+        Whenever the cache is used and is larger than this (including after
+        you lower it), the least-recently-used files are removed from it.
+        
+    channel_dtype : {"float64", "float32"} (default = "float64")
+        How to store the channels in the new :class:`.Experiment` (see
+        :attr:`.Experiment.channel_dtype`.)  ``float32`` halves the memory
+        the events take up, and the events are decoded straight into it.
+        It's precise enough for instruments that record 32-bit floats or
+        integers of up to 24 bits.
+        
+    scratch_dir : Str (default = "")
+        If set, keep the new :class:`.Experiment`'s events in memory-mapped
+        files in this directory instead of in memory (see 
+        :meth:`.Experiment.set_scratch_dir`), so you can import experiments 
+        that are larger than memory.
+            
     ignore_v : List(Str)
         :class:`cytoflow` is designed to operate on an :class:`.Experiment` containing
         tubes that were all collected under the same instrument settings.
@@ -228,6 +232,21 @@ class ImportOp(HasStrictTraits):
     # are we subsetting?
     events = util.CIntOrNone(None)
     coarse_events = util.Deprecated(new = 'events')
+    sampling = Enum("random", "stride", "first")
+    seed = util.CIntOrNone(None)
+        
+    # how many tubes do we parse at once?
+    workers = util.CIntOrNone(None)
+    
+    # where do we cache decoded tubes, and how big can the cache get (in MB)?
+    cache_dir = Str
+    cache_size = util.PositiveCFloat(4096, allow_zero = False)
+    
+    # how do we store the channels?
+    channel_dtype = Enum("float64", "float32")
+    
+    # where do we keep the events, if not in memory?
+    scratch_dir = Str
         
     # DON'T DO THIS
     ignore_v = List(Str)
@@ -302,7 +321,10 @@ class ImportOp(HasStrictTraits):
                                                "tube {0} and tube {1}"
                                                .format(i.file, j.file))
         
-        experiment = Experiment()
+        experiment = Experiment(channel_dtype = self.channel_dtype)
+        
+        if self.scratch_dir:
+            experiment.set_scratch_dir(self.scratch_dir)
         
         experiment.metadata["ignore_v"] = self.ignore_v
             
@@ -316,10 +338,9 @@ class ImportOp(HasStrictTraits):
                 # we'll figure that out below
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    tube0_meta = fcsparser.parse(self.tubes[0].file,
-                                                 data_set = self.data_set,
-                                                 meta_data_only = True,
-                                                 reformat_meta = True)
+                    tube0_meta = _read_tube_metadata(self.tubes[0].file,
+                                                     data_set = self.data_set,
+                                                     reformat_meta = True)
             except Exception as e:
                 raise util.CytoflowOpError('tubes',
                                            "FCS reader threw an error reading metadata "
@@ -377,37 +398,71 @@ class ImportOp(HasStrictTraits):
                 
                                 
         experiment.metadata['fcs_metadata'] = {}
+        
         for tube in self.tubes:
-            if (tube.file and tube.frame != None):
+            if (tube.file and tube.frame is not None):
                 raise util.CytoflowError("Both a DataFrame and an FCS file were specified, "
                                          "tube with file {0} and conditions {1}".format(tube.file,tube.conditions))
-            elif (tube.file and tube.frame == None):
-                if metadata_only:
-                    tube_meta, tube_data = parse_tube(tube.file,
-                                                      experiment,
-                                                      data_set = self.data_set,
-                                                      metadata_only = True)
-                else:
-                    tube_meta, tube_data = parse_tube(tube.file, 
-                                                      experiment, 
-                                                      data_set = self.data_set)
-    
+                
+        # check each tube's metadata against the experiment, then parse the
+        # FCS files -- in parallel, if we've been asked to.  the results come 
+        # back in tube order, and errors are raised for the first bad tube.
+        tube_files = [tube.file for tube in self.tubes if tube.file]
+        
+        for tube_file in tube_files:
+            check_tube(tube_file, experiment, data_set = self.data_set)
+            
+        # if we're subsetting, choose which events to keep before we parse
+        # the tubes, so only those events are read.  (and so the choice only
+        # depends on the seed, not on the order that the workers finish.)
+        rng = np.random.RandomState(self.seed) if self.seed is not None else np.random
+        tube_rows = []
+        
+        for tube in self.tubes:
+            if not self.events or metadata_only:
+                tube_rows.append(None)
+                continue
+            
+            if tube.file:
+                tube_events = int(_read_tube_metadata(tube.file, data_set = self.data_set)['$TOT'])
+            else:
+                tube_events = len(tube.frame)
+                
+            if self.events <= tube_events:
+                tube_rows.append(_choose_events(tube_events, self.events, self.sampling, rng))
+            else:
+                warnings.warn("Only {0} events in tube {1}"
+                              .format(tube_events, tube.file),
+                              util.CytoflowWarning)
+                tube_rows.append(None)
+            
+        parsed_tubes = util.parallel_map(_parse_tube,
+                                         tube_files,
+                                         repeat(experiment.metadata["name_metadata"]),
+                                         repeat(self.data_set),
+                                         repeat(metadata_only),
+                                         repeat(self.cache_dir),
+                                         repeat(self.cache_size),
+                                         [rows for tube, rows in zip(self.tubes, tube_rows) if tube.file],
+                                         repeat(self.channel_dtype),
+                                         workers = self.workers)
+        parsed_tubes = iter(parsed_tubes)
+        
+        # collect all the tubes' events, then add them to the experiment in
+        # one go (instead of copying the experiment's data once per tube.)
+        new_events = []
+        
+        for tube, rows in zip(self.tubes, tube_rows):
+            if tube.file:
+                tube_meta, tube_data = next(parsed_tubes)
             elif (not tube.file and not tube.frame.empty):
                 tube_meta = {} # probably incorrect --tsj
                 tube_data = tube.frame
-                
-            
-            if self.events:
-                if self.events <= len(tube_data):
-                    tube_data = tube_data.loc[np.random.choice(tube_data.index,
-                                                               self.events,
-                                                               replace = False)]
-                else:
-                    warnings.warn("Only {0} events in tube {1}"
-                                  .format(len(tube_data), tube.file),
-                                  util.CytoflowWarning)
+                if rows is not None:
+                    tube_data = tube_data.iloc[rows]
     
-            experiment.add_events(tube_data[channels], tube.conditions)
+            if tube_data is not None:
+                new_events.append((tube_data[channels], tube.conditions))
                         
             # extract the row and column from wells collected on a 
             # BD HTS
@@ -432,6 +487,9 @@ class ImportOp(HasStrictTraits):
             tube_meta['CF_File'] = Path(tube.file).stem
                              
             experiment.metadata['fcs_metadata'][tube.file] = tube_meta
+            
+        experiment.add_events_batch(new_events)
+        del new_events
                  
 #         import sys;sys.path.append(r'/home/brian/.p2/pool/plugins/org.python.pydev_6.1.0.201711051306/pysrc')
 #         import pydevd;pydevd.settrace()
@@ -441,7 +499,7 @@ class ImportOp(HasStrictTraits):
                 new_name = self.channels[channel]
                 if channel == new_name:
                     continue
-                experiment.data.rename(columns = {channel : new_name}, inplace = True)
+                experiment.rename_column(channel, new_name)
                 experiment.metadata[new_name] = experiment.metadata[channel]
                 experiment.metadata[new_name]["fcs_name"] = channel
                 del experiment.metadata[channel]
@@ -460,7 +518,7 @@ class ImportOp(HasStrictTraits):
                         for _ in range(1, range_bits):
                             mask = mask << 1 | 1
 
-                        experiment.data[channel] = experiment.data[channel].values.astype('int') & mask
+                        experiment[channel] = experiment[channel].values.astype('int') & mask
 
                 # re-scale the data to linear if if's recorded as log-scaled with
                 # integer channels
@@ -492,11 +550,10 @@ def check_tube(filename, experiment, data_set = 0):
     ignore_v = experiment.metadata['ignore_v']
     
     try:
-        tube_meta = fcsparser.parse( filename, 
-                                     channel_naming = experiment.metadata["name_metadata"],
-                                     data_set = data_set,
-                                     meta_data_only = True,
-                                     reformat_meta = True)
+        tube_meta = _read_tube_metadata(filename, 
+                                        data_set = data_set,
+                                        channel_naming = experiment.metadata["name_metadata"],
+                                        reformat_meta = True)
     except Exception as e:
         raise util.CytoflowError("FCS reader threw an error reading metadata "
                                  "for tube {0}"
@@ -534,10 +591,9 @@ def autodetect_name_metadata(filename, data_set = 0):
     try:
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            metadata = fcsparser.parse(filename,
-                                       data_set = data_set,
-                                       meta_data_only = True,
-                                       reformat_meta = True)
+            metadata = _read_tube_metadata(filename,
+                                           data_set = data_set,
+                                           reformat_meta = True)
     except Exception as e:
         warnings.warn("Trouble getting metadata from {}: {}".format(filename, str(e)),
                       util.CytoflowWarning)
@@ -574,6 +630,151 @@ def autodetect_name_metadata(filename, data_set = 0):
     return name_metadata
     
 
+def iter_tube_chunks(filename, chunk_events = 1000000, name_metadata = None,
+                     data_set = 0, dtype = "float64"):
+    """
+    Read the events in an FCS file a block at a time, instead of all at once,
+    so files larger than memory can be processed.
+    
+    Parameters
+    ----------
+    filename : Str
+        The FCS file to read.
+        
+    chunk_events : Int (default = 1000000)
+        How many events in each block.  The last block may be smaller.
+        
+    name_metadata : {None, "$PnN", "$PnS"} (default = None)
+        Which FCS metadata is the channel name?  If ``None``, attempt to  
+        autodetect, as :class:`ImportOp` does.
+        
+    data_set : Int (default = 0)
+        Which data set to read, if the file has more than one (linked by 
+        ``$NEXTDATA``.)
+        
+    dtype : {"float64", "float32"} (default = "float64")
+        The type of the channels.
+        
+    Yields
+    ------
+    pandas.DataFrame
+        The events, with one ``dtype`` column per channel.  The blocks' 
+        indices are consecutive, so :func:`pandas.concat` of all the blocks
+        is the whole data set.
+        
+    Examples
+    --------
+    >>> means = []
+    >>> for chunk in iter_tube_chunks('RFP_Well_A3.fcs', chunk_events = 10000):
+    ...     means.append(chunk['Y2-A'].mean())
+    """
+    
+    if name_metadata is None:
+        name_metadata = autodetect_name_metadata(filename, data_set = data_set)
+        
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            tube_meta = _read_tube_metadata(filename, data_set = data_set)
+            channels = list(util.fcs_channel_names(tube_meta, name_metadata))
+    except Exception as e:
+        raise util.CytoflowError("FCS reader threw an error reading metadata "
+                                 "for tube {}".format(filename)) from e
+        
+    first = 0
+    for chunk in util.iter_fcs_data(filename, tube_meta, 
+                                    chunk_events = chunk_events,
+                                    dtype = dtype):
+        yield DataFrame(chunk, 
+                        columns = channels,
+                        index = RangeIndex(first, first + len(chunk)),
+                        copy = False)
+        first += len(chunk)
+
+def _choose_events(n_events, events, sampling, rng):
+    """
+    Choose ``events`` of ``n_events`` events (``events <= n_events``) using
+    ``sampling`` ("random", "stride" or "first").  Returns the sorted indices.
+    """
+    
+    if sampling == "random":
+        return np.sort(rng.choice(n_events, events, replace = False))
+    elif sampling == "stride":
+        return np.arange(events) * (n_events // events)
+    elif sampling == "first":
+        return np.arange(events)
+    else:
+        raise util.CytoflowError("Unknown sampling method {}".format(sampling))
+
+def _read_tube_metadata(filename, data_set = 0, channel_naming = '$PnS', 
+                        reformat_meta = False):
+    """
+    Read (only) the HEADER and TEXT segments of an FCS file.  Within one 
+    import, the same file is looked at several times -- so the results are
+    memoized on the file's path, size and modification time, and a file that
+    has changed on disk is read again.
+    
+    Returns a new dictionary every time, so the caller is free to modify it.
+    """
+    
+    stat = os.stat(filename)
+    meta = _read_text_memo(os.path.abspath(filename), 
+                           stat.st_size, 
+                           stat.st_mtime_ns, 
+                           data_set)
+    
+    meta = dict(meta)
+    meta['__header__'] = dict(meta['__header__'])
+    
+    if reformat_meta:
+        util.reformat_fcs_metadata(meta, channel_naming)
+        
+    return meta
+
+@lru_cache(maxsize = 256)
+def _read_text_memo(path, size, mtime, data_set):
+    return util.read_fcs_metadata(path, data_set = data_set)
+
+def _read_tube_data(filename, data_set = 0, cache_dir = None, cache_size = None,
+                    rows = None, dtype = "float64"):
+    """
+    Read an FCS file's metadata and events (as ``dtype``) -- from the cache in 
+    ``cache_dir``, if it's there.  If it's not, add it.  Either way, keep the
+    cache smaller than ``cache_size`` megabytes.  If ``rows`` is set, only return 
+    those events; if they're not in the cache, only those events are read 
+    (and the cache is left alone.)
+    """
+    
+    if not cache_dir:
+        tube_meta = _read_tube_metadata(filename, data_set = data_set)
+        return tube_meta, util.read_fcs_data(filename, tube_meta, rows = rows,
+                                             dtype = dtype)
+    
+    key = util.fcs_cache_key(filename, data_set = data_set)
+    
+    # the cache keeps float64 and float32 copies separately -- converting
+    # one to the other would lose precision or waste space
+    if dtype != "float64":
+        key = key + "-" + dtype
+        
+    max_size = int(cache_size * 1024 * 1024) if cache_size else None
+    cached = util.load_fcs_cache(cache_dir, key, max_size = max_size)
+    if cached is not None:
+        tube_meta, tube_data = cached
+        if rows is not None:
+            tube_data = np.asfortranarray(tube_data[rows])
+        return tube_meta, tube_data
+    
+    tube_meta = _read_tube_metadata(filename, data_set = data_set)
+    if rows is not None:
+        return tube_meta, util.read_fcs_data(filename, tube_meta, rows = rows,
+                                             dtype = dtype)
+    
+    tube_data = util.read_fcs_data(filename, tube_meta, dtype = dtype)
+    util.save_fcs_cache(cache_dir, key, tube_meta, tube_data, max_size = max_size)
+    
+    return tube_meta, tube_data
+
 # module-level, so we can reuse it in other modules
 def parse_tube(filename, experiment = None, data_set = 0, metadata_only = False):   
         
@@ -583,25 +784,28 @@ def parse_tube(filename, experiment = None, data_set = 0, metadata_only = False)
     else:
         name_metadata = '$PnS'
         
+    return _parse_tube(filename, name_metadata, data_set, metadata_only)
+        
+# module-level, so we can parse tubes in a process pool
+def _parse_tube(filename, name_metadata, data_set = 0, metadata_only = False,
+                cache_dir = None, cache_size = None, rows = None, 
+                dtype = "float64"):
          
     try:
         if metadata_only:
             tube_data = None
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")
-                tube_meta = fcsparser.parse(
-                                filename, 
-                                meta_data_only = True,
-                                data_set = data_set,
-                                channel_naming = name_metadata)
+                tube_meta = _read_tube_metadata(filename, data_set = data_set)
         else:
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")
-                tube_meta, tube_data = fcsparser.parse(
-                                        filename, 
-                                        meta_data_only = metadata_only,
-                                        data_set = data_set,
-                                        channel_naming = name_metadata)
+                tube_meta, tube_data = _read_tube_data(filename, data_set,
+                                                       cache_dir, cache_size,
+                                                       rows, dtype)
+                tube_data = DataFrame(tube_data,
+                                      columns = util.fcs_channel_names(tube_meta, name_metadata),
+                                      copy = False)
     except Exception as e:
         raise util.CytoflowError("FCS reader threw an error reading data for tube {}"
                                  .format(filename)) from e
@@ -609,5 +813,3 @@ def parse_tube(filename, experiment = None, data_set = 0, metadata_only = False)
     del tube_meta['__header__']
             
     return tube_meta, tube_data
-
-
@@ -35,10 +35,11 @@ from cytoflow.views import IView, HistogramView, ScatterplotView
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .sampling import SamplingMixin
 from .base_op_views import By1DView, By2DView, AnnotatingView
 
 @provides(IOperation)
-class KMeansOp(HasStrictTraits):
+class KMeansOp(SamplingMixin, HasStrictTraits):
     """
     Use a K-means clustering algorithm to cluster events.  
     
@@ -75,7 +76,14 @@ class KMeansOp(HasStrictTraits):
         ``Time`` and ``Dox``, setting :attr:`by` to ``["Time", "Dox"]`` will 
         fit the model separately to each subset of the data with a unique 
         combination of ``Time`` and ``Dox``.
-  
+
+    workers : Int (default = None)
+        How many groups (in :attr:`by`) to fit at once; see
+        :func:`~cytoflow.utility.parallel_map_arrays`.
+
+    sample_size, sample_fraction, sample_seed
+        Estimate the clusters from a random sample of each group's events;
+        see :class:`~.sampling.SamplingMixin`.
     
     Examples
     --------
@@ -142,6 +150,7 @@ class KMeansOp(HasStrictTraits):
     scale = Dict(Str, util.ScaleEnum)
     num_clusters = util.PositiveInt(allow_zero = False)
     by = List(Str)
+    workers = util.CIntOrNone(None)
     
     _kmeans = Dict(Any, Instance(sklearn.cluster.MiniBatchKMeans), transient = True)
     _scale = Dict(Str, Instance(util.IScale), transient = True)
@@ -173,7 +182,7 @@ class KMeansOp(HasStrictTraits):
                                        "Must set at least one channel")
 
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                       .format(c))
@@ -186,7 +195,7 @@ class KMeansOp(HasStrictTraits):
                                            .format(c))
        
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
@@ -205,12 +214,7 @@ class KMeansOp(HasStrictTraits):
                                            "Subset string '{0}' returned no events"
                                            .format(subset))
                 
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -221,11 +225,19 @@ class KMeansOp(HasStrictTraits):
             else:
                 self._scale[c] = util.scale_factory(util.get_default_scale(), experiment, channel = c)
                     
+        groups = []
+        xs = []
+                    
+        self._samples = {}
         for group, data_subset in groupby:
             if len(data_subset) == 0:
                 raise util.CytoflowOpError('by',
                                            "Group {} had no data"
                                            .format(group))
+
+            # estimate from a sample of the events, if asked
+            data_subset = self._sample(group, data_subset)
+                
             x = data_subset.loc[:, self.channels[:]]
             for c in self.channels:
                 x[c] = self._scale[c](x[c])
@@ -233,13 +245,19 @@ class KMeansOp(HasStrictTraits):
             # drop data that isn't in the scale range
             for c in self.channels:
                 x = x[~(np.isnan(x[c]))]
-            x = x.values
-            
-            self._kmeans[group] = kmeans = \
-                sklearn.cluster.MiniBatchKMeans(n_clusters = self.num_clusters,
-                                                random_state = 0)
+                
+            groups.append(group)
+            xs.append(x.values)
             
-            kmeans.fit(x)
+        # fit the groups in parallel
+        fits = util.parallel_map_arrays(_fit_kmeans,
+                                        xs,
+                                        [self.num_clusters] * len(xs),
+                                        workers = self.workers,
+                                        executor = "process")
+        
+        for group, kmeans in zip(groups, fits):
+            self._kmeans[group] = kmeans
                                                  
          
     def apply(self, experiment):
@@ -274,7 +292,7 @@ class KMeansOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name)) 
          
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "Experiment already has a column named {0}"
                                        .format(self.name))
@@ -289,7 +307,7 @@ class KMeansOp(HasStrictTraits):
                                        "Must set at least one channel")
  
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                       .format(c))
@@ -302,26 +320,21 @@ class KMeansOp(HasStrictTraits):
                                            .format(c))
         
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
                                            .format(b, experiment.conditions))
         
                  
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
                  
         event_assignments = pd.Series(["{}_None".format(self.name)] * len(experiment), dtype = "object")
          
         # make the statistics       
         clusters = [x + 1 for x in range(self.num_clusters)]
           
-        idx = pd.MultiIndex.from_product([experiment[x].unique() for x in self.by] + [clusters] + [self.channels], 
+        idx = pd.MultiIndex.from_product([groupby.levels[x] for x in self.by] + [clusters] + [self.channels], 
                                          names = list(self.by) + ["Cluster"] + ["Channel"])
         centers_stat = pd.Series(index = idx, dtype = np.dtype(object)).sort_index()
                      
@@ -434,6 +447,14 @@ class KMeansOp(HasStrictTraits):
             raise util.CytoflowViewError('channels',
                                          "Can't specify more than two channels for a default view")
     
+def _fit_kmeans(x, num_clusters):
+    """Fit the k-means clusters to one group's events"""
+    
+    kmeans = sklearn.cluster.MiniBatchKMeans(n_clusters = num_clusters,
+                                             random_state = 0)
+    kmeans.fit(x)
+    return kmeans
+
 @provides(IView)
 class KMeans1DView(By1DView, AnnotatingView, HistogramView):
     """
@@ -32,9 +32,10 @@ import sklearn.decomposition
 
 import cytoflow.utility as util
 from .i_operation import IOperation
+from .sampling import SamplingMixin
 
 @provides(IOperation)
-class PCAOp(HasStrictTraits):
+class PCAOp(SamplingMixin, HasStrictTraits):
     """
     Use principal components analysis (PCA) to decompose a multivariate data
     set into orthogonal components that explain a maximum amount of variance.
@@ -77,6 +78,14 @@ class PCAOp(HasStrictTraits):
         Scale each component to unit variance?  May be useful if you will
         be using unsupervized clustering (such as K-means).
 
+    workers : Int (default = None)
+        How many groups (in :attr:`by`) to fit at once; see
+        :func:`~cytoflow.utility.parallel_map_arrays`.
+
+    sample_size, sample_fraction, sample_seed
+        Estimate the components from a random sample of each group's events;
+        see :class:`~.sampling.SamplingMixin`.
+
     Examples
     --------
     
@@ -161,6 +170,7 @@ class PCAOp(HasStrictTraits):
     num_components = util.PositiveInt(2, allow_zero = False)
     whiten = Bool(False)
     by = List(Str)
+    workers = util.CIntOrNone(None)
     
     _pca = Dict(Any, Any, transient = True)
     _scale = Dict(Str, Instance(util.IScale), transient = True)
@@ -189,7 +199,7 @@ class PCAOp(HasStrictTraits):
                                        "Must set at least one channel")
 
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                       .format(c))
@@ -207,7 +217,7 @@ class PCAOp(HasStrictTraits):
                                            .format(c))
        
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
@@ -226,12 +236,7 @@ class PCAOp(HasStrictTraits):
                                            "Subset string '{0}' returned no events"
                                            .format(subset))
                 
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -242,11 +247,19 @@ class PCAOp(HasStrictTraits):
             else:
                 self._scale[c] = util.scale_factory(util.get_default_scale(), experiment, channel = c)
                     
+        groups = []
+        xs = []
+                    
+        self._samples = {}
         for group, data_subset in groupby:
             if len(data_subset) == 0:
                 raise util.CytoflowOpError('by',
                                            "Group {} had no data"
                                            .format(group))
+
+            # estimate from a sample of the events, if asked
+            data_subset = self._sample(group, data_subset)
+                
             x = data_subset.loc[:, self.channels[:]]
             for c in self.channels:
                 x[c] = self._scale[c](x[c])
@@ -254,14 +267,20 @@ class PCAOp(HasStrictTraits):
             # drop data that isn't in the scale range
             for c in self.channels:
                 x = x[~(np.isnan(x[c]))]
-            x = x.values
-             
-            self._pca[group] = pca = \
-                sklearn.decomposition.PCA(n_components = self.num_components,
-                                          whiten = self.whiten,
-                                          random_state = 0)
+                
+            groups.append(group)
+            xs.append(x.values)
             
-            pca.fit(x)
+        # fit the groups in parallel
+        fits = util.parallel_map_arrays(_fit_pca,
+                                        xs,
+                                        [self.num_components] * len(xs),
+                                        [self.whiten] * len(xs),
+                                        workers = self.workers,
+                                        executor = "process")
+        
+        for group, pca in zip(groups, fits):
+            self._pca[group] = pca
                                                  
          
     def apply(self, experiment):
@@ -300,7 +319,7 @@ class PCAOp(HasStrictTraits):
                                        "Must set at least one channel")
  
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                       .format(c))
@@ -313,30 +332,27 @@ class PCAOp(HasStrictTraits):
                                            .format(c))
         
         for b in self.by:
-            if b not in experiment.data:
+            if b not in experiment:
                 raise util.CytoflowOpError('by',
                                            "Aggregation metadata {} not found, "
                                            "must be one of {}"
                                            .format(b, experiment.conditions))
                                  
-        if self.by:
-            groupby = experiment.data.groupby(self.by)
-        else:
-            # use a lambda expression to return a group that contains
-            # all the events
-            groupby = experiment.data.groupby(lambda _: True)
+        groupby = experiment.groupby(self.by)
             
         new_experiment = experiment.clone()       
         new_channels = []   
         for i in range(self.num_components):
             cname = "{}_{}".format(self.name, i + 1)
-            if cname in experiment.data:
+            if cname in experiment:
                 raise util.CytoflowOpError('name',
                                            "Channel {} is already in the experiment"
                                            .format(cname))
                                            
-            new_experiment.add_channel(cname, pd.Series(index = experiment.data.index))
-            new_channels.append(cname)            
+            new_channels.append(cname)
+            
+        # fill in the new channels by position, then add them all at once
+        x_tf_all = np.full((len(experiment), len(new_channels)), np.nan)
                    
         for group, data_subset in groupby:
             if len(data_subset) == 0:
@@ -355,15 +371,28 @@ class PCAOp(HasStrictTraits):
             x_na = x_na.values
             x[x_na] = 0
             
-            group_idx = groupby.groups[group]
+            group_idx = groupby.indices[group]
             
             pca = self._pca[group]
             x_tf = pca.transform(x)
             x_tf[x_na] = np.nan
             
-            for ci, c in enumerate(new_channels):
-                new_experiment.data.loc[group_idx, c] = x_tf[:, ci]
+            x_tf_all[group_idx] = x_tf
+            
+        for ci, c in enumerate(new_channels):
+            new_experiment.add_channel(c, x_tf_all[:, ci])
 
-        new_experiment.data.dropna(inplace = True)
+        # drop the events we couldn't transform
+        keep = ~np.isnan(x_tf_all).any(axis = 1)
+        new_experiment._keep_positions(np.flatnonzero(keep))
         new_experiment.history.append(self.clone_traits(transient = lambda _: True))
         return new_experiment
+
+def _fit_pca(x, num_components, whiten):
+    """Fit the principal components of one group's events"""
+    
+    pca = sklearn.decomposition.PCA(n_components = num_components,
+                                    whiten = whiten,
+                                    random_state = 0)
+    pca.fit(x)
+    return pca
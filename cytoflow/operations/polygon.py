@@ -29,6 +29,7 @@ from traits.api import (HasStrictTraits, Str, CStr, List, Float, provides,
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 
 import cytoflow.utility as util
 from cytoflow.views import ISelectionView, ScatterplotView
@@ -174,11 +175,25 @@ class PolygonOp(HasStrictTraits):
             experiment. The reason is in :attr:`.CytoflowOpError.args`
         """
         
+        # the scales refer to the experiment, so don't send them to another
+        # process.
+        state = self.prepare_chunks(experiment)
+        gate = experiment.map_partitions(self.apply_chunk, 
+                                         state,
+                                         executor = "thread")
+        return self.finish_chunks(experiment, gate, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the polygon can be applied to ``experiment``, and set up 
+        its scales; see :func:`.apply_chunked`.
+        """
+        
         if experiment is None:
             raise util.CytoflowOpError('experiment',
                                        "No experiment specified")
 
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name',
                                        "{} is in the experiment already!"
                                        .format(self.name))
@@ -222,7 +237,7 @@ class PolygonOp(HasStrictTraits):
                                        "before applying it!")
         
         # make sure old_experiment doesn't already have a column named self.name
-        if(self.name in experiment.data.columns):
+        if(self.name in experiment):
             raise util.CytoflowOpError('name',
                                        "Experiment already contains a column {0}"
                                        .format(self.name))
@@ -235,18 +250,26 @@ class PolygonOp(HasStrictTraits):
         yscale = util.scale_factory(self.yscale, experiment, channel = self.ychannel)
         
         vertices = [(xscale(x), yscale(y)) for (x, y) in self.vertices]
-        data = experiment.data[[self.xchannel, self.ychannel]].copy()
-        data[self.xchannel] = xscale(data[self.xchannel])
-        data[self.ychannel] = yscale(data[self.ychannel])
-            
+        
         # use a matplotlib Path because testing for membership is a fast C fn.
         path = mpl.path.Path(np.array(vertices))
-        xy_data = data[[self.xchannel, self.ychannel]].values
+        
+        return {'xscale' : xscale, 'yscale' : yscale, 'path' : path}
+    
+    def apply_chunk(self, block, state):
+        """Apply the polygon to a block of events"""
+        
+        xy_data = np.column_stack((state['xscale'](block[self.xchannel].values),
+                                   state['yscale'](block[self.ychannel].values)))
+        
+        return pd.DataFrame({self.name : state['path'].contains_points(xy_data)},
+                            index = block.index)
+    
+    def finish_chunks(self, experiment, result, state):
+        """Add the gate computed by :meth:`apply_chunk` to ``experiment``"""
         
         new_experiment = experiment.clone()        
-        new_experiment.add_condition(self.name, 
-                                     "bool", 
-                                     path.contains_points(xy_data))
+        new_experiment.add_condition(self.name, "bitset", result[self.name])
         new_experiment.history.append(self.clone_traits(transient = lambda _: True))
             
         return new_experiment
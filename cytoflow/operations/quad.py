@@ -162,6 +162,18 @@ class QuadOp(HasStrictTraits):
             ``name_3``, and ``name_4``, applied to events CLOCKWISE from upper-left.
 
         """
+        
+        state = self.prepare_chunks(experiment)
+        gate = experiment.map_partitions(self.apply_chunk, 
+                                         state,
+                                         columns = [self.xchannel, self.ychannel])
+        return self.finish_chunks(experiment, gate, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the quad gate can be applied to ``experiment``; see 
+        :func:`.apply_chunked`.
+        """
 
         # TODO - the naming scheme (name_1, name_2, etc) is semantically weak.  
         # Add some (generalizable??) way to rename these populations?  
@@ -183,7 +195,7 @@ class QuadOp(HasStrictTraits):
                                        .format(self.name)) 
         
         # make sure old_experiment doesn't already have a column named self.name
-        if(self.name in experiment.data.columns):
+        if(self.name in experiment):
             raise util.CytoflowOpError('name',
                                        "Experiment already contains a column {0}"
                                        .format(self.name))
@@ -208,31 +220,34 @@ class QuadOp(HasStrictTraits):
         if not self.ythreshold:
             raise util.CytoflowOpError('ythreshold', 'ythreshold must be set!')
 
-        gate = pd.Series([None] * len(experiment))
+        return None
+    
+    def apply_chunk(self, block, state):
+        """Apply the quad gate to a block of events"""
         
-        # perhaps there's some more pythonic way to do this?
+        x = block[self.xchannel].values
+        y = block[self.ychannel].values
         
-        # these gate names match FACSDiva.  They are ARBITRARY.
-
-        # lower-left
-        ll = np.logical_and(experiment[self.xchannel] < self.xthreshold,
-                            experiment[self.ychannel] < self.ythreshold)
-        gate.loc[ll] = self.name + '_3'
-        
-        # upper-left
-        ul = np.logical_and(experiment[self.xchannel] < self.xthreshold,
-                            experiment[self.ychannel] > self.ythreshold)
-        gate.loc[ul] = self.name + '_1'
-
-        # upper-right
-        ur = np.logical_and(experiment[self.xchannel] > self.xthreshold,
-                            experiment[self.ychannel] > self.ythreshold)
-        gate.loc[ur] = self.name + '_2'
-        
-        # lower-right
-        lr = np.logical_and(experiment[self.xchannel] > self.xthreshold,
-                            experiment[self.ychannel] < self.ythreshold)
-        gate.loc[lr] = self.name + '_4'
+        # these gate names match FACSDiva.  They are ARBITRARY.  events
+        # that are right on a threshold aren't in any quadrant.
+        
+        categories = [self.name + '_1', self.name + '_2', 
+                      self.name + '_3', self.name + '_4']
+        
+        codes = np.select([(x < self.xthreshold) & (y > self.ythreshold),  # upper-left
+                           (x > self.xthreshold) & (y > self.ythreshold),  # upper-right
+                           (x < self.xthreshold) & (y < self.ythreshold),  # lower-left
+                           (x > self.xthreshold) & (y < self.ythreshold)], # lower-right
+                          [0, 1, 2, 3],
+                          default = -1)
+        
+        gate = pd.Categorical.from_codes(codes, categories = categories)
+        return pd.DataFrame({self.name : gate}, index = block.index)
+    
+    def finish_chunks(self, experiment, result, state):
+        """Add the gate computed by :meth:`apply_chunk` to ``experiment``"""
+        
+        gate = result[self.name].cat.remove_unused_categories()
 
         new_experiment = experiment.clone()
         new_experiment.add_condition(self.name, "category", gate)
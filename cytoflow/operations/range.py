@@ -25,6 +25,8 @@ cytoflow.operations.range
 from traits.api import (HasStrictTraits, Float, Str, Instance, Bool, 
                         provides, on_trait_change, Any, Constant)
 
+import pandas as pd
+
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D    
 
@@ -142,6 +144,18 @@ class RangeOp(HasStrictTraits):
             greater than :attr:`low` and less than :attr:`high`; it is ``False`` 
             otherwise.
         """
+        
+        state = self.prepare_chunks(experiment)
+        gate = experiment.map_partitions(self.apply_chunk, 
+                                         state,
+                                         columns = [self.channel])
+        return self.finish_chunks(experiment, gate, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the range can be applied to ``experiment``; see 
+        :func:`.apply_chunked`.
+        """
 
         if experiment is None:
             raise util.CytoflowOpError('experiment', "No experiment specified")
@@ -157,7 +171,7 @@ class RangeOp(HasStrictTraits):
                                        "Name can only contain letters, numbers and underscores."
                                        .format(self.name)) 
 
-        if self.name in experiment.data.columns:
+        if self.name in experiment:
             raise util.CytoflowOpError('name', 
                                        "Experiment already has a column named {0}"
                                        .format(self.name))
@@ -182,10 +196,18 @@ class RangeOp(HasStrictTraits):
             raise util.CytoflowOpError('low',
                                        "range low must be < {0}"
                                        .format(experiment[self.channel].max()))
+            
+        return None
+    
+    def apply_chunk(self, block, state):
+        """Apply the range to a block of events"""
+        return pd.DataFrame({self.name : block[self.channel].between(self.low, self.high)})
+    
+    def finish_chunks(self, experiment, result, state):
+        """Add the gate computed by :meth:`apply_chunk` to ``experiment``"""
         
-        gate = experiment[self.channel].between(self.low, self.high)
         new_experiment = experiment.clone()
-        new_experiment.add_condition(self.name, "bool", gate)
+        new_experiment.add_condition(self.name, "bitset", result[self.name])
         new_experiment.history.append(self.clone_traits(transient = lambda _: True))
             
         return new_experiment
@@ -171,6 +171,18 @@ class Range2DOp(HasStrictTraits):
             :attr:`yhigh`; it is ``False`` otherwise.
         """
         
+        state = self.prepare_chunks(experiment)
+        gate = experiment.map_partitions(self.apply_chunk, 
+                                         state,
+                                         columns = [self.xchannel, self.ychannel])
+        return self.finish_chunks(experiment, gate, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the range can be applied to ``experiment``; see 
+        :func:`.apply_chunked`.
+        """
+        
         if experiment is None:
             raise util.CytoflowOpError('experiment',
                                        "No experiment specified")
@@ -187,7 +199,7 @@ class Range2DOp(HasStrictTraits):
                                        .format(self.name)) 
         
         # make sure old_experiment doesn't already have a column named self.name
-        if(self.name in experiment.data.columns):
+        if(self.name in experiment):
             raise util.CytoflowOpError('name',
                                        "Experiment already contains a column {0}"
                                        .format(self.name))
@@ -226,12 +238,20 @@ class Range2DOp(HasStrictTraits):
                                        "y channel range low must be < {0}"
                                        .format(experiment[self.ychannel].max()))
         
-        x = experiment[self.xchannel].between(self.xlow, self.xhigh)
-        y = experiment[self.ychannel].between(self.ylow, self.yhigh)
-        gate = pd.Series(x & y)
+        return None
+    
+    def apply_chunk(self, block, state):
+        """Apply the range to a block of events"""
+        
+        x = block[self.xchannel].between(self.xlow, self.xhigh)
+        y = block[self.ychannel].between(self.ylow, self.yhigh)
+        return pd.DataFrame({self.name : x & y})
+    
+    def finish_chunks(self, experiment, result, state):
+        """Add the gate computed by :meth:`apply_chunk` to ``experiment``"""
         
         new_experiment = experiment.clone() 
-        new_experiment.add_condition(self.name, "bool", gate)   
+        new_experiment.add_condition(self.name, "bitset", result[self.name])   
         new_experiment.history.append(self.clone_traits(transient = lambda t: True))    
         return new_experiment
     
@@ -24,6 +24,7 @@ cytoflow.operations.ratio
 '''
 
 import numpy as np
+import pandas as pd
 
 from traits.api import (HasStrictTraits, Str, Constant, provides)
 
@@ -83,6 +84,16 @@ class RatioOp(HasStrictTraits):
                 What was the denominator channel for the new one?
     
         """
+        
+        state = self.prepare_chunks(experiment)
+        ratio = experiment.map_partitions(self.apply_chunk, state)
+        return self.finish_chunks(experiment, ratio, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the ratio can be computed for ``experiment``; see 
+        :func:`.apply_chunked`.
+        """
 
         if experiment is None:
             raise util.CytoflowOpError('experiment',
@@ -107,12 +118,33 @@ class RatioOp(HasStrictTraits):
             raise util.CytoflowOpError('name',
                                        "New channel {0} is already in the experiment"
                                        .format(self.name))
+            
+        return None
+    
+    def apply_chunk(self, block, state):
+        """
+        Compute the ratio for a block of events, leaving out the events with
+        a missing or infinite value (in any column.)
+        """
+        
+        ratio = block[self.numerator] / block[self.denominator]
+        ratio = ratio.replace([np.inf, -np.inf], np.nan)
+        keep = ratio.notna() & \
+               block.replace([np.inf, -np.inf], np.nan).notna().all(axis = 1)
+        return pd.DataFrame({self.name : ratio[keep]})
+    
+    def finish_chunks(self, experiment, result, state):
+        """
+        Add the ratio computed by :meth:`apply_chunk` to ``experiment``, and
+        drop the events it left out.
+        """
+        
+        ratio = result[self.name]
+        index = experiment[self.numerator].index
 
         new_experiment = experiment.clone()
-        new_experiment.add_channel(self.name, 
-                                   experiment[self.numerator] / experiment[self.denominator])
-        new_experiment.data.replace([np.inf, -np.inf], np.nan, inplace = True)
-        new_experiment.data.dropna(inplace = True)
+        new_experiment.add_channel(self.name, ratio.reindex(index))
+        new_experiment._keep_positions(index.get_indexer(ratio.index))
         new_experiment.history.append(self.clone_traits(transient = lambda t: True))
         new_experiment.metadata[self.name]['numerator'] = self.numerator
         new_experiment.metadata[self.name]['denominator'] = self.denominator
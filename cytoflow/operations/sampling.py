@@ -0,0 +1,73 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+cytoflow.operations.sampling
+----------------------------
+'''
+
+from traits.api import HasStrictTraits, Int, Dict, Any
+
+import cytoflow.utility as util
+
+class SamplingMixin(HasStrictTraits):
+    """
+    A mixin for operations that can estimate their model from a random
+    sample of each group's events, instead of all of them.  :meth:`apply`
+    still assigns every event.
+
+    Attributes
+    ----------
+    sample_size : Int (default = None)
+        If set, estimate from a random sample of (at most) this many events
+        from each group.
+
+    sample_fraction : Float (default = None)
+        If set, estimate from a random sample of this fraction of each
+        group's events.  Can't be set with :attr:`sample_size`.
+
+    sample_seed : Int (default = 0)
+        The seed for choosing the sample, so the same events are chosen
+        every time.  The events that were chosen are kept with the copy of
+        the operation in the experiment's :attr:`~.Experiment.history`.
+    """
+
+    sample_size = util.CIntOrNone(None)
+    sample_fraction = util.CFloatOrNone(None)
+    sample_seed = Int(0)
+
+    # the index labels of the events sampled from each group, in the
+    # experiment that was passed to estimate() -- after the subset was
+    # applied, if there was one, so they count from the start of the
+    # subset.  not transient, so they're kept in the history.
+    _samples = Dict(Any, Any)
+
+    def _sample(self, group, data):
+        """
+        Choose the events from ``group`` to estimate from, and remember them.
+        Returns ``data`` itself if we're not sampling.
+        """
+
+        sample = util.sample_events(data,
+                                    sample_size = self.sample_size,
+                                    sample_fraction = self.sample_fraction,
+                                    seed = self.sample_seed)
+        if sample is not data:
+            self._samples[group] = sample.index.values
+        return sample
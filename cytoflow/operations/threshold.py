@@ -141,6 +141,18 @@ class ThresholdOp(HasStrictTraits):
             it is ``False`` otherwise.
         """
         
+        state = self.prepare_chunks(experiment)
+        gate = experiment.map_partitions(self.apply_chunk, 
+                                         state,
+                                         columns = [self.channel])
+        return self.finish_chunks(experiment, gate, state)
+    
+    def prepare_chunks(self, experiment):
+        """
+        Check that the threshold can be applied to ``experiment``; see 
+        :func:`.apply_chunked`.
+        """
+        
         if experiment is None:
             raise util.CytoflowOpError('experiment', "No experiment specified")
         
@@ -156,7 +168,7 @@ class ThresholdOp(HasStrictTraits):
                                        .format(self.name)) 
         
         # make sure old_experiment doesn't already have a column named self.name
-        if(self.name in experiment.data.columns):
+        if(self.name in experiment):
             raise util.CytoflowOpError('name', 
                                        "Experiment already contains a column {0}"
                                        .format(self.name))
@@ -165,11 +177,19 @@ class ThresholdOp(HasStrictTraits):
             raise util.CytoflowOpError('channel',
                                        "{0} isn't a channel in the experiment"
                                        .format(self.channel))
-
-        gate = pd.Series(experiment[self.channel] > self.threshold)
+            
+        return None
+    
+    def apply_chunk(self, block, state):
+        """Apply the threshold to a block of events"""
+        return pd.DataFrame({self.name : block[self.channel].values > self.threshold},
+                            index = block.index)
+        
+    def finish_chunks(self, experiment, result, state):
+        """Add the gate computed by :meth:`apply_chunk` to ``experiment``"""
 
         new_experiment = experiment.clone()
-        new_experiment.add_condition(self.name, "bool", gate)
+        new_experiment.add_condition(self.name, "bitset", result[self.name])
         new_experiment.history.append(self.clone_traits(transient = lambda t: True))
         return new_experiment
     
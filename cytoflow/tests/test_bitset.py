@@ -0,0 +1,96 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+
+import numpy as np
+import pandas as pd
+
+import cytoflow as flow
+import cytoflow.utility as util
+
+class TestBitArray(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.a = rng.rand(1003) > 0.5
+        self.b = rng.rand(1003) > 0.3
+
+    def testRoundTrip(self):
+        bits = util.BitArray(self.a)
+        self.assertEqual(len(bits), 1003)
+        self.assertEqual(bits.nbytes, 128)
+        self.assertTrue((np.asarray(bits) == self.a).all())
+        self.assertEqual(bits[5], self.a[5])
+        self.assertEqual(bits[-1], self.a[-1])
+        self.assertTrue((bits[10:20].to_numpy() == self.a[10:20]).all())
+        self.assertTrue((bits.take([3, 1, 4]).to_numpy() == self.a[[3, 1, 4]]).all())
+
+    def testLogic(self):
+        a = util.BitArray(self.a)
+        b = util.BitArray(self.b)
+        self.assertTrue(((a & b).to_numpy() == (self.a & self.b)).all())
+        self.assertTrue(((a | b).to_numpy() == (self.a | self.b)).all())
+        self.assertTrue(((a ^ b).to_numpy() == (self.a ^ self.b)).all())
+        self.assertTrue(((~a).to_numpy() == ~self.a).all())
+        self.assertEqual((~a).sum(), (~self.a).sum())
+        self.assertEqual(a.sum(), self.a.sum())
+
+    def testSeries(self):
+        s = pd.Series(self.a).astype("bitset")
+        self.assertEqual(s.dtype, util.BitDtype())
+        self.assertEqual(s.sum(), self.a.sum())
+        self.assertEqual(len(s[s]), self.a.sum())
+        self.assertEqual(pd.concat([s, s]).dtype, util.BitDtype())
+        self.assertEqual(s.groupby(s).size()[True], self.a.sum())
+
+
+class TestBitsetCondition(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.path.dirname(os.path.abspath(__file__)) + "/data/Plate01/"
+        tube1 = flow.Tube(file = self.cwd + 'RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + 'CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        self.ex = import_op.apply()
+        self.ex = flow.ThresholdOp(name = "T",
+                                   channel = "Y2-A",
+                                   threshold = 500).apply(self.ex)
+
+    def testCondition(self):
+        self.assertEqual(self.ex.data["T"].dtype, util.BitDtype())
+        self.assertEqual(list(self.ex.conditions["T"]), [False, True])
+        self.assertEqual(self.ex.conditions["T"].dtype, "bool")
+
+    def testQuery(self):
+        self.assertEqual(len(self.ex.query("T")), 4446)
+        self.assertEqual(len(self.ex.query("T == True and Dox == 10.0")),
+                         len(self.ex.query("T and Dox == 10.0")))
+        self.assertEqual(len(self.ex.query("not T")), len(self.ex) - 4446)
+
+    def testSubset(self):
+        self.assertEqual(len(self.ex.subset("T", True)), 4446)
+        self.assertEqual(self.ex.groupby("T").keys, [False, True])
+        self.assertEqual(len(self.ex.groupby("T").get_group(True)), 4446)
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+
+import numpy as np
+
+import cytoflow as flow
+
+class TestChunked(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.path.dirname(os.path.abspath(__file__)) + "/data/Plate01/"
+        tube1 = flow.Tube(file = self.cwd + 'RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + 'CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        self.ex = import_op.apply()
+        
+        # make some events that the ratio drops
+        self.ex['B1-A'] = self.ex['B1-A'].where(self.ex['B1-A'] < 1000, np.nan)
+        
+        af = flow.AutofluorescenceOp(channels = ["Y2-A", "V2-A"],
+                                     blank_file = self.cwd + "CFP_Well_A4.fcs")
+        af.estimate(self.ex)
+        
+        self.ops = [af,
+                    flow.BleedthroughLinearOp(spillover = {("Y2-A", "V2-A") : 0.01,
+                                                           ("V2-A", "Y2-A") : 0.02}),
+                    flow.RatioOp(name = "Ratio", 
+                                 numerator = "Y2-A", 
+                                 denominator = "V2-A"),
+                    flow.ThresholdOp(name = "Threshold", 
+                                     channel = "Ratio", 
+                                     threshold = 2),
+                    flow.RangeOp(name = "Range", 
+                                 channel = "Y2-A", 
+                                 low = 100, 
+                                 high = 1000),
+                    flow.Range2DOp(name = "Range2D", 
+                                   xchannel = "Y2-A", xlow = 100, xhigh = 1000,
+                                   ychannel = "V2-A", ylow = 10, yhigh = 1000),
+                    flow.QuadOp(name = "Quad", 
+                                xchannel = "Y2-A", xthreshold = 100,
+                                ychannel = "V2-A", ythreshold = 100),
+                    flow.PolygonOp(name = "Polygon", 
+                                   xchannel = "V2-A", ychannel = "Y2-A",
+                                   vertices = [(0, 0), (1000, 0), (1000, 1000), (0, 1000)],
+                                   xscale = "logicle", yscale = "logicle")]
+        
+    def testChunked(self):
+        ex_apply = self.ex
+        for op in self.ops:
+            ex_apply = op.apply(ex_apply)
+            
+        ex_chunked = flow.apply_chunked(self.ex, self.ops, chunk_size = 777)
+        
+        self.assertLess(len(ex_chunked), len(self.ex))
+        self.assertTrue(ex_chunked.data.index.equals(ex_apply.data.index))
+        self.assertEqual(list(ex_chunked.data.columns), list(ex_apply.data.columns))
+        for c in ex_apply.data:
+            self.assertEqual(ex_chunked[c].dtype, ex_apply[c].dtype)
+            if c in ex_apply.channels:
+                self.assertTrue(np.allclose(ex_chunked[c], ex_apply[c]))
+            else:
+                self.assertTrue(ex_chunked[c].equals(ex_apply[c]))
+        self.assertEqual(len(ex_chunked.history), len(self.ops))
+        
+        # threads
+        ex_threads = flow.apply_chunked(self.ex, self.ops, chunk_size = 1000, workers = 4)
+        self.assertTrue(ex_threads["Quad"].equals(ex_apply["Quad"]))
+
+        # the default number of workers
+        workers = flow.get_default_workers()
+        flow.set_default_workers(0)
+        try:
+            ex_default = flow.apply_chunked(self.ex, self.ops, chunk_size = 1000)
+        finally:
+            flow.set_default_workers(workers)
+        self.assertTrue(ex_default["Quad"].equals(ex_apply["Quad"]))
+
+    def testNotChunkable(self):
+        op = flow.KMeansOp(name = "KMeans", channels = ["V2-A"], num_clusters = 2)
+        with self.assertRaises(flow.utility.CytoflowError):
+            flow.apply_chunked(self.ex, [op])
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -24,8 +24,13 @@ Created on Dec 1, 2015
 '''
 import unittest
 import os
+
+import numpy as np
+import pandas as pd
+
 import cytoflow as flow
 import cytoflow.utility as util
+from cytoflow.operations.density import _bin_index
 
 class TestDensityGate(unittest.TestCase):
 
@@ -58,6 +63,16 @@ class TestDensityGate(unittest.TestCase):
         self.assertEqual(len(self.gate._keep_ybins[1.0]), 1145)
         self.assertEqual(len(self.gate._keep_xbins[10.0]), 1350)
         self.assertEqual(len(self.gate._keep_ybins[10.0]), 1350)
+        
+    def testEstimateWorkers(self):
+        self.gate.by = ["Dox"]
+        self.gate.workers = 2
+        self.gate.estimate(self.ex)
+
+        self.assertEqual(len(self.gate._keep_xbins[1.0]), 1145)
+        self.assertEqual(len(self.gate._keep_ybins[1.0]), 1145)
+        self.assertEqual(len(self.gate._keep_xbins[10.0]), 1350)
+        self.assertEqual(len(self.gate._keep_ybins[10.0]), 1350)
     
     def testApply(self):
         self.gate.estimate(self.ex)
@@ -72,11 +87,20 @@ class TestDensityGate(unittest.TestCase):
         self.gate.estimate(self.ex)
         ex2 = self.gate.apply(self.ex)
         
-        self.assertAlmostEqual(ex2.data.groupby(["Dox", "D"]).size().loc[1.0, False], 1886)
-        self.assertAlmostEqual(ex2.data.groupby(["Dox", "D"]).size().loc[1.0, True], 8114)
+        self.assertAlmostEqual(ex2.data.groupby(["Dox", "D"]).size().loc[1.0, False], 1866)
+        self.assertAlmostEqual(ex2.data.groupby(["Dox", "D"]).size().loc[1.0, True], 8134)
         
         self.assertAlmostEqual(ex2.data.groupby(["Dox", "D"]).size().loc[10.0, False], 1859)
         self.assertAlmostEqual(ex2.data.groupby(["Dox", "D"]).size().loc[10.0, True], 8141)
+        
+    def testBinIndex(self):
+        bins = np.linspace(0.0, 1.0, 11)
+        x = np.concatenate([np.random.RandomState(0).uniform(-0.5, 1.5, 1000),
+                            bins, [np.nan]])
+        
+        c = pd.cut(x, bins, include_lowest = True, labels = False)
+        self.assertTrue(np.array_equal(_bin_index(bins, x), 
+                                       np.nan_to_num(c, nan = -1)))
  
     
     def testPlot(self):
@@ -24,6 +24,11 @@ Created on Dec 1, 2015
 '''
 import unittest
 import os
+import pickle
+import tempfile
+
+import numpy as np
+
 import cytoflow as flow
 
 class Test(unittest.TestCase):
@@ -40,6 +45,321 @@ class Test(unittest.TestCase):
         self.assertEqual(len(self.ex['Dox'].unique()), 2)
         self.assertEqual(len(self.ex['Well'].unique()), 2)
         
+    def testAddEventsBatch(self):
+        import fcsparser
+        _, tube1 = fcsparser.parse(self.cwd + 'RFP_Well_A3.fcs')
+        _, tube2 = fcsparser.parse(self.cwd + 'CFP_Well_A4.fcs')
+        
+        ex1 = flow.Experiment()
+        ex1.add_condition("Dox", "float")
+        ex1.add_condition("Well", "category")
+        for c in tube1.columns:
+            ex1.add_channel(c)
+        ex1.add_events(tube1, {"Dox" : 10.0, "Well" : "A"})
+        ex1.add_events(tube2, {"Dox" : 1.0, "Well" : "B"})
+        
+        ex2 = flow.Experiment()
+        ex2.add_condition("Dox", "float")
+        ex2.add_condition("Well", "category")
+        for c in tube1.columns:
+            ex2.add_channel(c)
+        ex2.add_events_batch([(tube1, {"Dox" : 10.0, "Well" : "A"}),
+                              (tube2, {"Dox" : 1.0, "Well" : "B"})])
+        
+        self.assertEqual(len(ex1), len(ex2))
+        self.assertEqual(ex1.channels, ex2.channels)
+        self.assertEqual(list(ex1.data.columns), list(ex2.data.columns))
+        for c in ex1.data:
+            self.assertTrue((ex1[c].astype('object') == ex2[c].astype('object')).all())
+            
+        with self.assertRaises(flow.utility.CytoflowError):
+            ex2.add_events_batch([(tube1, {"Dox" : 100.0})])
+        
+    def testAddEvents(self):
+        import fcsparser
+        _, tube1 = fcsparser.parse(self.cwd + 'RFP_Well_A3.fcs')
+
+        ex = flow.Experiment()
+        ex.add_condition("Dox", "float")
+        ex.add_condition("Well", "category")
+        ex.add_condition("Gated", "bitset")
+        for c in tube1.columns:
+            ex.add_channel(c)
+        ex.add_events(tube1, {"Dox" : 10.0, "Well" : "B", "Gated" : True})
+        ex.add_events(tube1, {"Dox" : 1.0, "Well" : "A", "Gated" : False})
+        ex.add_events(tube1, {"Dox" : 1.0, "Well" : "B", "Gated" : False})
+
+        self.assertEqual(len(ex), 3 * len(tube1))
+        self.assertEqual(ex['Dox'].dtype, "float64")
+        self.assertEqual(list(ex['Well'].cat.categories), ["B", "A"])
+        self.assertEqual(list(ex['Well'].values[::len(tube1)]), ["B", "A", "B"])
+        self.assertEqual(ex['Gated'].dtype, flow.utility.BitDtype())
+        self.assertEqual(ex['Gated'].sum(), len(tube1))
+        self.assertEqual(ex.partitions[-1], slice(2 * len(tube1), 3 * len(tube1)))
+
+        with self.assertRaises(flow.utility.CytoflowError):
+            ex.add_events(tube1, {"Dox" : "ten", "Well" : "A", "Gated" : False})
+
+    def testGroupby(self):
+        g = self.ex.groupby(['Dox', 'Well'])
+        pd_g = self.ex.data.groupby(['Dox', 'Well'], observed = True)
+        
+        self.assertEqual(g.keys, sorted(pd_g.groups.keys()))
+        for key, data_subset in g:
+            self.assertTrue(data_subset.equals(pd_g.get_group(key)))
+        self.assertEqual(list(g.levels['Dox']), [1.0, 10.0])
+        
+        # memoized ...
+        self.assertIs(self.ex.groupby(['Dox', 'Well']).indices, g.indices)
+        self.assertIs(self.ex.clone().groupby(['Dox', 'Well']).indices, g.indices)
+        
+        # ... until the data changes
+        self.ex['Dox'] = self.ex['Dox'] * 2
+        self.assertEqual(list(self.ex.groupby(['Dox', 'Well']).levels['Dox']), [2.0, 20.0])
+        
+        ex2 = self.ex.query('Dox > 10')
+        self.assertEqual(ex2.groupby('Dox').keys, [20.0])
+        self.assertEqual(len(ex2.groupby([])), 1)
+
+    def testConditionsMemo(self):
+        conditions = self.ex.conditions
+        self.assertEqual(list(conditions['Dox']), [1.0, 10.0])
+        self.assertEqual(list(conditions['Well']), ['A', 'B'])
+        self.assertEqual(conditions['Well'].dtype, self.ex['Well'].dtype)
+        self.assertIs(self.ex.conditions['Dox'], conditions['Dox'])
+
+        # unused categories aren't values
+        ex2 = self.ex.query('Well == "A"')
+        self.assertEqual(list(ex2.conditions['Well']), ['A'])
+
+        self.ex['Dox'] = self.ex['Dox'] * 2
+        self.assertEqual(list(self.ex.conditions['Dox']), [2.0, 20.0])
+
+        self.ex.add_condition('Tube', 'int', self.ex['Dox'].astype('int'))
+        self.assertEqual(list(self.ex.conditions['Tube']), [2, 20])
+
+        self.ex.add_channel('FSC_2', self.ex['FSC-A'] / 2)
+        self.assertIn('FSC_2', self.ex.channels)
+        self.assertNotIn('Tube', self.ex.channels)
+
+    def testQueryMemo(self):
+        ex2 = self.ex.query('Dox == 10 and `Y2-A` > 500')
+        self.assertEqual(len(ex2), 4399)
+
+        # the same query remembers which events matched ...
+        key = next(iter(self.ex._query_cache))
+        ex3 = self.ex.query('Dox == 10 and `Y2-A` > 500')
+        self.assertTrue(ex3.data.equals(ex2.data))
+        self.assertEqual(list(self.ex._query_cache), [key])
+        self.assertEqual(list(self.ex.clone()._query_cache), [key])
+
+        # ... but each result has its own events
+        ex3.data.loc[0, 'Y2-A'] = 999
+        self.assertNotEqual(ex2.data.loc[0, 'Y2-A'], 999)
+        self.assertNotEqual(self.ex.query('Dox == 10 and `Y2-A` > 500').data.loc[0, 'Y2-A'], 999)
+
+        ex3['Dox'] = ex3['Dox'] * 2
+        self.assertEqual(list(ex2.conditions['Dox']), [10.0])
+        self.assertEqual(list(self.ex.query('Dox == 10 and `Y2-A` > 500').conditions['Dox']), [10.0])
+
+        self.ex['Y2-A'] = self.ex['Y2-A'] * 100
+        self.assertEqual(len(self.ex.query('Dox == 10 and `Y2-A` > 500')), 
+                         ((self.ex['Dox'] == 10) & (self.ex['Y2-A'] > 500)).sum())
+
+        with self.assertRaises(flow.utility.CytoflowError):
+            self.ex.query('Dox == 1000')
+
+        with self.assertRaises(flow.utility.CytoflowError):
+            self.ex.query('Dox + 1')
+
+    def testPartitions(self):
+        self.assertEqual(self.ex.partitions, [slice(0, 10000), slice(10000, 20000)])
+        
+        # grouping by the tubes' conditions gives the same groups as
+        # grouping by the events'
+        scan = self.ex.clone()
+        scan.data = scan.data.copy()
+        self.assertEqual(scan.partitions, [])
+        for by in [['Dox'], ['Well', 'Dox']]:
+            g = self.ex.groupby(by)
+            g_scan = scan.groupby(by)
+            self.assertEqual(g.keys, g_scan.keys)
+            for key in g.keys:
+                self.assertTrue((g.indices[key] == g_scan.indices[key]).all())
+            for b in by:
+                self.assertTrue(g.levels[b].equals(g_scan.levels[b]))
+                
+        ex2 = self.ex.query('`Y2-A` > 500')
+        self.assertEqual(ex2.partitions, [slice(0, 4399), slice(4399, 4446)])
+        self.assertEqual(len(ex2.groupby('Dox').get_group(1.0)), 47)
+        
+        y2 = self.ex.map_partitions(lambda block, c: block[c].values * 2, 'Y2-A',
+                                    workers = 2)
+        self.assertTrue((y2 == self.ex['Y2-A'] * 2).all())
+        
+        # a changed condition isn't constant in each tube any more
+        self.ex['Dox'] = self.ex['Dox'].sample(frac = 1).values
+        self.assertEqual(len(self.ex.groupby('Dox').indices[1.0]), 10000)
+        self.assertNotEqual(list(self.ex.groupby('Dox').indices[1.0]), list(range(10000, 20000)))
+
+    def testScratchDir(self):
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            ex = self.ex.clone()
+            ex.set_scratch_dir(scratch_dir)
+            self.assertEqual(ex.scratch_dir, scratch_dir)
+            self.assertTrue(ex.data.equals(self.ex.data))
+            n_files = len(os.listdir(scratch_dir))
+            
+            # clones share the files; new columns get new ones
+            ex2 = ex.clone()
+            ex2.add_channel('FSC_2', ex2['FSC-A'] / 2)
+            self.assertEqual(len(os.listdir(scratch_dir)), n_files + 1)
+            self.assertNotIn('FSC_2', ex.data)
+            self.assertTrue((ex2['FSC_2'] == self.ex['FSC-A'] / 2).all())
+            
+            ex2 = ex.query('Dox == 10')
+            self.assertEqual(ex2.scratch_dir, scratch_dir)
+            self.assertTrue(ex2.data.equals(self.ex.query('Dox == 10').data))
+            self.assertEqual(len(ex.subset('Well', 'B')), len(self.ex.subset('Well', 'B')))
+            for (_, a), (_, b) in zip(ex.groupby('Well'), self.ex.groupby('Well')):
+                self.assertTrue(a.equals(b))
+                
+            # pickles bring the events along
+            ex2 = pickle.loads(pickle.dumps(ex))
+            self.assertTrue(ex2.data.equals(self.ex.data))
+            
+            ex.set_scratch_dir(None)
+            self.assertEqual(ex.scratch_dir, "")
+            self.assertTrue(ex.data.equals(self.ex.data))
+            
+            # files go away when they're not used
+            del ex2
+            self.assertEqual(len(os.listdir(scratch_dir)), 0)
+
+    def testScratchDirApply(self):
+        # operations shouldn't copy all the events into memory
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            ex = self.ex.clone()
+            ex.set_scratch_dir(scratch_dir)
+            ex._data_view = None
+
+            self.assertIn('FSC-A', ex)
+            self.assertIn('Dox', ex)
+            self.assertNotIn('FSC_2', ex)
+
+            ex2 = flow.ThresholdOp(name = "T",
+                                   channel = "Y2-A",
+                                   threshold = 500).apply(ex)
+
+            op = flow.DensityGateOp(name = "D",
+                                    xchannel = "FSC-A",
+                                    ychannel = "SSC-A",
+                                    keep = 0.5)
+            op.estimate(ex2)
+            ex3 = op.apply(ex2)
+
+            for e in (ex, ex2, ex3):
+                self.assertIsNone(e._data_view)
+            self.assertEqual(ex3['T'].sum(), (self.ex['Y2-A'] > 500).sum())
+
+    def testScratchDirDropEvents(self):
+        # operations that drop events reuse the column files when they keep
+        # them all, and keep the partitions when they don't
+        ex_zero = self.ex.clone()
+        v2 = ex_zero['V2-A'].values.copy()
+        v2[[5, 15000]] = 0
+        ex_zero['V2-A'] = v2
+
+        ops = [(flow.RatioOp(name = "R", numerator = "Y2-A", denominator = "FSC-A"), self.ex),
+               (flow.RatioOp(name = "R", numerator = "Y2-A", denominator = "V2-A"), ex_zero),
+               (flow.PCAOp(name = "P", channels = ["V2-A", "Y2-A"], num_components = 2), self.ex),
+               (flow.PCAOp(name = "P", channels = ["V2-A", "Y2-A"], num_components = 2,
+                           scale = {"V2-A" : "log"}), self.ex)]
+
+        for op, ex in ops:
+            with tempfile.TemporaryDirectory() as scratch_dir:
+                ex_scratch = ex.clone()
+                ex_scratch.set_scratch_dir(scratch_dir)
+                n_files = len(os.listdir(scratch_dir))
+
+                if hasattr(op, 'estimate'):
+                    op.estimate(ex)
+                expected = op.apply(ex)
+                ex2 = op.apply(ex_scratch)
+
+                self.assertIsNone(ex2._data_view)
+                self.assertEqual(len(ex2), len(expected))
+                self.assertEqual(ex2.partitions, expected.partitions)
+                self.assertTrue(ex2.data.equals(expected.data.reset_index(drop = True)))
+
+                if len(ex2) == len(ex):
+                    self.assertEqual(ex2.partitions, ex.partitions)
+                    self.assertEqual(len(os.listdir(scratch_dir)),
+                                     n_files + len(ex2.data.columns) - len(ex.data.columns))
+                else:
+                    self.assertEqual(sum(p.stop - p.start for p in ex2.partitions), len(ex2))
+
+                del ex2, ex_scratch
+
+    def testCloneCopyOnWrite(self):
+        self.ex.statistics[("Op", "Stat")] = self.ex['FSC-A'].groupby(self.ex['Dox']).mean()
+        fcs_metadata = self.ex.metadata.peek('fcs_metadata')
+
+        # clones share the entries ...
+        ex2 = self.ex.clone()
+        self.assertIs(ex2.metadata.peek('fcs_metadata'), fcs_metadata)
+        self.assertIs(ex2.statistics.peek(("Op", "Stat")),
+                      self.ex.statistics.peek(("Op", "Stat")))
+
+        # ... until they're used
+        ex2.statistics[("Op", "Stat")][1.0] = -1
+        ex2.metadata['FSC-A']['range'] = -1
+        self.assertNotEqual(self.ex.statistics[("Op", "Stat")][1.0], -1)
+        self.assertNotEqual(self.ex.metadata['FSC-A']['range'], -1)
+        self.assertIs(ex2.metadata.peek('fcs_metadata'), fcs_metadata)
+
+        ex3 = self.ex.clone()
+        self.ex.metadata['Dox']['type'] = 'foo'
+        self.assertEqual(ex3.metadata['Dox']['type'], 'condition')
+
+        ex3 = pickle.loads(pickle.dumps(ex2))
+        self.assertEqual(ex3.statistics[("Op", "Stat")][1.0], -1)
+        self.assertIsInstance(ex3.metadata, flow.utility.CopyOnWriteDict)
+
+    def testSaveLoad(self):
+        ex = flow.ThresholdOp(name = "T", channel = "Y2-A", threshold = 500).apply(self.ex)
+        ex.add_condition("Big", "bool", ex['FSC-A'] > 1000)
+        ex = flow.ChannelStatisticOp(name = "Mean", channel = "Y2-A",
+                                     by = ["Dox", "Well"], function = np.mean).apply(ex)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoint")
+            ex.save(path)
+            ex2 = flow.Experiment.load(path)
+
+            self.assertTrue(ex2.data.equals(ex.data))
+            for c in ex.data:
+                self.assertEqual(ex2[c].dtype, ex[c].dtype)
+            self.assertEqual(ex2.channels, ex.channels)
+            self.assertEqual(ex2.metadata, ex.metadata)
+            self.assertTrue(ex2.statistics[("Mean", "mean")].equals(ex.statistics[("Mean", "mean")]))
+            self.assertEqual([type(op) for op in ex2.history], [type(op) for op in ex.history])
+            self.assertEqual(ex2.partitions, ex.partitions)
+            self.assertEqual(len(ex2.query("T and Well == 'A'")), len(ex.query("T and Well == 'A'")))
+
+            # new columns go in the scratch directory
+            ex2.add_channel("FSC_2", ex2["FSC-A"] / 2)
+            self.assertEqual(ex2.scratch_dir, os.path.join(path, "scratch"))
+
+            # save over the experiment it was loaded from
+            ex2.save(path)
+            ex3 = flow.Experiment.load(path)
+            self.assertTrue(ex3.data.equals(ex2.data))
+            self.assertTrue((ex2['FSC_2'] == ex['FSC-A'] / 2).all())
+
+            with self.assertRaises(flow.utility.CytoflowError):
+                flow.Experiment.load(tmp)
+
     def testAddChannel(self):
         pass
         
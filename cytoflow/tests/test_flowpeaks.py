@@ -24,7 +24,12 @@ Created on Dec 1, 2015
 '''
 import unittest
 import os
+
+import numpy as np
+import scipy.stats
+
 import cytoflow as flow
+from cytoflow.operations.flowpeaks import _MixtureDensity, _find_peaks
 
 class TestFlowpeaks(unittest.TestCase):
 
@@ -55,6 +60,31 @@ class TestFlowpeaks(unittest.TestCase):
         ex2 = self.op.apply(self.ex)
         self.assertEqual(len(ex2['FP'].unique()), 2)
 
+    def testDensity(self):
+        rng = np.random.RandomState(0)
+        weights = np.array([0.2, 0.3, 0.5])
+        means = rng.normal(size = (3, 2))
+        covariances = np.array([np.cov(rng.normal(size = (10, 2)), rowvar = False)
+                                for _ in range(3)])
+        x = rng.normal(size = (50, 2))
+        
+        density = _MixtureDensity(weights, means, covariances)
+        f = lambda x: np.sum([w * scipy.stats.multivariate_normal(m, c).pdf(x)
+                              for w, m, c in zip(weights, means, covariances)], 
+                             axis = 0)
+        self.assertTrue(np.allclose(density(x), f(x)))
+        self.assertAlmostEqual(density(x[0]), f(x[0]))
+        
+        # every starting point climbs to a peak
+        peaks, converged = _find_peaks(density, x)
+        self.assertTrue(converged.all())
+        
+        eps = 1e-6
+        grad = np.stack([(f(peaks + eps * e) - f(peaks - eps * e)) / (2 * eps) 
+                         for e in np.eye(2)], axis = 1)
+        self.assertTrue(np.allclose(grad, 0, atol = 1e-5))
+        self.assertTrue((density(peaks) >= density(x)).all())
+        
     def testPlot(self):
         self.op.estimate(self.ex)
         self.op.default_view().plot(self.ex)
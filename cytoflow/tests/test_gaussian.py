@@ -23,7 +23,13 @@ Created on Feb 4, 2018
 @author: brian
 '''
 import unittest
+
+import numpy as np
+import scipy.stats
+
 import cytoflow as flow
+import cytoflow.utility as util
+from cytoflow.operations.gaussian import _mahalanobis_sq
 from test_base import ImportedDataTest  # @UnresolvedImport
 
 class TestGaussian(ImportedDataTest):
@@ -56,6 +62,81 @@ class TestGaussian(ImportedDataTest):
         ex2 = self.op.apply(self.ex)
         self.assertEqual(len(ex2['GM'].unique()), 2)
         
+    def testMahalanobis(self):
+        rng = np.random.RandomState(0)
+        x = rng.normal(size = (20, 2))
+        means = rng.normal(size = (2, 2))
+        
+        # the second covariance isn't positive-definite, so it falls back
+        # to the pseudo-inverse
+        covariances = np.array([[[2.0, 0.5], [0.5, 1.0]],
+                                [[1.0, 1.0], [1.0, 1.0]]])
+        
+        dist = _mahalanobis_sq(x, means, covariances)
+        self.assertEqual(dist.shape, (20, 2))
+        for c in range(2):
+            d = x - means[c]
+            expected = np.array([e.dot(np.linalg.pinv(covariances[c])).dot(e) for e in d])
+            self.assertTrue(np.allclose(dist[:, c], expected))
+        
+    def testSigma(self):
+        self.op.by = ["Well"]
+        self.op.sigma = 1.5
+        self.op.posteriors = True
+        self.op.estimate(self.ex)
+        ex2 = self.op.apply(self.ex)
+        
+        # compare with the Mahalanobis distance the long way around
+        for well, data in ex2.groupby("Well"):
+            gmm = self.op._gmms[well]
+            x = np.stack([self.op._scale[c](data[c]) for c in self.op.channels], axis = 1)
+            for c in range(2):
+                d = x - gmm.means_[c]
+                dist = np.array([e.dot(np.linalg.pinv(gmm.covariances_[c])).dot(e) for e in d])
+                p = (scipy.stats.norm.cdf(1.5) - 0.5) * 2
+                gate = dist <= scipy.stats.chi2.ppf(p, 1)
+                self.assertTrue((data["GM_{}".format(c + 1)].values == gate).all())
+                
+            posteriors = data[["GM_1_posterior", "GM_2_posterior"]].sum(axis = 1)
+            self.assertTrue(np.allclose(posteriors[~np.isnan(x).any(axis = 1)], 1.0))
+            
+    def testWorkers(self):
+        self.op.by = ["Well", "Dox"]
+        self.op.estimate(self.ex)
+        ex2 = self.op.apply(self.ex)
+        
+        self.op.workers = 2
+        self.op.estimate(self.ex)
+        ex3 = self.op.apply(self.ex)
+        
+        self.assertTrue((ex2["GM"] == ex3["GM"]).all())
+        
+    def testSample(self):
+        self.op.by = ["Well"]
+        self.op.sample_size = 1000
+        self.op.estimate(self.ex)
+        means = {k : v.means_ for k, v in self.op._gmms.items()}
+        
+        for well, sample in self.op._samples.items():
+            self.assertEqual(len(sample), 1000)
+            self.assertTrue((self.ex.data.loc[sample, "Well"] == well).all())
+        
+        # the same seed picks the same events
+        self.op.estimate(self.ex)
+        for k, v in self.op._gmms.items():
+            self.assertTrue(np.array_equal(means[k], v.means_))
+            
+        # but every event is assigned, and the history has the sample
+        ex2 = self.op.apply(self.ex)
+        self.assertEqual(len(ex2), len(self.ex))
+        self.assertFalse(ex2["GM"].isnull().any())
+        self.assertTrue(np.array_equal(ex2.history[-1]._samples['Aa'],
+                                       self.op._samples['Aa']))
+        
+        self.op.sample_fraction = 0.1
+        with self.assertRaises(util.CytoflowOpError):
+            self.op.estimate(self.ex)
+            
     def testPlot(self):
         self.op.estimate(self.ex)
         self.op.default_view().plot(self.ex)
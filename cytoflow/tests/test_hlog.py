@@ -31,7 +31,7 @@ from numpy.testing import assert_almost_equal  # @UnresolvedImport
 
 import cytoflow as flow
 import cytoflow.utility as util
-from cytoflow.utility.hlog_scale import hlog as cf_hlog
+from cytoflow.utility.hlog_scale import hlog as cf_hlog, hlog_inv
 
 class Test(unittest.TestCase):
 
@@ -86,6 +86,31 @@ class Test(unittest.TestCase):
         
         
 
+    def test_hlog_inverse(self):
+        x = np.r_[-np.logspace(-3, 6, 500)[::-1], 0, np.logspace(-3, 6, 500)]
+        y = hlog(x)
+        assert_almost_equal(hlog_inv(y, 200, _display_max, _l_mmax) / np.maximum(np.abs(x), 1), 
+                            x / np.maximum(np.abs(x), 1),
+                            decimal = 8)
+        
+        scale = util.scale_factory("hlog", self.ex, channel = "Pacific Blue-A")
+        data = self.ex["Pacific Blue-A"].values[0:1000]
+        assert_almost_equal(scale.inverse(scale(data)), data, decimal = 6)
+        
+    def test_hlog_scalar(self):
+        x = np.r_[-1000.0, -5.0, 0.0, 5.0, 1000.0]
+        y = cf_hlog(x, 500, 1, 4)
+        
+        for xi, yi in zip(x, y):
+            yi_scalar = cf_hlog(xi, 500, 1, 4)
+            self.assertEqual(np.ndim(yi_scalar), 0)
+            self.assertAlmostEqual(yi_scalar, yi, places = 12)
+            self.assertAlmostEqual(hlog_inv(yi_scalar, 500, 1, 4), xi, places = 6)
+            
+        assert_almost_equal(cf_hlog(x.reshape(5, 1), 500, 1, 4), y.reshape(5, 1))
+        
+        
+
 _machine_max = 2**18
 _l_mmax = np.log10(_machine_max)
 _display_max = 10**4
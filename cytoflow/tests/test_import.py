@@ -24,7 +24,8 @@ Created on Dec 1, 2015
 '''
 
 import unittest
-import os
+import os, math, tempfile
+from unittest import mock
 import cytoflow as flow
 
 class TestImport(unittest.TestCase):
@@ -62,6 +63,26 @@ class TestImport(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             import_op.apply()
 
+    def testMetadataOnly(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        
+        ex_meta = import_op.apply(metadata_only = True)
+        self.assertEqual(len(ex_meta), 0)
+        
+        # the metadata is only read once per file, and a changed
+        # metadata dictionary doesn't leak back into the cache
+        from cytoflow.operations.import_op import _read_text_memo
+        hits = _read_text_memo.cache_info().hits
+        ex = import_op.apply()
+        self.assertGreater(_read_text_memo.cache_info().hits, hits)
+        
+        self.assertEqual(ex.channels, ex_meta.channels)
+        self.assertEqual(ex.metadata['fcs_metadata'], 
+                         ex_meta.metadata['fcs_metadata'])
+
     def testChooseChannels(self):
         tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
         
@@ -75,6 +96,154 @@ class TestImport(unittest.TestCase):
                           tubes = [tube1],
                           channels = {'Y2-B' : "Blue"}).apply()
                           
+    def testWorkers(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        tube3 = flow.Tube(file= self.cwd + '/data/Plate01/YFP_Well_A7.fcs', conditions = {"Dox" : 0.1})
+        
+        ex1 = flow.ImportOp(conditions = {"Dox" : "float"},
+                            tubes = [tube1, tube2, tube3]).apply()
+        ex2 = flow.ImportOp(conditions = {"Dox" : "float"},
+                            tubes = [tube1, tube2, tube3],
+                            workers = 3).apply()
+        
+        self.assertTrue(ex1.data.equals(ex2.data))
+        self.assertEqual(ex1.metadata['fcs_metadata'].keys(),
+                         ex2.metadata['fcs_metadata'].keys())
+        
+        tube4 = flow.Tube(file= self.cwd + '/data/tasbe/blank.fcs', conditions = {"Dox" : 1000.0})
+        with self.assertRaisesRegex(RuntimeError, "blank.fcs"):
+            flow.ImportOp(conditions = {"Dox" : "float"},
+                          tubes = [tube1, tube2, tube4],
+                          workers = 3).apply()
+            
+    def testEvents(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        ex = import_op.apply()
+        ex1 = ex.query("Dox == 10.0").data.reset_index(drop = True)
+        
+        import_op.events = 1000
+        import_op.seed = 42
+        ex_random = import_op.apply()
+        self.assertEqual(len(ex_random), 2000)
+        self.assertTrue(ex_random.data.equals(import_op.apply().data))
+        
+        import_op.sampling = "first"
+        ex_first = import_op.apply()
+        self.assertTrue(ex_first.query("Dox == 10.0").data.reset_index(drop = True)
+                        .equals(ex1.iloc[0:1000].reset_index(drop = True)))
+        
+        import_op.sampling = "stride"
+        ex_stride = import_op.apply()
+        stride = len(ex1) // 1000
+        self.assertTrue(ex_stride.query("Dox == 10.0").data.reset_index(drop = True)
+                        .equals(ex1.iloc[0:1000 * stride:stride].reset_index(drop = True)))
+        
+    def testChunks(self):
+        from cytoflow.operations.import_op import iter_tube_chunks, parse_tube
+        import pandas as pd
+        
+        path = self.cwd + '/data/instruments/Beckman Coulter - Cytomics FC500.LMD'
+        _, data = parse_tube(path, data_set = 1)
+        chunks = list(iter_tube_chunks(path, 
+                                       chunk_events = 1000, 
+                                       name_metadata = "$PnS",
+                                       data_set = 1))
+        
+        self.assertEqual(len(chunks), int(math.ceil(len(data) / 1000)))
+        self.assertTrue(all([len(c) == 1000 for c in chunks[:-1]]))
+        self.assertTrue(pd.concat(chunks).equals(data))
+        
+    def testCache(self):
+        import tempfile, shutil
+        
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        ex = import_op.apply()
+        
+        import_op.cache_dir = cache_dir
+        ex_cold = import_op.apply()
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+        ex_warm = import_op.apply()
+        
+        self.assertTrue(ex.data.equals(ex_cold.data))
+        self.assertTrue(ex.data.equals(ex_warm.data))
+        self.assertEqual(ex.metadata['fcs_metadata'], 
+                         ex_warm.metadata['fcs_metadata'])
+        
+        # too small for both tubes; only the most recent one is kept, even
+        # though they're both already in the cache
+        import_op.cache_size = 1
+        ex_small = import_op.apply()
+        self.assertTrue(ex.data.equals(ex_small.data))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+            
+    def testFloat32(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        ex = import_op.apply()
+        
+        import_op.channel_dtype = "float32"
+        ex32 = import_op.apply()
+        
+        self.assertEqual(ex32.channel_dtype, "float32")
+        for channel in ex32.channels:
+            self.assertEqual(ex32[channel].dtype, "float32")
+            self.assertEqual(ex32.metadata[channel]['dtype'], "float32")
+            self.assertTrue((ex32[channel] == ex[channel].astype("float32")).all())
+        self.assertEqual(ex32['Dox'].dtype, ex['Dox'].dtype)
+        
+        # channels stay float32 when they're changed or added
+        ex32['Y2-A'] = ex32['Y2-A'] * 2.0
+        self.assertEqual(ex32['Y2-A'].dtype, "float32")
+        ex32.add_channel('Y2_half', ex['Y2-A'] / 2.0)
+        self.assertEqual(ex32['Y2_half'].dtype, "float32")
+        self.assertEqual(ex32.clone()['Y2_half'].dtype, "float32")
+        
+    def testScratchDir(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2],
+                                  channels = {"Y2-A" : "Y2_A", "V2-A" : "V2-A"})
+        ex = import_op.apply()
+        
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            import_op.scratch_dir = scratch_dir
+            ex2 = import_op.apply()
+            self.assertEqual(ex2.scratch_dir, scratch_dir)
+            self.assertEqual(len(os.listdir(scratch_dir)), 3)
+            self.assertEqual(ex2.channels, ex.channels)
+            self.assertTrue(ex2.data.equals(ex.data))
+            del ex2
+
+    def testScratchDirMask(self):
+        # integer channels with extra bits set get masked without copying
+        # all the events into memory
+        path = self.cwd + '/data/instruments/System II listmode with extra info in bits D10-D15.LMD'
+        import_op = flow.ImportOp(tubes = [flow.Tube(file = path)])
+        ex = import_op.apply()
+
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            import_op.scratch_dir = scratch_dir
+            with mock.patch.object(flow.utility.ColumnStore, 'to_frame',
+                                   side_effect = AssertionError("copied the events")):
+                ex2 = import_op.apply()
+            self.assertEqual(ex2.channels, ex.channels)
+            for channel in ex.channels:
+                self.assertTrue(ex2[channel].equals(ex[channel]))
+            del ex2
+
     def testManufacturers(self):
         files = ['Accuri - C6.fcs',
                  'Applied Biosystems - Attune.fcs',
@@ -98,6 +267,23 @@ class TestImport(unittest.TestCase):
             path = self.cwd + '/data/instruments/' + file
             import_op = flow.ImportOp(tubes = [flow.Tube(file = path)])
             import_op.apply()
+            
+    def testParseFCS(self):
+        # 24-bit integers
+        path = self.cwd + '/data/instruments/Cytek xP5.fcs'
+        meta, data = flow.utility.parse_fcs(path)
+        self.assertEqual(len(data), int(meta['$TOT']))
+        self.assertEqual(len(data.columns), int(meta['$PAR']))
+        self.assertTrue(data.values.flags['F_CONTIGUOUS'])
+        self.assertTrue((data.dtypes == 'float64').all())
+        self.assertTrue(data['FSC'].max() < 1024)
+        
+        # 10-bit integers in 16-bit words
+        path = self.cwd + '/data/instruments/Beckman Coulter - Cytomics FC500.LMD'
+        meta, data = flow.utility.parse_fcs(path)
+        self.assertEqual(len(data), int(meta['$TOT']))
+        self.assertTrue((data.max() < 1024).all())
+        self.assertTrue(data['FS Lin'].min() > 0)
     
 if __name__ == "__main__":
     import sys;sys.argv = ['', 'TestImport.testManufacturers']
@@ -56,6 +56,36 @@ class TestKMeans(ImportedDataTest):
         ex2 = self.op.apply(self.ex)
         self.assertEqual(len(ex2['KM'].unique()), 2)
         
+    def testWorkers(self):
+        self.op.by = ["Well", "Dox"]
+        self.op.estimate(self.ex)
+        ex2 = self.op.apply(self.ex)
+        
+        self.op.workers = 2
+        self.op.estimate(self.ex)
+        ex3 = self.op.apply(self.ex)
+        
+        self.assertTrue((ex2['KM'] == ex3['KM']).all())
+        
+    def testSample(self):
+        self.op.by = ["Well"]
+        self.op.sample_fraction = 0.1
+        self.op.estimate(self.ex)
+        
+        for well, sample in self.op._samples.items():
+            self.assertEqual(len(sample), 
+                             round(0.1 * sum(self.ex.data["Well"] == well)))
+        
+        ex2 = self.op.apply(self.ex)
+        self.assertEqual(len(ex2['KM'].unique()), 2)
+
+        # with a subset, the sampled events' labels count from its start
+        self.op.estimate(self.ex, subset = "Dox == 10.0")
+        ex_subset = self.ex.query("Dox == 10.0")
+        for well, sample in self.op._samples.items():
+            self.assertLess(sample.max(), len(ex_subset))
+            self.assertTrue((ex_subset.data.loc[sample, "Well"] == well).all())
+
     def testPlot(self):
         self.op.estimate(self.ex)
         self.op.default_view().plot(self.ex)
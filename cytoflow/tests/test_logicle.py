@@ -19,6 +19,7 @@
 
 import unittest
 
+import numpy as np
 import pandas as pd
 
 import cytoflow as flow
@@ -64,6 +65,25 @@ class TestLogicle(unittest.TestCase):
         x = scale(pd.Series([20]))
         self.assertTrue(isinstance(x, pd.Series))
         
+    def test_logicle_array(self):
+        """
+        Make sure the bulk transform matches the per-value transform
+        """
+        
+        scale = util.scale_factory("logicle", self.ex, channel = "Y2-A")
+        
+        data = self.ex["Y2-A"].values[0:1000]
+        x = scale(data)
+        
+        self.assertTrue(isinstance(x, np.ndarray))
+        self.assertEqual(x.shape, data.shape)
+        for i in range(0, 1000, 50):
+            self.assertAlmostEqual(x[i], scale(float(data[i])))
+            
+        np.testing.assert_allclose(scale.inverse(x), 
+                                   scale.clip(data),
+                                   rtol = 1e-6, atol = 1e-6)
+        
     ### TODO - test the apply function error checking
     
 if __name__ == "__main__":
@@ -24,6 +24,9 @@ Created on Feb 4, 2018
 '''
 import unittest
 import os
+
+import numpy as np
+
 import cytoflow as flow
 
 class TestPCA(unittest.TestCase):
@@ -68,6 +71,18 @@ class TestPCA(unittest.TestCase):
 
         self.assertIn("PCA_1", ex2.channels)
         self.assertIn("PCA_2", ex2.channels)
+        
+    def testWorkers(self):
+        self.op.by = ["Dox"]
+        self.op.estimate(self.ex)
+        ex2 = self.op.apply(self.ex)
+        
+        self.op.workers = 2
+        self.op.estimate(self.ex)
+        ex3 = self.op.apply(self.ex)
+        
+        self.assertTrue(np.allclose(ex2['PCA_1'], ex3['PCA_1']))
+        self.assertTrue(np.allclose(ex2['PCA_2'], ex3['PCA_2']))
 
 
 if __name__ == "__main__":
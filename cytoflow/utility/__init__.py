@@ -19,13 +19,16 @@
 
 from .util_functions import (cartesian, iqr, geom_mean, geom_sd, geom_sd_range,
                              geom_sem, geom_sem_range, num_hist_bins, sanitize_identifier, 
-                             random_string, is_numeric, cov2corr)
+                             random_string, is_numeric, cov2corr, sample_events)
 
 from .algorithms import ci
 from .cytoflow_errors import CytoflowError, CytoflowOpError, CytoflowViewError
 from .cytoflow_errors import CytoflowWarning, CytoflowOpWarning, CytoflowViewWarning
 
 from .scale import scale_factory, IScale, set_default_scale, get_default_scale
+from .parallel import (parallel_map, parallel_map_arrays, num_workers, 
+                       set_default_workers, get_default_workers, 
+                       get_default_executor)
 from .custom_traits import (PositiveInt, PositiveCInt, PositiveFloat, 
                             PositiveCFloat, ScaleEnum, Deprecated, Removed, 
                             FloatOrNone, CFloatOrNone, IntOrNone, CIntOrNone)
@@ -34,4 +37,10 @@ from .matplotlib_widgets import PolygonSelector, SpanSelector, Cursor
 
 from .docstring import expand_class_attributes, expand_method_parameters
 
-from .fcswrite import write_fcs
\ No newline at end of file
+from .fcswrite import write_fcs
+from .fcsread import (parse_fcs, read_fcs_metadata, read_fcs_data, 
+                      iter_fcs_data, reformat_fcs_metadata, fcs_channel_names)
+from .fcscache import fcs_cache_key, load_fcs_cache, save_fcs_cache
+from .bitset import BitArray, BitDtype
+from .column_store import ColumnStore, save_columns, load_columns
+from .cow_dict import CopyOnWriteDict
\ No newline at end of file
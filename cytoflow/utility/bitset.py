@@ -0,0 +1,278 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+cytoflow.utility.bitset
+-----------------------
+
+A compact column type for boolean conditions, such as gate membership.  A
+:class:`BitArray` stores one bit per event instead of the byte per event that
+a ``bool`` column uses, and ``&``, ``|``, ``^`` and ``~`` work on 64-bit words
+at a time.  It is a :mod:`pandas` extension type, registered as ``"bitset"``,
+so ``Experiment.add_condition(name, "bitset", gate)`` stores a gate this way;
+comparisons, indexing and conversions to ``numpy`` all produce ordinary
+booleans.
+'''
+
+import numbers
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import (ExtensionArray, ExtensionDtype,
+                                   register_extension_dtype, take)
+
+@register_extension_dtype
+class BitDtype(ExtensionDtype):
+    """The :mod:`pandas` dtype of a :class:`BitArray`."""
+
+    name = "bitset"
+    type = np.bool_
+    kind = 'b'
+    na_value = False
+    _is_boolean = True
+
+    @classmethod
+    def construct_array_type(cls):
+        return BitArray
+
+    @classmethod
+    def construct_from_string(cls, string):
+        if string == cls.name:
+            return cls()
+        raise TypeError("Cannot construct a 'BitDtype' from '{}'"
+                        .format(string))
+
+
+class BitArray(ExtensionArray):
+    """
+    An array of booleans, packed eight to a byte.  The bits are stored in a
+    ``uint8`` buffer whose length is a multiple of eight bytes, so logical
+    operations can work on ``uint64`` words; the bits past the end of the
+    array are always zero.
+
+    Parameters
+    ----------
+    values : array-like
+        The values, converted with ``numpy.asarray(values, dtype = bool)``.
+        Missing values are not supported.
+    """
+
+    _dtype = BitDtype()
+
+    def __init__(self, values):
+        if isinstance(values, BitArray):
+            self._bits = values._bits
+            self._len = values._len
+            return
+
+        values = np.asarray(values, dtype = np.bool_).reshape(-1)
+        self._len = len(values)
+        self._bits = _pack(values)
+
+    @classmethod
+    def _from_bits(cls, bits, length):
+        """Wrap an already-packed (and already-padded) buffer"""
+        ret = cls.__new__(cls)
+        ret._bits = bits
+        ret._len = length
+        return ret
+
+    @property
+    def words(self):
+        """The bits as an array of ``uint64`` words."""
+        return self._bits.view(np.uint64)
+
+    ### the ExtensionArray interface
+
+    @classmethod
+    def _from_sequence(cls, scalars, dtype = None, copy = False):
+        return cls(scalars)
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls(values)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        return cls(np.concatenate([x.to_numpy() for x in to_concat]))
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def nbytes(self):
+        return self._bits.nbytes
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, item):
+        if isinstance(item, numbers.Integral):
+            if item < 0:
+                item += self._len
+            if not 0 <= item < self._len:
+                raise IndexError("index {} is out of bounds for a BitArray "
+                                 "of length {}".format(item, self._len))
+            return bool((self._bits[item >> 3] >> (item & 7)) & 1)
+
+        item = pd.api.indexers.check_array_indexer(self, item) \
+               if not isinstance(item, slice) else item
+        return type(self)(self.to_numpy()[item])
+
+    def __setitem__(self, key, value):
+        values = self.to_numpy()
+        values[key] = np.asarray(value, dtype = np.bool_) \
+                      if not isinstance(value, BitArray) else value.to_numpy()
+        self._bits = _pack(values)
+
+    def __iter__(self):
+        return iter(self.to_numpy().tolist())
+
+    def __array__(self, dtype = None):
+        return self.to_numpy(dtype = dtype)
+
+    def to_numpy(self, dtype = None, copy = False, na_value = None):
+        values = np.unpackbits(self._bits, count = self._len,
+                               bitorder = 'little').view(np.bool_)
+        if dtype is not None:
+            values = values.astype(dtype, copy = False)
+        return values
+
+    def astype(self, dtype, copy = True):
+        if isinstance(dtype, BitDtype) or dtype == BitDtype.name:
+            return self.copy() if copy else self
+        return self.to_numpy().astype(dtype, copy = False)
+
+    def isna(self):
+        return np.zeros(self._len, dtype = np.bool_)
+
+    def take(self, indices, allow_fill = False, fill_value = None):
+        if allow_fill and fill_value is None:
+            fill_value = False
+        values = take(self.to_numpy(), indices, allow_fill = allow_fill,
+                      fill_value = fill_value)
+        return type(self)(values)
+
+    def copy(self):
+        return self._from_bits(self._bits.copy(), self._len)
+
+    def _values_for_factorize(self):
+        return self.to_numpy().view(np.uint8), 255
+
+    def _values_for_argsort(self):
+        return self.to_numpy()
+
+    def unique(self):
+        n = self.sum()
+        return type(self)([x for x, present in ((False, n < self._len),
+                                                (True, n > 0)) if present])
+
+    def value_counts(self, dropna = True):
+        n = self.sum()
+        return pd.Series([self._len - n, n], index = [False, True])
+
+    def _reduce(self, name, skipna = True, **kwargs):
+        if name == 'any':
+            return self.any()
+        if name == 'all':
+            return self.all()
+        if name == 'sum':
+            return self.sum()
+        return getattr(self.to_numpy(), name)(**kwargs)
+
+    ### fast reductions
+
+    def any(self, *args, **kwargs):
+        return bool(self.words.any())
+
+    def all(self, *args, **kwargs):
+        return self.sum() == self._len
+
+    def sum(self, *args, **kwargs):
+        return int(_popcount(self._bits))
+
+    ### logical operators, on words.
+
+    def __and__(self, other):
+        return self._logical_op(other, np.bitwise_and)
+
+    def __or__(self, other):
+        return self._logical_op(other, np.bitwise_or)
+
+    def __xor__(self, other):
+        return self._logical_op(other, np.bitwise_xor)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __invert__(self):
+        bits = np.invert(self.words).view(np.uint8)
+        _clear_padding(bits, self._len)
+        return self._from_bits(bits, self._len)
+
+    def _logical_op(self, other, op):
+        if isinstance(other, (pd.Series, pd.Index)):
+            return NotImplemented
+
+        if not isinstance(other, BitArray):
+            if np.ndim(other) == 0:
+                other = np.full(self._len, bool(other))
+            other = BitArray(other)
+
+        if len(other) != self._len:
+            raise ValueError("Lengths must match")
+
+        bits = op(self.words, other.words).view(np.uint8)
+        return self._from_bits(bits, self._len)
+
+    ### comparisons produce plain booleans
+
+    def __eq__(self, other):
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+        return self.to_numpy() == np.asarray(other)
+
+    def __ne__(self, other):
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+        return self.to_numpy() != np.asarray(other)
+
+
+def _pack(values):
+    """Pack a boolean array into a zero-padded buffer of whole words"""
+
+    bits = np.zeros(((len(values) + 63) // 64) * 8, dtype = np.uint8)
+    packed = np.packbits(values, bitorder = 'little')
+    bits[:len(packed)] = packed
+    return bits
+
+def _clear_padding(bits, length):
+    """Zero the bits past ``length``"""
+
+    if length & 7:
+        bits[length >> 3] &= (1 << (length & 7)) - 1
+    bits[(length + 7) >> 3:] = 0
+
+# number of bits set in each byte
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype = np.uint8)
+
+def _popcount(bits):
+    return np.bincount(bits, minlength = 256).dot(_POPCOUNT.astype(np.int64))
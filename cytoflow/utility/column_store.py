@@ -0,0 +1,396 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+cytoflow.utility.column_store
+-----------------------------
+
+A backing store for an :class:`.Experiment`'s events that keeps each column in
+its own memory-mapped file in a scratch directory, so the operating system
+can page the events in and out instead of holding them all in memory.
+
+The columns are never written to once they are stored.  Changing a column
+writes a new file, so copies of a store share all the columns they have in
+common (copy-on-write), and a column's file is removed when no store refers
+to it any more.
+
+:func:`save_columns` and :func:`load_columns` save columns in a directory in
+the same format and map them again later, to save and load an 
+:class:`.Experiment`.
+'''
+
+import os, uuid, weakref, pickle
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype, is_categorical_dtype
+
+from .bitset import BitArray, BitDtype
+from .cytoflow_errors import CytoflowError
+
+# the names, files and types of the columns saved by save_columns()
+_MANIFEST_FILE = "columns.pickle"
+
+class ColumnStore(object):
+    """
+    An ordered set of equal-length columns, each kept in a memory-mapped file
+    in :attr:`scratch_dir`.  Numeric and boolean columns are mapped directly;
+    categorical columns map their codes and bitset columns map their bits.
+    Columns of Python objects (like strings) can't be mapped, so they stay in
+    memory.
+
+    Parameters
+    ----------
+    scratch_dir : Str
+        The directory to keep the columns' files in.  Created if it doesn't
+        exist.
+
+    length : Int (default = 0)
+        The number of events (rows).
+    """
+
+    def __init__(self, scratch_dir, length = 0):
+        os.makedirs(scratch_dir, exist_ok = True)
+        self.scratch_dir = scratch_dir
+        self._length = length
+        self._columns = {}
+
+    @classmethod
+    def from_frame(cls, frame, scratch_dir):
+        """
+        Make a new store with the columns of a :class:`pandas.DataFrame`.
+        The frame's index is ignored.
+        """
+
+        store = cls(scratch_dir, len(frame))
+        for name, col in frame.items():
+            store[name] = col
+        return store
+
+    @property
+    def columns(self):
+        """The names of the columns, in order"""
+        return list(self._columns)
+
+    @property
+    def index(self):
+        """The (default) row index of the columns"""
+        return pd.RangeIndex(self._length)
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __iter__(self):
+        return iter(list(self._columns))
+
+    def __getitem__(self, name):
+        """Get a column as a (read-only) :class:`pandas.Series`"""
+
+        if name not in self._columns:
+            raise KeyError(name)
+
+        return pd.Series(self._columns[name].values(),
+                         index = self.index,
+                         name = name,
+                         copy = False)
+
+    def __setitem__(self, name, values):
+        """Store a new column (or replace an old one) by position"""
+
+        if len(values) != self._length:
+            raise CytoflowError("Column {} has {} rows, but the store has {}"
+                                .format(name, len(values), self._length))
+
+        if isinstance(values, (pd.Series, pd.Index)):
+            values = values.array if isinstance(values.dtype, BitDtype) \
+                     else values.values
+
+        self._columns[name] = _MappedColumn.write(self.scratch_dir, values)
+
+    def __delitem__(self, name):
+        del self._columns[name]
+
+    def allocate(self, name, dtype):
+        """
+        Add a new numeric column and return it as a writable array, so it can
+        be filled in place (once!) instead of being copied in.
+        """
+
+        column = _MappedColumn.allocate(self.scratch_dir, dtype, self._length)
+        self._columns[name] = column
+        return column.writable
+
+    def rename(self, old, new):
+        """Rename a column, keeping its place"""
+
+        self._columns = {(new if k == old else k) : v
+                         for k, v in self._columns.items()}
+
+    def reorder(self, names):
+        """Put the columns in the order given by ``names``"""
+
+        self._columns = {k : self._columns[k] for k in names}
+
+    def copy(self):
+        """A new store that shares this one's columns"""
+
+        ret = ColumnStore.__new__(ColumnStore)
+        ret.scratch_dir = self.scratch_dir
+        ret._length = self._length
+        ret._columns = dict(self._columns)
+        return ret
+
+    def take_rows(self, rows):
+        """A new store with only the events at positions ``rows``"""
+
+        rows = np.asarray(rows, dtype = np.intp)
+        ret = ColumnStore(self.scratch_dir, len(rows))
+        for name, column in self._columns.items():
+            ret[name] = column.values()[rows]
+        return ret
+
+    def to_frame(self, rows = None, columns = None):
+        """
+        Copy the columns (or just the events at positions ``rows``, or just
+        the columns in ``columns``) into memory, as a 
+        :class:`pandas.DataFrame`.
+        """
+        
+        if columns is None:
+            columns = list(self._columns)
+
+        if rows is None:
+            index = self.index
+            data = {name : self._columns[name].values() for name in columns}
+        else:
+            # the same index that DataFrame.take() would leave
+            rows = np.asarray(rows, dtype = np.intp)
+            index = pd.Index(rows)
+            data = {name : self._columns[name].values()[rows] 
+                    for name in columns}
+
+        # pandas copies the numpy arrays as it consolidates them into blocks.
+        # the categoricals and bitsets stay mapped, but they're immutable.
+        return pd.DataFrame(data, index = index, columns = list(data))
+
+
+def save_columns(directory, columns, length):
+    """
+    Save some columns to files in ``directory``, so :func:`load_columns` can 
+    map them again later.  Numeric and boolean columns are saved as ``.npy``
+    files; categorical columns save their codes and bitset columns save their
+    bits.  Columns of Python objects are pickled.
+
+    Parameters
+    ----------
+    directory : Str
+        The directory to save the columns in.  Created if it doesn't exist.
+
+    columns : List(Tuple(Str, array-like))
+        ``(name, values)`` pairs, in order.
+
+    length : Int
+        The number of events (rows).
+    """
+
+    os.makedirs(directory, exist_ok = True)
+    manifest = []
+
+    for i, (name, values) in enumerate(columns):
+        if isinstance(values, (pd.Series, pd.Index)):
+            values = values.array if isinstance(values.dtype, BitDtype) \
+                     else values.values
+
+        path = os.path.join(directory, "{}.npy".format(i))
+
+        if isinstance(values, BitArray):
+            np.save(path, values._bits)
+            kind = ("bitset", None)
+        elif is_categorical_dtype(getattr(values, 'dtype', None)):
+            values = pd.Categorical(values)
+            np.save(path, values.codes)
+            kind = ("category", 
+                    CategoricalDtype(values.categories, values.ordered))
+        else:
+            values = np.asarray(values)
+            if values.dtype.hasobject:
+                # can't memory-map Python objects
+                path = os.path.join(directory, "{}.pickle".format(i))
+                with open(path, 'wb') as f:
+                    pickle.dump(values, f)
+                kind = ("object", None)
+            else:
+                np.save(path, values)
+                kind = ("array", None)
+
+        manifest.append((name, os.path.basename(path), kind))
+
+    with open(os.path.join(directory, _MANIFEST_FILE), 'wb') as f:
+        pickle.dump((length, manifest), f)
+
+def load_columns(directory, scratch_dir):
+    """
+    Open the columns saved in ``directory`` by :func:`save_columns`, as a
+    new :class:`ColumnStore`.  Each column is only mapped (or unpickled) the
+    first time it's used, and the files are never changed or removed.
+
+    Parameters
+    ----------
+    directory : Str
+        The directory that the columns were saved in.
+
+    scratch_dir : Str
+        The store's :attr:`~ColumnStore.scratch_dir`, for new columns.
+
+    Returns
+    -------
+    ColumnStore
+    """
+
+    try:
+        with open(os.path.join(directory, _MANIFEST_FILE), 'rb') as f:
+            length, manifest = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        raise CytoflowError("Couldn't read the columns in {}: {}"
+                            .format(directory, e)) from e
+
+    store = ColumnStore(scratch_dir, length)
+    for name, filename, kind in manifest:
+        path = os.path.join(directory, filename)
+        store._columns[name] = _MappedColumn([], _column_loader(path, kind, length))
+
+    return store
+
+
+def _column_loader(path, kind, length):
+    """A function that maps (or unpickles) a column saved by save_columns()"""
+
+    def load():
+        if kind[0] == "object":
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+
+        # you can't map zero bytes
+        values = np.load(path, mmap_mode = 'r' if length > 0 else None)
+
+        if kind[0] == "bitset":
+            return BitArray._from_bits(values, length)
+        elif kind[0] == "category":
+            return pd.Categorical.from_codes(values, dtype = kind[1])
+        else:
+            return values
+
+    return load
+
+
+class _MappedColumn(object):
+    """
+    One column's file(s), and the array (or categorical, or bitset) that maps
+    them.  The files are removed when the column is garbage-collected.
+    """
+
+    def __init__(self, paths, make_values):
+        self._make_values = make_values
+        self._values = None
+        self.writable = None
+        weakref.finalize(self, _remove_files, paths)
+
+    def values(self):
+        if self._values is None:
+            self._values = self._make_values()
+            self.writable = None
+        return self._values
+
+    @classmethod
+    def write(cls, scratch_dir, values):
+        if isinstance(values, BitArray):
+            path, bits = _map_array(scratch_dir, values._bits)
+            length = len(values)
+            return cls([path], lambda: BitArray._from_bits(bits, length))
+
+        if is_categorical_dtype(getattr(values, 'dtype', None)):
+            values = pd.Categorical(values)
+            path, codes = _map_array(scratch_dir, values.codes)
+            dtype = CategoricalDtype(values.categories, values.ordered)
+            return cls([path],
+                       lambda: pd.Categorical.from_codes(codes, dtype = dtype))
+
+        values = np.asarray(values)
+        if values.dtype.hasobject:
+            # can't memory-map Python objects
+            return cls([], lambda: values)
+
+        path, mapped = _map_array(scratch_dir, values)
+        return cls([path], lambda: mapped)
+
+    @classmethod
+    def allocate(cls, scratch_dir, dtype, length):
+        path, mapped = _map_array(scratch_dir, None, dtype, length)
+        ret = cls([path], lambda: _read_only(mapped))
+        ret.writable = mapped
+        return ret
+
+
+def _map_array(scratch_dir, values, dtype = None, length = None):
+    """
+    Write ``values`` (or allocate an array of ``length`` ``dtype``s) into a new
+    file in ``scratch_dir``, and map it.  Empty arrays stay in memory -- you
+    can't map zero bytes.
+    """
+
+    if values is not None:
+        dtype = values.dtype
+        length = len(values)
+
+    if length == 0:
+        return None, np.empty(0, dtype = dtype)
+
+    # in case someone removed it out from under us
+    os.makedirs(scratch_dir, exist_ok = True)
+    
+    path = os.path.join(scratch_dir, "{}.npy".format(uuid.uuid4().hex))
+    mapped = np.lib.format.open_memmap(path,
+                                       mode = 'w+',
+                                       dtype = dtype,
+                                       shape = (length,))
+
+    if values is not None:
+        mapped[:] = values
+        mapped.flush()
+        mapped = _read_only(mapped)
+
+    return path, mapped
+
+def _read_only(array):
+    array = array.view()
+    array.flags.writeable = False
+    return array
+
+def _remove_files(paths):
+    for path in paths:
+        if path is None:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # still mapped somewhere, on a platform that cares
+            pass
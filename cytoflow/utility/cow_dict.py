@@ -0,0 +1,118 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+cytoflow.utility.cow_dict
+-------------------------
+
+A :class:`dict` whose copies share its values until they're used, for
+:attr:`.Experiment.metadata` and :attr:`.Experiment.statistics`.
+'''
+
+import copy
+
+class CopyOnWriteDict(dict):
+    """
+    A :class:`dict` whose :meth:`copy` is cheap: the copy shares the values
+    with the original, by reference, instead of copying them.  The first time
+    either dict hands out a shared value (with ``d[key]``, :meth:`get`, 
+    :meth:`items`, etc.), it replaces its own reference with a deep copy, so
+    changing the value in place can't change the other dict.  Values that are
+    never looked up (or are only looked at with :meth:`peek`) are never 
+    copied.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shared = set()
+        
+    def __reduce__(self):
+        # pickle (and deepcopy) the values, not the bookkeeping
+        return (CopyOnWriteDict, (dict(self),))
+    
+    def copy(self):
+        """A new dict that shares this one's values until they're used"""
+        
+        ret = CopyOnWriteDict(self)
+        self._shared = set(self.keys())
+        ret._shared = set(self.keys())
+        return ret
+    
+    def peek(self, key, default = None):
+        """
+        Get the value for ``key`` without copying it, even if it's shared.  
+        Only use this if you're not going to change the value!
+        """
+        return super().get(key, default)
+    
+    def _own(self, key):
+        """Make sure this dict's value for ``key`` isn't shared"""
+        
+        if key in self._shared:
+            super().__setitem__(key, copy.deepcopy(super().__getitem__(key)))
+            self._shared.discard(key)
+    
+    def __getitem__(self, key):
+        self._own(key)
+        return super().__getitem__(key)
+    
+    def get(self, key, default = None):
+        self._own(key)
+        return super().get(key, default)
+    
+    def setdefault(self, key, default = None):
+        self._own(key)
+        return super().setdefault(key, default)
+    
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        super().__setitem__(key, value)
+        
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        super().__delitem__(key)
+        
+    def pop(self, key, *args):
+        self._own(key)
+        return super().pop(key, *args)
+    
+    def popitem(self):
+        key, value = super().popitem()
+        if key in self._shared:
+            self._shared.discard(key)
+            value = copy.deepcopy(value)
+        return key, value
+    
+    def clear(self):
+        self._shared = set()
+        super().clear()
+        
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+    
+    def values(self):
+        for key in list(self._shared):
+            self._own(key)
+        return super().values()
+    
+    def items(self):
+        for key in list(self._shared):
+            self._own(key)
+        return super().items()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+cytoflow.utility.fcscache
+-------------------------
+
+An on-disk cache of decoded FCS files.  Each entry is a directory holding the
+events as a ``.npy`` file (which can be memory-mapped instead of decoded) and
+the file's metadata as a pickle.  Entries are keyed on the FCS file's path,
+size, modification time and a hash of its contents, and the least-recently-used
+entries are evicted whenever the cache is used and is larger than its maximum 
+size.
+'''
+
+import os, pickle, hashlib, shutil, tempfile
+
+import numpy as np
+
+# how much of the beginning and end of each file to hash
+_HASH_BYTES = 1 << 16
+
+_DATA_FILE = "events.npy"
+_META_FILE = "metadata.pickle"
+
+def fcs_cache_key(filename, data_set = 0):
+    """
+    Compute the cache key for a data set in an FCS file.
+
+    The key covers the file's absolute path, size and modification time, and
+    a hash of its first and last 64 kB -- which includes the HEADER and TEXT
+    segments and the end of the DATA segment.  (Hashing the whole file would
+    cost about as much as decoding it.)
+
+    Parameters
+    ----------
+    filename : Str
+        The FCS file.
+
+    data_set : Int (default = 0)
+        The data set in the file.
+
+    Returns
+    -------
+    Str
+        A hex string that is safe to use as a directory name.
+    """
+
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+
+    h = hashlib.sha1()
+    h.update(repr((path, stat.st_size, stat.st_mtime_ns, data_set)).encode())
+
+    with open(path, 'rb') as f:
+        h.update(f.read(_HASH_BYTES))
+        if stat.st_size > _HASH_BYTES:
+            f.seek(max(_HASH_BYTES, stat.st_size - _HASH_BYTES))
+            h.update(f.read())
+
+    return h.hexdigest()
+
+def load_fcs_cache(cache_dir, key, max_size = None):
+    """
+    Look up a decoded FCS file in the cache.  If it's there, evict the 
+    least-recently-used (other) entries until the cache is no larger than
+    ``max_size`` -- so a smaller limit takes effect even if nothing new is
+    added to the cache.
+
+    Parameters
+    ----------
+    cache_dir : Str
+        The cache directory.
+
+    key : Str
+        The entry's key, from :func:`fcs_cache_key`.
+
+    max_size : Int (default = None)
+        The maximum size of the cache, in bytes.  If ``None``, don't evict
+        anything.
+
+    Returns
+    -------
+    (Dict(Str : Any), numpy.ndarray) or None
+        The file's metadata (as returned by :func:`.read_fcs_metadata`) and
+        a read-only, memory-mapped array of its events; or ``None`` if the
+        entry isn't in the cache.
+    """
+
+    entry = os.path.join(cache_dir, key)
+
+    try:
+        with open(os.path.join(entry, _META_FILE), 'rb') as f:
+            meta = pickle.load(f)
+        data = np.load(os.path.join(entry, _DATA_FILE), mmap_mode = 'r')
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        # missing, half-evicted, or otherwise unusable
+        return None
+
+    # mark the entry as recently used
+    try:
+        os.utime(entry)
+        if max_size is not None:
+            _evict(cache_dir, max_size, keep = key)
+    except OSError:
+        pass
+
+    return meta, data
+
+def save_fcs_cache(cache_dir, key, meta, data, max_size = None):
+    """
+    Add a decoded FCS file to the cache, then evict the least-recently-used
+    entries until the cache is no larger than ``max_size``.  Errors writing
+    the cache are ignored -- it's only a cache, after all.
+
+    Parameters
+    ----------
+    cache_dir : Str
+        The cache directory.  Created if it doesn't exist.
+
+    key : Str
+        The entry's key, from :func:`fcs_cache_key`.
+
+    meta : Dict(Str : Any)
+        The file's metadata, as returned by :func:`.read_fcs_metadata`.
+
+    data : numpy.ndarray
+        The file's events.
+
+    max_size : Int (default = None)
+        The maximum size of the cache, in bytes.  If ``None``, don't evict
+        anything.
+    """
+
+    try:
+        os.makedirs(cache_dir, exist_ok = True)
+
+        # write the entry somewhere else, then move it into place, so another
+        # process never sees half an entry.
+        tmp = tempfile.mkdtemp(prefix = '.' + key, dir = cache_dir)
+        try:
+            with open(os.path.join(tmp, _META_FILE), 'wb') as f:
+                pickle.dump(meta, f)
+            np.save(os.path.join(tmp, _DATA_FILE), data)
+            os.rename(tmp, os.path.join(cache_dir, key))
+        except OSError:
+            # including when someone else already added this entry
+            shutil.rmtree(tmp, ignore_errors = True)
+
+        if max_size is not None:
+            _evict(cache_dir, max_size, keep = key)
+    except OSError:
+        pass
+
+def _evict(cache_dir, max_size, keep = None):
+    """
+    Remove the least-recently-used entries until the cache is no larger than
+    ``max_size`` bytes, but never remove ``keep``.
+    """
+
+    entries = []
+    total = 0
+
+    for entry in os.scandir(cache_dir):
+        if not entry.is_dir() or entry.name.startswith('.'):
+            continue
+
+        size = 0
+        for f in os.scandir(entry.path):
+            size += f.stat().st_size
+
+        entries.append((entry.stat().st_mtime, entry.name, size))
+        total += size
+
+    for _, name, size in sorted(entries):
+        if total <= max_size:
+            break
+
+        if name == keep:
+            continue
+
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors = True)
+        total -= size
@@ -0,0 +1,566 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+cytoflow.utility.fcsread
+------------------------
+
+Read .fcs files for flow cytometry.
+
+The HEADER and TEXT segments are parsed the same way :mod:`fcsparser` parses
+them, so the metadata is interchangeable.  The DATA segment, however, is
+memory-mapped and decoded straight into a ``float64`` (or ``float32``)
+column-major array:
+one pass for the standard (1, 2, 4 and 8-byte) field widths, and a vectorized
+byte- or bit-unpacking pass for the odd ones.
+'''
+
+import os, string, warnings
+
+import numpy as np
+import pandas as pd
+
+from .cytoflow_errors import CytoflowError
+
+def read_fcs_metadata(filename, data_set = 0):
+    """
+    Read the HEADER and TEXT segments of an FCS file.
+
+    Parameters
+    ----------
+    filename : Str
+        The FCS file to read.
+
+    data_set : Int (default = 0)
+        Which data set to read, if the file has more than one (linked by
+        ``$NEXTDATA``.)
+
+    Returns
+    -------
+    Dict(Str : Any)
+        The keywords from the TEXT segment, as strings -- except ``$PnB``,
+        ``$PAR``, ``$TOT`` and ``$NEXTDATA``, which are converted to ``int``.
+        The parsed HEADER is in the ``__header__`` key.
+    """
+
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+
+        offset = 0
+        for i in range(data_set + 1):
+            meta = _read_text(f, filename, offset, file_size)
+
+            if i == data_set:
+                break
+
+            next_data = meta.get('$NEXTDATA', 0)
+            if not next_data:
+                warnings.warn("File {} does not contain data set {}"
+                              .format(filename, data_set))
+                break
+
+            offset = offset + next_data
+
+    return meta
+
+def read_fcs_data(filename, meta, rows = None, dtype = "float64"):
+    """
+    Read the DATA segment of an FCS file.
+
+    Parameters
+    ----------
+    filename : Str
+        The FCS file to read.
+
+    meta : Dict(Str : Any)
+        The file's metadata, from :func:`read_fcs_metadata`.  Must not have
+        been reformatted.
+        
+    rows : array of Int (default = None)
+        If set, decode only these events (0-based, in this order) -- the
+        rest of the DATA segment is never touched.  Sorted indices read 
+        fastest.
+        
+    dtype : {"float64", "float32"} (default = "float64")
+        The type of the returned array.  The events are decoded straight 
+        into it, so ``float32`` needs half the memory.
+
+    Returns
+    -------
+    numpy.ndarray
+        A ``dtype`` array with one row per event and one column per
+        parameter, in Fortran (column-major) order.
+    """
+
+    layout = _data_layout(filename, meta)
+    n_events = layout['events']
+    
+    if rows is not None:
+        rows = np.asarray(rows, dtype = np.intp)
+        if len(rows) > 0 and (rows.min() < 0 or rows.max() >= n_events):
+            raise CytoflowError("FCS file {} only has {} events"
+                                .format(filename, n_events))
+
+    ret = np.empty((n_events if rows is None else len(rows), 
+                    len(layout['fields'])),
+                   dtype = dtype,
+                   order = 'F')
+
+    if len(ret) == 0:
+        return ret
+
+    raw = np.memmap(filename,
+                    dtype = np.uint8,
+                    mode = 'r',
+                    offset = layout['start'],
+                    shape = (n_events, layout['event_bytes']))
+
+    try:
+        if rows is not None:
+            # copies just the rows we want out of the file
+            raw = raw[rows]
+            
+        _decode(raw.reshape(-1), layout, ret)
+    finally:
+        del raw
+
+    return ret
+
+def iter_fcs_data(filename, meta, chunk_events = 1000000, dtype = "float64"):
+    """
+    Read the DATA segment of an FCS file, a block of events at a time, so 
+    that files larger than memory can be processed.
+
+    Parameters
+    ----------
+    filename : Str
+        The FCS file to read.
+
+    meta : Dict(Str : Any)
+        The file's metadata, from :func:`read_fcs_metadata`.  Must not have
+        been reformatted.
+        
+    chunk_events : Int (default = 1000000)
+        How many events in each block.  The last block may be smaller.
+        
+    dtype : {"float64", "float32"} (default = "float64")
+        The type of the returned arrays.
+
+    Yields
+    ------
+    numpy.ndarray
+        ``dtype`` arrays with (up to) ``chunk_events`` rows and one column 
+        per parameter, in Fortran (column-major) order.
+    """
+    
+    if chunk_events < 1:
+        raise CytoflowError("chunk_events must be >= 1")
+
+    layout = _data_layout(filename, meta)
+    n_events = layout['events']
+    n_fields = len(layout['fields'])
+
+    if n_events == 0:
+        return
+
+    raw = np.memmap(filename,
+                    dtype = np.uint8,
+                    mode = 'r',
+                    offset = layout['start'],
+                    shape = (n_events, layout['event_bytes']))
+
+    try:
+        for first in range(0, n_events, chunk_events):
+            last = min(first + chunk_events, n_events)
+            ret = np.empty((last - first, n_fields),
+                           dtype = dtype,
+                           order = 'F')
+            _decode(raw[first:last].reshape(-1), layout, ret)
+            yield ret
+    finally:
+        del raw
+
+def fcs_channel_names(meta, channel_naming = "$PnS"):
+    """
+    Get the channel names from an FCS file's metadata, the same way
+    :mod:`fcsparser` does: use ``channel_naming``, unless it is missing or
+    the names aren't unique, in which case use the other one.
+    """
+
+    if channel_naming not in ("$PnN", "$PnS"):
+        raise CytoflowError('channel_naming must be either "$PnN" or "$PnS"')
+
+    channel_numbers = _channel_numbers(meta)
+
+    try:
+        names_n = tuple([meta['$P{0}N'.format(i)] for i in channel_numbers])
+    except KeyError:
+        names_n = ()
+
+    try:
+        names_s = tuple([meta['$P{0}S'.format(i)] for i in channel_numbers])
+    except KeyError:
+        names_s = ()
+
+    if channel_naming == '$PnS':
+        channel_names, channel_names_alternate = names_s, names_n
+    else:
+        channel_names, channel_names_alternate = names_n, names_s
+
+    if len(channel_names) == 0:
+        channel_names = channel_names_alternate
+
+    if len(set(channel_names)) != len(channel_names):
+        warnings.warn("The channel names (defined by {}) were not unique. "
+                      "Using the alternate channel names instead."
+                      .format(channel_naming))
+        channel_names = channel_names_alternate
+
+    return channel_names
+
+def reformat_fcs_metadata(meta, channel_naming = "$PnS"):
+    """
+    Collect the per-channel metadata into a :class:`pandas.DataFrame` in the
+    ``_channels_`` key, and put the channel names in the ``_channel_names_``
+    key, like :func:`fcsparser.parse` does with ``reformat_meta = True``.
+    Operates *in place*.
+    """
+
+    channel_numbers = _channel_numbers(meta)
+
+    # figure out the names first, while the $PnN and $PnS keys are still there
+    channel_names = fcs_channel_names(meta, channel_naming)
+
+    channel_properties = [key[3:] for key in meta
+                          if key[:3] == '$P1' and key[3] not in string.digits]
+
+    channel_matrix = [[meta.get('$P{0}{1}'.format(ch, p)) for p in channel_properties]
+                      for ch in channel_numbers]
+
+    for ch in channel_numbers:
+        for p in channel_properties:
+            meta.pop('$P{0}{1}'.format(ch, p), None)
+
+    column_names = ['$Pn{0}'.format(p) for p in channel_properties]
+
+    df = pd.DataFrame(channel_matrix,
+                      columns = column_names,
+                      index = (1 + np.arange(meta['$PAR'])))
+
+    if '$PnE' in column_names:
+        df['$PnE'] = df['$PnE'].apply(lambda x: x.split(','))
+
+    df.index.name = 'Channel Number'
+    meta['_channels_'] = df
+    meta['_channel_names_'] = channel_names
+
+    return meta
+
+def parse_fcs(filename,
+              meta_data_only = False,
+              channel_naming = "$PnS",
+              reformat_meta = False,
+              data_set = 0):
+    """
+    Parse an FCS file.  A drop-in replacement for :func:`fcsparser.parse`,
+    except that the data is always ``float64``.
+
+    Parameters
+    ----------
+    filename : Str
+        The FCS file to read
+
+    meta_data_only : Bool (default = False)
+        If ``True``, only read the HEADER and TEXT segments.
+
+    channel_naming : {"$PnS", "$PnN"} (default = "$PnS")
+        Which keyword to use for the channel (column) names.
+
+    reformat_meta : Bool (default = False)
+        If ``True``, reformat the metadata as :func:`reformat_fcs_metadata`
+        does.
+
+    data_set : Int (default = 0)
+        Which data set to read, if the file has more than one.
+
+    Returns
+    -------
+    If ``meta_data_only`` is ``True``, the metadata dictionary.  Otherwise,
+    a tuple of the metadata and a :class:`pandas.DataFrame` containing the
+    events.
+    """
+
+    meta = read_fcs_metadata(filename, data_set = data_set)
+
+    if not meta_data_only:
+        data = read_fcs_data(filename, meta)
+
+    if reformat_meta:
+        reformat_fcs_metadata(meta, channel_naming)
+        channel_names = meta['_channel_names_']
+    else:
+        channel_names = fcs_channel_names(meta, channel_naming)
+
+    if meta_data_only:
+        return meta
+    else:
+        return meta, pd.DataFrame(data, columns = list(channel_names), copy = False)
+
+def _read_text(f, filename, offset, file_size):
+    """
+    Read the HEADER and TEXT segments of the data set that starts at
+    ``offset``.
+    """
+
+    f.seek(offset)
+    header = {'FCS format' : f.read(6)}
+    f.read(4)
+
+    for field in ('text start', 'text end', 'data start', 'data end',
+                  'analysis start', 'analysis end'):
+        s = f.read(8)
+        try:
+            field_value = int(s)
+        except ValueError:
+            field_value = 0
+        header[field] = field_value + offset
+
+    for k in ('text start', 'text end'):
+        if header[k] == offset:
+            raise CytoflowError('The FCS file "{}" seems corrupted. (Parser '
+                                'cannot locate information about the "{}" '
+                                'segment.)'.format(filename, k))
+        elif header[k] > file_size:
+            raise CytoflowError('The FCS file "{}" is corrupted. "{}" segment '
+                                'is larger than file size'.format(filename, k))
+
+    f.seek(header['text start'])
+    raw_text = f.read(header['text end'] - header['text start'] + 1)
+    try:
+        raw_text = raw_text.decode('utf-8')
+    except UnicodeDecodeError:
+        raw_text = raw_text.decode('utf-8', errors = 'ignore')
+
+    delimiter = raw_text[0]
+
+    if raw_text[-1] != delimiter:
+        raw_text = raw_text.strip()
+        if raw_text[-1] != delimiter:
+            raise CytoflowError("The FCS file {} doesn't have the same delimiter "
+                                "at the beginning and end of the TEXT segment"
+                                .format(filename))
+
+    raw_text_segments = raw_text[1:-1].split(delimiter)
+    keys, values = raw_text_segments[0::2], raw_text_segments[1::2]
+    meta = {key : value for key, value in zip(keys, values)}
+
+    if '$PAR' not in meta:
+        raise CytoflowError("The FCS file {} doesn't have a $PAR keyword"
+                            .format(filename))
+
+    for key in ['$P{0}B'.format(i) for i in _channel_numbers(meta)] + \
+               ['$NEXTDATA', '$PAR', '$TOT']:
+        if key in meta:
+            meta[key] = int(meta[key])
+
+    # the DATA segment may be specified in the TEXT segment instead of the
+    # HEADER (for big files.)  either way, it's relative to the start of
+    # this data set.
+    if header['data start'] == offset and '$BEGINDATA' in meta:
+        header['data start'] = int(meta['$BEGINDATA']) + offset
+    if header['data end'] == offset and '$ENDDATA' in meta:
+        header['data end'] = int(meta['$ENDDATA']) + offset
+
+    header['file size'] = file_size
+    meta['__header__'] = header
+
+    return meta
+
+def _channel_numbers(meta):
+    pars = int(meta['$PAR'])
+    if '$P0B' in meta:
+        return range(0, pars)
+    else:
+        return range(1, pars + 1)
+
+def _data_layout(filename, meta):
+    """
+    Work out where the DATA segment is and how to decode it.
+    """
+
+    if meta.get('$MODE', 'L') != 'L':
+        raise CytoflowError("FCS file {}: $MODE {} is not supported"
+                            .format(filename, meta['$MODE']))
+
+    if '$P0B' in meta:
+        raise CytoflowError("FCS file {}: not expecting a parameter starting at 0"
+                            .format(filename))
+
+    byteord = meta['$BYTEORD'].strip()
+    byteord = [int(x) for x in byteord.split(',')]
+    if byteord == sorted(byteord):
+        endian = '<'
+    elif byteord == sorted(byteord, reverse = True):
+        endian = '>'
+    else:
+        raise CytoflowError("FCS file {}: $BYTEORD {} is not supported"
+                            .format(filename, meta['$BYTEORD']))
+
+    datatype = meta['$DATATYPE'].strip().upper()
+    if datatype not in ('F', 'D', 'I'):
+        raise CytoflowError("FCS file {}: $DATATYPE {} is not supported"
+                            .format(filename, meta['$DATATYPE']))
+
+    bits = [int(meta['$P{0}B'.format(i)]) for i in _channel_numbers(meta)]
+
+    header = meta['__header__']
+    start = header['data start']
+    n_events = int(meta['$TOT'])
+
+    if datatype in ('F', 'D'):
+        for b in bits:
+            if b % 8 != 0:
+                raise CytoflowError("FCS file {}: $DATATYPE {} with a "
+                                    "{}-bit parameter is not supported"
+                                    .format(filename, datatype, b))
+
+        fields = [('{}f{}'.format(endian, b // 8), b // 8, None) for b in bits]
+    else:
+        # integers that don't fill a whole number of bytes are (almost always)
+        # stored in the low bits of a whole word; the rest of the word may be
+        # used for other things, so mask it off.
+        fields = []
+        for b in bits:
+            n = (b + 7) // 8
+            mask = (1 << b) - 1 if b % 8 != 0 else None
+            if n in (1, 2, 4, 8):
+                fields.append(('{}u{}'.format(endian, n), n, mask))
+            else:
+                # an odd byte width -- we'll put the integers back together
+                # ourselves.
+                fields.append(('u1', n, mask))
+
+    event_bytes = sum([n for _, n, _ in fields])
+    packed = False
+
+    # ... but FCS 2.0 also allows the integers to be bit-packed.  if the
+    # DATA segment is too short to hold whole words but big enough for the
+    # packed bits, that's what we have.
+    segment_bytes = header['data end'] - start + 1
+    if datatype == 'I' and sum(bits) % 8 == 0 and \
+       segment_bytes < n_events * event_bytes and \
+       segment_bytes >= n_events * (sum(bits) // 8):
+        fields = [('bits', b, None) for b in bits]
+        event_bytes = sum(bits) // 8
+        packed = True
+
+    if start + n_events * event_bytes > header['file size']:
+        raise CytoflowError("The FCS file {} is corrupted. Part of the data "
+                            "segment is missing.".format(filename))
+
+    return {'start' : start,
+            'events' : n_events,
+            'event_bytes' : event_bytes,
+            'endian' : endian,
+            'fields' : fields,
+            'packed' : packed}
+
+def _decode(raw, layout, out):
+    """
+    Decode the raw bytes of some whole events into the float array ``out``,
+    which must have one row per event and one column per field.
+    """
+
+    fields = layout['fields']
+    n_events = out.shape[0]
+
+    if layout['packed']:
+        _decode_packed(raw, layout, out)
+        return
+
+    dtypes = set([dt for dt, _, _ in fields])
+    masks = [mask for _, _, mask in fields]
+    
+    if len(dtypes) == 1 and 'u1' not in dtypes:
+        # the easy (and common) case: every parameter has the same type, so
+        # we can view the events as a 2D array and cast it in one pass
+        events = raw.view(fields[0][0]).reshape((n_events, len(fields)))
+        if any([m is not None for m in masks]):
+            for i, mask in enumerate(masks):
+                if mask is None:
+                    out[:, i] = events[:, i]
+                else:
+                    out[:, i] = events[:, i] & mask
+        else:
+            out[...] = events
+        return
+
+    record = np.dtype([('f{}'.format(i), dt if dt != 'u1' else ('u1', (n,)))
+                       for i, (dt, n, _) in enumerate(fields)])
+    events = raw.view(record)
+
+    for i, (dt, n, mask) in enumerate(fields):
+        col = events['f{}'.format(i)]
+        if dt == 'u1':
+            col = _combine_bytes(col, layout['endian'])
+            
+        if mask is None:
+            out[:, i] = col
+        else:
+            out[:, i] = col & mask
+
+def _combine_bytes(col, endian):
+    """
+    Put together unsigned integers with an odd number of bytes.  ``col`` has
+    one row per event and one column per byte.
+    """
+
+    n = col.shape[1]
+    value = np.zeros(col.shape[0], dtype = np.uint64)
+
+    for k in range(n):
+        shift = 8 * k if endian == '<' else 8 * (n - k - 1)
+        value |= col[:, k].astype(np.uint64) << np.uint64(shift)
+
+    return value
+
+def _decode_packed(raw, layout, out):
+    """
+    Unpack bit-packed integers, most significant bit first.
+    """
+
+    n_events = out.shape[0]
+    event_bytes = layout['event_bytes']
+
+    # unpack a block of events at a time, to bound the memory that the
+    # bit array takes up
+    block = max(1, (1 << 24) // (8 * event_bytes))
+
+    for first in range(0, n_events, block):
+        last = min(first + block, n_events)
+        event_bits = np.unpackbits(raw[first * event_bytes : last * event_bytes]
+                                   .reshape((last - first, event_bytes)),
+                                   axis = 1)
+
+        bit = 0
+        for i, (_, width, _) in enumerate(layout['fields']):
+            weights = 2.0 ** np.arange(width - 1, -1, -1)
+            out[first:last, i] = event_bits[:, bit : bit + width].dot(weights)
+            bit += width
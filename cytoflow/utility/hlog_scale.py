@@ -36,6 +36,7 @@ from matplotlib.ticker import NullFormatter, LogFormatterMathtext
 from matplotlib.ticker import Locator
 
 from .scale import IScale, ScaleMixin, register_scale
+from .util_functions import _single_if
 from .cytoflow_errors import CytoflowError
 
 @provides(IScale)
@@ -92,16 +93,18 @@ class HlogScale(ScaleMixin):
         f = _make_hlog_numeric(self.b, 1.0, np.log10(self.range))
 
         if isinstance(data, pd.Series):            
-            return data.apply(f)
+            return pd.Series(_single_if(f(data.values), data), 
+                             index = data.index,
+                             name = data.name)
         elif isinstance(data, np.ndarray):
-            return f(data)
+            return _single_if(f(data), data)
         elif isinstance(data, (int, float)):
             # numpy returns a 0-dim array.  wtf.
             return float(f(data))
         else:
             try:
-                return list(map(f, data))
-            except TypeError as e:
+                return f(list(data)).tolist()
+            except (TypeError, ValueError) as e:
                 raise CytoflowError("Unknown data type in HlogScale.__call__") from e
 
         
@@ -113,10 +116,11 @@ class HlogScale(ScaleMixin):
         f_inv = lambda y, b = self.b, d = np.log10(self.range): hlog_inv(y, b, 1.0, d)
         
         if isinstance(data, pd.Series):            
-            return data.apply(f_inv)
+            return pd.Series(_single_if(f_inv(data.values.astype(np.float64)), data), 
+                             index = data.index,
+                             name = data.name)
         elif isinstance(data, np.ndarray):
-            inverse = np.vectorize(f_inv)
-            return inverse(data)
+            return _single_if(f_inv(data.astype(np.float64)), data)
         elif isinstance(data, float):
             return f_inv(data)
         else:
@@ -248,11 +252,13 @@ class MatplotlibHlogScale(HasTraits, matplotlib.scale.ScaleBase):
             f = _make_hlog_numeric(self.b, 1.0, np.log10(self.range))
 
             if isinstance(values, pd.Series):            
-                return values.apply(f)
+                return pd.Series(f(values.values), 
+                                 index = values.index,
+                                 name = values.name)
             elif isinstance(values, np.ndarray):
                 return f(values)
             elif isinstance(values, float):
-                return f(values)
+                return float(f(values))
             else:
                 raise CytoflowError("Unknown data type in MatplotlibHlogScale.HlogTransform.transform_non_affine")
 
@@ -279,10 +285,11 @@ class MatplotlibHlogScale(HasTraits, matplotlib.scale.ScaleBase):
             f_inv = lambda y, b = self.b, d = np.log10(self.range): hlog_inv(y, b, 1.0, d)
             
             if isinstance(values, pd.Series):            
-                return values.apply(f_inv)
+                return pd.Series(f_inv(values.values.astype(np.float64)), 
+                                 index = values.index,
+                                 name = values.name)
             elif isinstance(values, np.ndarray):
-                inverse = np.vectorize(f_inv)
-                return inverse(values)
+                return f_inv(values.astype(np.float64))
             elif isinstance(values, float):
                 return f_inv(values)
             else:
@@ -400,8 +407,6 @@ matplotlib.scale.register_scale(MatplotlibHlogScale)
 # http://gorelab.bitbucket.org/flowcytometrytools/
 # thanks, Eugene!
 
-import scipy.optimize
-
 def hlog_inv(y, b, r, d):
     '''
     Inverse of base 10 hyperlog transform.
@@ -418,10 +423,53 @@ def _make_hlog_numeric(b, r, d):
     '''
     Return a function that numerically computes the hlog transformation for given parameter values.
     '''
-    hlog_obj = lambda y, x, b, r, d: hlog_inv(y, b, r, d) - x
-    find_inv = np.vectorize(lambda x: scipy.optimize.brentq(hlog_obj, -2*r, 2*r, 
-                                        args=(x, b, r, d)))
-    return find_inv 
+    return lambda x: _hlog_newton(x, b, r, d)
+
+def _hlog_newton(x, b, r, d, tol = 1e-12, max_iter = 100):
+    '''
+    Solve ``hlog_inv(y, b, r, d) == x`` for ``y``, for a whole array ``x`` at
+    once.
+    
+    ``hlog_inv`` is odd, so we solve ``g(u) = 10**u - 1 + b*u = |x|`` for
+    ``u >= 0`` and then put the sign back (``u = y * d / r``).  ``g`` is
+    increasing and convex, and both ``log10(|x| + 1)`` and ``|x| / b`` are upper
+    bounds on the root, so Newton's method started from the smaller of them
+    converges monotonically from above -- it can't overshoot or leave the
+    bracket ``[0, u0]``.  We iterate (only on the values that haven't 
+    converged yet) until the relative step is smaller than ``tol``.
+    '''
+    
+    x = np.asarray(x, dtype = np.float64)
+    shape = x.shape
+    
+    # work on a flat copy of the values, so scalars and arrays of any 
+    # shape are updated in place the same way
+    x = np.atleast_1d(x).reshape(-1)
+    ax = np.abs(x)
+    ln10 = np.log(10.0)
+    
+    u = np.log10(ax + 1.0)
+    if b > 0:
+        u = np.minimum(u, ax / b)
+        
+    active = np.flatnonzero(np.isfinite(ax) & (ax > 0))
+    
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        
+        ua = u[active]
+        e = np.expm1(ua * ln10)
+        step = (e + b * ua - ax[active]) / (ln10 * (e + 1.0) + b)
+        ua -= step
+        u[active] = ua
+        
+        active = active[np.abs(step) > tol * ua]
+    
+    y = (np.copysign(u, x) * r / d).reshape(shape)
+    
+    # a scalar in, a scalar out
+    return y[()] if y.ndim == 0 else y
 
 def hlog(x, b, r, d):
     '''
@@ -120,3 +120,61 @@ double FastLogicle::inverse (int index) const
 
     return p->lookup[index];
 }
+
+void FastLogicle::scaleArray (double * values, size_t n) const
+{
+	const double lo = p->lookup[0];
+	const double hi = p->lookup[p->bins];
+
+	for (size_t i = 0; i < n; ++i)
+	{
+		double value = values[i];
+
+		// out-of-range values (and NaNs) become NaN instead of throwing
+		// IllegalArgument, so callers can transform whole arrays at once
+		if (!(value >= lo && value < hi))
+		{
+			values[i] = NaN;
+			continue;
+		}
+
+		// binary search for the appropriate bin
+		int lo_bin = 0;
+		int hi_bin = p->bins;
+		while (hi_bin - lo_bin > 1)
+		{
+			int mid = (lo_bin + hi_bin) >> 1;
+			if (value < p->lookup[mid])
+				hi_bin = mid;
+			else
+				lo_bin = mid;
+		}
+
+		// inverse interpolate the table linearly
+		double delta = (value - p->lookup[lo_bin])
+		  / (p->lookup[lo_bin + 1] - p->lookup[lo_bin]);
+
+		values[i] = (lo_bin + delta) / (double)p->bins;
+	}
+}
+
+void FastLogicle::inverseArray (double * scales, size_t n) const
+{
+	for (size_t i = 0; i < n; ++i)
+	{
+		// find the bin
+		double x = scales[i] * p->bins;
+		if (!(x >= 0 && x < p->bins))
+		{
+			scales[i] = NaN;
+			continue;
+		}
+
+		int index = (int)floor(x);
+
+		// interpolate the table linearly
+		double delta = x - index;
+
+		scales[i] = (1 - delta) * p->lookup[index] + delta * p->lookup[index + 1];
+	}
+}
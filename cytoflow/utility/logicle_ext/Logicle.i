@@ -2,6 +2,7 @@
 %module Logicle
 %{
 #define SWIG_FILE_WITH_INIT
+#include <cstring>
 #include "logicle.h"
 %}
 
@@ -23,6 +24,42 @@
    }
 }
 
+// transform a contiguous, writable buffer of doubles (ie, a numpy float64
+// array) in place, without a round-trip into python for every value.
+%typemap(in) (double * values, size_t n) (Py_buffer view),
+             (double * scales, size_t n) (Py_buffer view) {
+   view.obj = NULL;
+   if (PyObject_GetBuffer($input, &view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) != 0) {
+      SWIG_fail;
+   }
+   if (view.format == NULL || strcmp(view.format, "d") != 0) {
+      PyErr_SetString(PyExc_TypeError, "Expected a contiguous buffer of doubles");
+      SWIG_fail;
+   }
+   $1 = (double *) view.buf;
+   $2 = (size_t) (view.len / sizeof(double));
+}
+
+%typemap(freearg) (double * values, size_t n),
+                  (double * scales, size_t n) {
+   if (view$argnum.obj) {
+      PyBuffer_Release(&view$argnum);
+   }
+}
+
+// the array methods don't throw, so we can release the GIL while they run
+%exception scaleArray {
+   Py_BEGIN_ALLOW_THREADS
+   $action
+   Py_END_ALLOW_THREADS
+}
+
+%exception inverseArray {
+   Py_BEGIN_ALLOW_THREADS
+   $action
+   Py_END_ALLOW_THREADS
+}
+
 class Logicle
 {
 public:
@@ -149,6 +186,9 @@ public:
         int intScale (double value) const;
         double inverse (int scale) const;
 
+        void scaleArray (double * values, size_t n) const;
+        void inverseArray (double * scales, size_t n) const;
+
 private:
         void initialize (int bins);
 
@@ -145,6 +145,12 @@ class FastLogicle(Logicle):
     def inverse(self, *args):
         return _Logicle.FastLogicle_inverse(self, *args)
 
+    def scaleArray(self, values):
+        return _Logicle.FastLogicle_scaleArray(self, values)
+
+    def inverseArray(self, scales):
+        return _Logicle.FastLogicle_inverseArray(self, scales)
+
 # Register FastLogicle in _Logicle:
 _Logicle.FastLogicle_swigregister(FastLogicle)
 FastLogicle.DEFAULT_BINS = _Logicle.cvar.FastLogicle_DEFAULT_BINS
@@ -3037,6 +3037,7 @@ namespace swig {
 
 
 #define SWIG_FILE_WITH_INIT
+#include <cstring>
 #include "logicle.h"
 
 
@@ -4508,6 +4509,110 @@ fail:
 }
 
 
+SWIGINTERN PyObject *_wrap_FastLogicle_scaleArray(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
+  PyObject *resultobj = 0;
+  FastLogicle *arg1 = (FastLogicle *) 0 ;
+  double *arg2 = (double *) 0 ;
+  size_t arg3 ;
+  void *argp1 = 0 ;
+  int res1 = 0 ;
+  Py_buffer view2 ;
+  PyObject * obj0 = 0 ;
+  PyObject * obj1 = 0 ;
+  
+  view2.obj = NULL;
+  if (!PyArg_ParseTuple(args,(char *)"OO:FastLogicle_scaleArray",&obj0,&obj1)) SWIG_fail;
+  res1 = SWIG_ConvertPtr(obj0, &argp1,SWIGTYPE_p_FastLogicle, 0 |  0 );
+  if (!SWIG_IsOK(res1)) {
+    SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "FastLogicle_scaleArray" "', argument " "1"" of type '" "FastLogicle const *""'"); 
+  }
+  arg1 = reinterpret_cast< FastLogicle * >(argp1);
+  {
+    view2.obj = NULL;
+    if (PyObject_GetBuffer(obj1, &view2, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) != 0) {
+      SWIG_fail;
+    }
+    if (view2.format == NULL || strcmp(view2.format, "d") != 0) {
+      PyErr_SetString(PyExc_TypeError, "Expected a contiguous buffer of doubles");
+      SWIG_fail;
+    }
+    arg2 = (double *) view2.buf;
+    arg3 = (size_t) (view2.len / sizeof(double));
+  }
+  {
+    Py_BEGIN_ALLOW_THREADS
+    ((FastLogicle const *)arg1)->scaleArray(arg2,arg3);
+    Py_END_ALLOW_THREADS
+  }
+  resultobj = SWIG_Py_Void();
+  {
+    if (view2.obj) {
+      PyBuffer_Release(&view2);
+    }
+  }
+  return resultobj;
+fail:
+  {
+    if (view2.obj) {
+      PyBuffer_Release(&view2);
+    }
+  }
+  return NULL;
+}
+
+
+SWIGINTERN PyObject *_wrap_FastLogicle_inverseArray(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
+  PyObject *resultobj = 0;
+  FastLogicle *arg1 = (FastLogicle *) 0 ;
+  double *arg2 = (double *) 0 ;
+  size_t arg3 ;
+  void *argp1 = 0 ;
+  int res1 = 0 ;
+  Py_buffer view2 ;
+  PyObject * obj0 = 0 ;
+  PyObject * obj1 = 0 ;
+  
+  view2.obj = NULL;
+  if (!PyArg_ParseTuple(args,(char *)"OO:FastLogicle_inverseArray",&obj0,&obj1)) SWIG_fail;
+  res1 = SWIG_ConvertPtr(obj0, &argp1,SWIGTYPE_p_FastLogicle, 0 |  0 );
+  if (!SWIG_IsOK(res1)) {
+    SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "FastLogicle_inverseArray" "', argument " "1"" of type '" "FastLogicle const *""'"); 
+  }
+  arg1 = reinterpret_cast< FastLogicle * >(argp1);
+  {
+    view2.obj = NULL;
+    if (PyObject_GetBuffer(obj1, &view2, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) != 0) {
+      SWIG_fail;
+    }
+    if (view2.format == NULL || strcmp(view2.format, "d") != 0) {
+      PyErr_SetString(PyExc_TypeError, "Expected a contiguous buffer of doubles");
+      SWIG_fail;
+    }
+    arg2 = (double *) view2.buf;
+    arg3 = (size_t) (view2.len / sizeof(double));
+  }
+  {
+    Py_BEGIN_ALLOW_THREADS
+    ((FastLogicle const *)arg1)->inverseArray(arg2,arg3);
+    Py_END_ALLOW_THREADS
+  }
+  resultobj = SWIG_Py_Void();
+  {
+    if (view2.obj) {
+      PyBuffer_Release(&view2);
+    }
+  }
+  return resultobj;
+fail:
+  {
+    if (view2.obj) {
+      PyBuffer_Release(&view2);
+    }
+  }
+  return NULL;
+}
+
+
 SWIGINTERN PyObject *_wrap_FastLogicle_inverse__SWIG_1(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
   PyObject *resultobj = 0;
   FastLogicle *arg1 = (FastLogicle *) 0 ;
@@ -4624,6 +4729,8 @@ static PyMethodDef SwigMethods[] = {
 	 { (char *)"FastLogicle_bins", _wrap_FastLogicle_bins, METH_VARARGS, NULL},
 	 { (char *)"FastLogicle_intScale", _wrap_FastLogicle_intScale, METH_VARARGS, NULL},
 	 { (char *)"FastLogicle_inverse", _wrap_FastLogicle_inverse, METH_VARARGS, NULL},
+	 { (char *)"FastLogicle_scaleArray", _wrap_FastLogicle_scaleArray, METH_VARARGS, NULL},
+	 { (char *)"FastLogicle_inverseArray", _wrap_FastLogicle_inverseArray, METH_VARARGS, NULL},
 	 { (char *)"FastLogicle_swigregister", FastLogicle_swigregister, METH_VARARGS, NULL},
 	 { NULL, NULL, 0, NULL }
 };
@@ -6,6 +6,7 @@
 
 #ifdef __cplusplus
 #include <vector>
+#include <cstddef>
 
 extern "C" {
 
@@ -181,6 +182,9 @@ public:
         int intScale (double value) const;
         double inverse (int scale) const;
 
+        void scaleArray (double * values, size_t n) const;
+        void inverseArray (double * scales, size_t n) const;
+
 private:
         void initialize (int bins);
 
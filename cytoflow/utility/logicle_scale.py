@@ -40,7 +40,7 @@ import matplotlib.colors
 
 from .scale import IScale, register_scale
 from .logicle_ext.Logicle import FastLogicle
-from .util_functions import is_numeric
+from .util_functions import is_numeric, _single_if
 from .cytoflow_errors import CytoflowError, CytoflowWarning
 
 @provides(IScale)
@@ -148,12 +148,11 @@ class LogicleScale(HasStrictTraits):
             logicle_min = self._logicle.inverse(0.0)
             logicle_max = self._logicle.inverse(1.0 - sys.float_info.epsilon)
             if isinstance(data, pd.Series):            
-                data = data.clip(logicle_min, logicle_max)
-                return data.apply(self._logicle.scale)
+                return pd.Series(_logicle_scale(self._logicle, data.values),
+                                 index = data.index,
+                                 name = data.name)
             elif isinstance(data, np.ndarray):
-                data = np.clip(data, logicle_min, logicle_max)
-                scale = np.vectorize(self._logicle.scale)
-                return scale(data)
+                return _logicle_scale(self._logicle, data)
             elif isinstance(data, float):
                 data = max(min(data, logicle_max), logicle_min)
                 return self._logicle.scale(data)
@@ -163,8 +162,8 @@ class LogicleScale(HasStrictTraits):
                 return self._logicle.scale(data)
             else:
                 try:
-                    return list(map(self._logicle.scale, data))
-                except TypeError as e:
+                    return _logicle_scale(self._logicle, list(data)).tolist()
+                except (TypeError, ValueError) as e:
                     raise CytoflowError("Unknown data type") from e
         except ValueError as e:
             raise CytoflowError(e.strerror)
@@ -176,12 +175,11 @@ class LogicleScale(HasStrictTraits):
         """
         try:
             if isinstance(data, pd.Series):            
-                data = data.clip(0, 1.0 - sys.float_info.epsilon)
-                return data.apply(self._logicle.inverse)
+                return pd.Series(_logicle_inverse(self._logicle, data.values),
+                                 index = data.index,
+                                 name = data.name)
             elif isinstance(data, np.ndarray):
-                data = np.clip(data, 0, 1.0 - sys.float_info.epsilon)
-                inverse = np.vectorize(self._logicle.inverse)
-                return inverse(data)
+                return _logicle_inverse(self._logicle, data)
             elif isinstance(data, float):
                 data = max(min(data, 1.0 - sys.float_info.epsilon), 0.0)
                 return self._logicle.inverse(data)
@@ -191,8 +189,8 @@ class LogicleScale(HasStrictTraits):
                 return self._logicle.inverse(data)
             else:
                 try:
-                    return list(map(self._logicle.inverse, data))
-                except TypeError as e:
+                    return _logicle_inverse(self._logicle, list(data)).tolist()
+                except (TypeError, ValueError) as e:
                     raise CytoflowError("Unknown data type") from e
         except ValueError as e:
             raise CytoflowError(str(e))
@@ -340,6 +338,36 @@ class LogicleScale(HasStrictTraits):
         return {"logicle" : self._logicle} 
     
 register_scale(LogicleScale)
+
+
+def _logicle_scale(logicle, data):
+    """
+    Clip `data` to the domain of `logicle`, then transform all of it at once
+    with :meth:`FastLogicle.scaleArray`.  Returns a new float64 array with the 
+    same shape as `data` -- or a float32 array, if `data` is float32.
+    """
+    
+    logicle_min = logicle.inverse(0.0)
+    logicle_max = logicle.inverse(1.0 - sys.float_info.epsilon)
+    
+    ret = np.array(data, dtype = np.float64, order = 'C', copy = True)
+    np.clip(ret, logicle_min, logicle_max, out = ret)
+    logicle.scaleArray(ret)
+    return _single_if(ret, data)
+
+
+def _logicle_inverse(logicle, data):
+    """
+    Clip `data` to [0, 1), then transform all of it at once with 
+    :meth:`FastLogicle.inverseArray`.  Returns a new float64 array with the 
+    same shape as `data` -- or a float32 array, if `data` is float32.
+    """
+    
+    ret = np.array(data, dtype = np.float64, order = 'C', copy = True)
+    np.clip(ret, 0.0, 1.0 - sys.float_info.epsilon, out = ret)
+    logicle.inverseArray(ret)
+    return _single_if(ret, data)
+
         
 class MatplotlibLogicleScale(HasTraits, matplotlib.scale.ScaleBase):   
     name = "logicle"
@@ -402,12 +430,11 @@ class MatplotlibLogicleScale(HasTraits, matplotlib.scale.ScaleBase):
                 logicle_min = self.logicle.inverse(0.0)
                 logicle_max = self.logicle.inverse(1.0 - sys.float_info.epsilon)
                 if isinstance(values, pd.Series):            
-                    values = values.clip(logicle_min, logicle_max)
-                    return values.apply(self.logicle.scale)
+                    return pd.Series(_logicle_scale(self.logicle, values.values),
+                                     index = values.index,
+                                     name = values.name)
                 elif isinstance(values, np.ndarray):
-                    values = np.clip(values, logicle_min, logicle_max)
-                    scale = np.vectorize(self.logicle.scale)
-                    return scale(values)
+                    return _logicle_scale(self.logicle, values)
                 elif isinstance(values, float):
                     data = max(min(values, logicle_max), logicle_min)
                     return self.logicle.scale(data)
@@ -441,12 +468,11 @@ class MatplotlibLogicleScale(HasTraits, matplotlib.scale.ScaleBase):
         def transform_non_affine(self, values):
             try:
                 if isinstance(values, pd.Series):            
-                    values = values.clip(0, 1.0 - sys.float_info.epsilon)
-                    return values.apply(self.logicle.inverse)
+                    return pd.Series(_logicle_inverse(self.logicle, values.values),
+                                     index = values.index,
+                                     name = values.name)
                 elif isinstance(values, np.ndarray):
-                    values = np.clip(values, 0, 1.0 - sys.float_info.epsilon)
-                    inverse = np.vectorize(self.logicle.inverse)
-                    return inverse(values)
+                    return _logicle_inverse(self.logicle, values)
                 elif isinstance(values, float):
                     values = max(min(values, 1.0 - sys.float_info.epsilon), 0.0)
                     return self.logicle.inverse(values)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3.4
+# coding: latin-1
+
+# (c) Massachusetts Institute of Technology 2015-2018
+# (c) Brian Teague 2018-2019
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+cytoflow.utility.parallel
+-------------------------
+
+Run independent pieces of work (parsing tubes, fitting a model to each 
+subset, etc.) in a pool of worker threads or processes.
+'''
+
+import os, itertools, tempfile
+import concurrent.futures
+
+import numpy as np
+
+from .cytoflow_errors import CytoflowError
+
+_workers_default = 1
+_executor_default = "thread"
+
+def set_default_workers(workers, executor = None):
+    """
+    Set the default number of workers that operations use when they are not
+    told how many to use.
+    
+    Parameters
+    ----------
+    workers : Int
+        The number of workers.  ``1`` runs everything serially in the calling
+        thread (the default); ``0`` uses one worker per CPU.
+        
+    executor : {"thread", "process"} (default = None)
+        If set, the default kind of pool.  Processes avoid the GIL but must
+        pickle their arguments and results; threads share memory but only run 
+        in parallel when the work releases the GIL (as :mod:`numpy` usually 
+        does.)  
+    """
+    
+    global _workers_default, _executor_default
+    
+    if workers is None or workers < 0:
+        raise CytoflowError("workers must be >= 0")
+    
+    if executor is not None:
+        if executor not in ("thread", "process"):
+            raise CytoflowError("executor must be 'thread' or 'process'")
+        _executor_default = executor
+    
+    _workers_default = workers
+    
+def get_default_workers():
+    return _workers_default
+
+def get_default_executor():
+    return _executor_default
+
+def num_workers(workers = None):
+    """
+    Resolve a ``workers`` setting to an actual number of workers: ``None`` 
+    means the default from :func:`set_default_workers`, and ``0`` means one 
+    per CPU.
+    """
+    
+    if workers is None:
+        workers = _workers_default
+        
+    if workers == 0:
+        workers = os.cpu_count() or 1
+        
+    return workers
+
+def parallel_map(fn, *iterables, workers = None, executor = None):
+    """
+    Like :func:`map`, but calls ``fn`` in a pool of workers.
+    
+    The results are returned as a list in the same order as the arguments,
+    no matter which order the workers finish in.  If any of the calls raises an
+    exception, the exception from the *first* failing call (in argument order) 
+    is re-raised, so errors are deterministic too.
+    
+    Parameters
+    ----------
+    fn : callable
+        The function to call.  If ``executor`` is ``process``, it must be 
+        picklable (ie, a module-level function), as must its arguments and 
+        return values.
+        
+    *iterables : iterables
+        The arguments to ``fn``, as for :func:`map`
+        
+    workers : Int (default = None)
+        How many workers to use.  If ``None``, use the default from
+        :func:`set_default_workers`.  If ``0``, use one per CPU.  If ``1``,
+        don't start a pool at all: just call ``fn`` in this thread.
+        
+    executor : {"thread", "process"} (default = None)
+        What kind of pool to use.  If ``None``, use the default from
+        :func:`set_default_workers`.
+        
+    Returns
+    -------
+    List
+        The return values of ``fn``.
+    """
+    
+    args = list(zip(*iterables))
+    workers = min(num_workers(workers), len(args))
+    
+    if workers <= 1:
+        return [fn(*a) for a in args]
+    
+    if executor is None:
+        executor = _executor_default
+        
+    if executor == "thread":
+        pool_class = concurrent.futures.ThreadPoolExecutor
+    elif executor == "process":
+        pool_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        raise CytoflowError("executor must be 'thread' or 'process'")
+    
+    with pool_class(max_workers = workers) as pool:
+        futures = [pool.submit(fn, *a) for a in args]
+        try:
+            return [f.result() for f in futures]
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+
+def parallel_map_arrays(fn, arrays, *iterables, workers = None, executor = None):
+    """
+    Like :func:`parallel_map`, but the first argument of each call is a 
+    (large) :class:`numpy.ndarray` -- for example, the events in one group of 
+    an :class:`.Experiment`, to fit a model to.  Instead of pickling each 
+    array to send it to a worker process, it's saved in a temporary file that
+    the worker memory-maps (copy-on-write), so the array's memory is shared 
+    with the worker instead of copied through a pipe.  Threads (or a single 
+    worker) just get the arrays.
+    
+    Parameters
+    ----------
+    fn : callable
+        The function to call, as ``fn(array, *args)``.  If ``executor`` is 
+        ``process``, it must be picklable (ie, a module-level function), as 
+        must the rest of its arguments and its return values.
+        
+    arrays : iterable of numpy.ndarray
+        The first argument to each call of ``fn``.
+        
+    *iterables : iterables
+        The rest of the arguments to ``fn``, as for :func:`map`
+        
+    workers : Int (default = None)
+        How many arrays to work on at once.  The operations that fit a model
+        to each group of events (in their ``by`` attribute) pass their own
+        ``workers`` attribute here, so it's how many groups they fit at once.
+        If ``None``, use the default from :func:`set_default_workers` (which 
+        is ``1``, ie one after another, unless you change it.)  If ``0``, use 
+        one worker per CPU.
+        
+    executor : {"thread", "process"} (default = None)
+        What kind of pool to use; see :func:`parallel_map`.
+        
+    Returns
+    -------
+    List
+        The return values of ``fn``, in the same order as ``arrays``.
+    """
+    
+    arrays = list(arrays)
+    
+    if executor is None:
+        executor = _executor_default
+        
+    if executor != "process" or min(num_workers(workers), len(arrays)) <= 1:
+        return parallel_map(fn, arrays, *iterables, 
+                            workers = workers, 
+                            executor = executor)
+        
+    with tempfile.TemporaryDirectory(prefix = "cytoflow-") as tmp:
+        paths = []
+        for i, array in enumerate(arrays):
+            path = os.path.join(tmp, "{}.npy".format(i))
+            np.save(path, np.ascontiguousarray(array))
+            paths.append(path)
+            
+        return parallel_map(_call_mapped, 
+                            itertools.repeat(fn), 
+                            paths, 
+                            *iterables,
+                            workers = workers,
+                            executor = executor)
+        
+def _call_mapped(fn, path, *args):
+    """Map the array in ``path``, then call ``fn`` on it"""
+    
+    try:
+        array = np.load(path, mmap_mode = 'c')
+    except ValueError:
+        # you can't map zero bytes
+        array = np.load(path)
+        
+    return fn(array, *args)
@@ -30,6 +30,8 @@ import numpy as np
 import pandas as pd
 from scipy import stats
 
+from .cytoflow_errors import CytoflowOpError
+
 def iqr(a):
     """
     Calculate the inter-quartile range for an array of numbers.
@@ -335,3 +337,74 @@ def cov2corr(covariance):
     correlation = covariance / M
 
     return sigma, correlation
+
+def _single_if(ret, data):
+    """
+    Return ``ret`` as single-precision if ``data`` is, for computations (like
+    the scales') that need to work in double precision but should keep 
+    single-precision channels (see :attr:`.Experiment.channel_dtype`) 
+    single-precision.
+    """
+    
+    if getattr(data, 'dtype', None) == np.float32:
+        return ret.astype(np.float32)
+    return ret
+
+def sample_events(data, sample_size = None, sample_fraction = None, seed = 0):
+    """
+    Choose a random sample of the events in ``data`` to estimate a model 
+    from.  Used by operations with ``sample_size`` and ``sample_fraction``
+    attributes; the same ``seed`` always chooses the same events.
+    
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        The events to sample, usually one group of an :class:`.Experiment`.
+        
+    sample_size : Int (default = None)
+        Choose at most this many events.
+        
+    sample_fraction : Float (default = None)
+        Choose this fraction of the events, rounded to the nearest event
+        (but at least one.)
+        
+    seed : Int (default = 0)
+        The seed for the random number generator.
+        
+    Returns
+    -------
+    pandas.DataFrame
+        The sampled events, in their original order.  If neither 
+        ``sample_size`` nor ``sample_fraction`` is set, or if they would 
+        choose every event, returns ``data``.
+        
+    Raises
+    ------
+    CytoflowOpError
+        If both ``sample_size`` and ``sample_fraction`` are set, or if
+        either is out of range.
+    """
+    
+    if sample_size is not None and sample_fraction is not None:
+        raise CytoflowOpError('sample_fraction',
+                              "Can't set both sample_size and sample_fraction")
+        
+    if sample_size is not None:
+        if sample_size <= 0:
+            raise CytoflowOpError('sample_size',
+                                  "sample_size must be > 0")
+        n = sample_size
+    elif sample_fraction is not None:
+        if not 0.0 < sample_fraction <= 1.0:
+            raise CytoflowOpError('sample_fraction',
+                                  "sample_fraction must be in (0, 1]")
+        n = max(int(round(sample_fraction * len(data))), 1)
+    else:
+        return data
+    
+    if n >= len(data):
+        return data
+    
+    rng = np.random.RandomState(seed)
+    rows = np.sort(rng.choice(len(data), n, replace = False))
+    return data.iloc[rows]
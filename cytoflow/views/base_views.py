@@ -450,7 +450,7 @@ class Base1DView(BaseDataView):
             raise util.CytoflowViewError('channel',
                                          "Must specify a channel")
         
-        if self.channel not in experiment.data:
+        if self.channel not in experiment:
             raise util.CytoflowViewError('channel',
                                          "Channel {0} not in the experiment"
                                          .format(self.channel))
@@ -505,7 +505,7 @@ class Base2DView(BaseDataView):
             raise util.CytoflowViewError('xchannel',
                                          "Must specify an xchannel")
         
-        if self.xchannel not in experiment.data:
+        if self.xchannel not in experiment:
             raise util.CytoflowViewError('xchannel',
                                          "Channel {} not in the experiment"
                                     .format(self.xchannel))
@@ -514,7 +514,7 @@ class Base2DView(BaseDataView):
             raise util.CytoflowViewError('ychannel',
                                          "Must specify a ychannel")
         
-        if self.ychannel not in experiment.data:
+        if self.ychannel not in experiment:
             raise util.CytoflowViewError('ychannel',
                                          "Channel {} not in the experiment"
                                     .format(self.ychannel))
@@ -573,7 +573,7 @@ class BaseNDView(BaseDataView):
                                        "Must set at least one channel")
 
         for c in self.channels:
-            if c not in experiment.data:
+            if c not in experiment:
                 raise util.CytoflowOpError('channels',
                                            "Channel {0} not found in the experiment"
                                       .format(c))
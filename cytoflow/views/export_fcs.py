@@ -147,14 +147,14 @@ class ExportFCS(HasStrictTraits):
                 self._include_by = _include_by
                 
                 if by:
-                    self._iter = experiment.data.groupby(by).__iter__()
+                    self._iter = iter(experiment.groupby(by).keys)
                 
             def __iter__(self):
                 return self
             
             def __next__(self):
                 if self._iter:
-                    values = next(self._iter)[0]
+                    values = next(self._iter)
                     
                     if len(self.by) == 1:
                         values = [values]
@@ -229,7 +229,7 @@ class ExportFCS(HasStrictTraits):
                                              "Subset string '{0}' returned no events"
                                              .format(self.subset))
             
-        tube0, common_metadata = list(experiment.metadata['fcs_metadata'].items())[0]
+        tube0, common_metadata = list(experiment.metadata.peek('fcs_metadata').items())[0]
         common_metadata = copy(common_metadata)
         
         exclude_keywords = ['$BEGINSTEXT', '$ENDSTEXT', '$BEGINANALYSIS', 
@@ -240,7 +240,7 @@ class ExportFCS(HasStrictTraits):
                            if re.search('^\$P\d+[BENRDSG]$', k) is None
                            and k not in exclude_keywords}
         
-        for filename, metadata in experiment.metadata['fcs_metadata'].items():
+        for filename, metadata in experiment.metadata.peek('fcs_metadata').items():
             if filename == tube0:
                 continue
             for name, value in metadata.items():
@@ -256,7 +256,7 @@ class ExportFCS(HasStrictTraits):
                 common_metadata['$P{}V'.format(i + 1)] = experiment.metadata[channel]['voltage']
             
         
-        for group, data_subset in experiment.data.groupby(self.by):
+        for group, data_subset in experiment.groupby(self.by):
             data_subset = data_subset[experiment.channels]
             
             if len(self.by) == 1:
@@ -231,9 +231,10 @@ class FlowPeaksPluginOp(PluginOpMixin, FlowPeaksOp):
     
     def clear_estimate(self):
         self._kmeans.clear()
-        self._normals.clear()
+        self._means.clear()
         self._density.clear()
         self._peaks.clear()
+        self._peak_clusters.clear()
         self._cluster_peak.clear()
         self._cluster_group.clear()
         self._scale.clear()